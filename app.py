@@ -1,14 +1,30 @@
-import os, re, tempfile, shutil, subprocess, uuid, threading, time, zipfile
+import os, re, json, tempfile, shutil, subprocess, uuid, time
 from flask import Flask, request, send_file, Response, jsonify
 from flask_cors import CORS
-from io import BytesIO
 from pyngrok import ngrok
-from src.run_model import process_audio
+from src.run_model import process_audio, warmup_separation
 from src.progress_tracker import progress_tracker
+from src.job_scheduler import job_scheduler, QueueFullError
+from src.job_queue import get_job_queue, JOB_BACKEND
+from src.model import midi_generator as midi_gen
+from src.utils.result_cache import result_cache
+from src.model.activation_cache import activation_cache
+from src.utils.render_service import render_service
+from src.utils.verovio_renderer import verovio_renderer
 
 app = Flask(__name__)
 CORS(app)
 
+# With the 'sqlite' backend jobs run in separate `src/worker.py` processes
+if JOB_BACKEND == 'sqlite':
+    job_backend = get_job_queue()
+    progress_tracker.attach_store(job_backend)
+else:
+    job_backend = job_scheduler
+
+# Expire abandoned and finished sessions together with their files
+progress_tracker.start_reaper()
+
 @app.after_request
 def add_ngrok_header(response):
     response.headers['ngrok-skip-browser-warning'] = 'true'
@@ -22,6 +38,12 @@ def convert():
 
     if not file and not youtube_url:
         return {'error': 'No file uploaded or YouTube link provided'}, 400
+    if format not in ('midi', 'pdf', 'both'):
+        return {'error': "Format must be 'midi', 'pdf' or 'both'"}, 400
+
+    # Reject early instead of saving or downloading audio that cannot be queued
+    if job_backend.is_full():
+        return queue_full_response(job_backend.retry_after())
 
     # Generate unique session ID for progress tracking
     session_id = str(uuid.uuid4())
@@ -47,113 +69,195 @@ def convert():
         except subprocess.CalledProcessError as e:
             return {'error': f'Failed to download from YouTube: {e}'}, 500
 
-    def process_in_background():
-        try:
-            process_audio(input_path, output_dir, format, session_id, original_filename)
-        except Exception as e:
-            progress_tracker.error_session(session_id, str(e))
-        finally:
-            pass  # Cleanup is handled later
-
-    # Start background thread
-    thread = threading.Thread(target=process_in_background)
-    thread.start()
+    try:
+        if JOB_BACKEND == 'sqlite':
+            queue_position = job_backend.enqueue(session_id, {
+                'input_path': input_path,
+                'output_dir': output_dir,
+                'format': format,
+                'original_filename': original_filename,
+            })
+        else:
+            queue_position = job_backend.submit(
+                session_id, process_audio, input_path, output_dir, format, session_id, original_filename
+            )
+            # Known before the job starts, so the files of abandoned jobs are expired too
+            progress_tracker.set_session_info(session_id, output_dir=output_dir, input_path=input_path)
+    except QueueFullError as e:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        if file:
+            os.remove(input_path)
+        return queue_full_response(e.retry_after)
 
     return jsonify({
         'session_id': session_id,
-        'status': 'processing_started'
+        'status': 'queued',
+        'queue_position': queue_position
     })
 
+def queue_full_response(retry_after: int):
+    """429 response telling the client when to retry"""
+    response = jsonify({'error': 'Server is busy, please retry later', 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.route('/sessions/stats')
+def session_stats():
+    """Live session count, expiry/eviction counters and job timings"""
+    stats = progress_tracker.eviction_stats()
+    stats['timings'] = progress_tracker.timing_stats()
+    return jsonify(stats)
+
+@app.route('/queue/stats')
+def queue_stats():
+    """Current load of the job queue and of the score renderer"""
+    stats = job_backend.stats()
+    stats['render'] = render_service.stats()
+    stats['verovio'] = verovio_renderer.timing_stats()
+    return jsonify(stats)
+
 @app.route('/progress/<session_id>')
 def get_progress(session_id):
-    """Server-Sent Events endpoint for progress updates"""
+    """Server-Sent Events endpoint for progress updates, only changed fields are sent"""
     def generate():
+        sent = {}
+        version = None
         while True:
-            progress_data = progress_tracker.get_progress(session_id)
+            progress_data = progress_tracker.wait_for_change(session_id, version, timeout=15)
             if progress_data is None:
-                yield f"data: {{'error': 'Session not found'}}\n\n"
+                yield f"data: {json.dumps({'error': 'Session not found'})}\n\n"
                 break
-            
-            import json
-            yield f"data: {json.dumps(progress_data)}\n\n"
+
+            if progress_data.get('version') == version:
+                # Nothing changed, keep the connection alive
+                yield ": keep-alive\n\n"
+                continue
+            version = progress_data.get('version')
+
+            changed = {k: v for k, v in progress_data.items() if k not in sent or sent[k] != v}
+            sent = dict(progress_data)
+            yield f"data: {json.dumps(changed)}\n\n"
             
             if progress_data['status'] in ['completed', 'error']:
                 break
-                
-            time.sleep(1)  # Update every second
     
     return Response(generate(), mimetype='text/event-stream')
 
 @app.route('/download/<session_id>')
 def download_result(session_id):
-    """Download the converted file"""
+    """Download the converted file, streamed from disk with Range and ETag support"""
     progress_data = progress_tracker.get_progress(session_id)
     
     if not progress_data or progress_data['status'] != 'completed':
         return {'error': 'File not ready or session not found'}, 404
     
-    output_dir = progress_data.get('output_dir')
-    format_type = progress_data.get('format')
-    original_filename = progress_data.get('original_filename', 'converted')
-    
-    if not output_dir:
-        return {'error': 'Output directory not found'}, 404
-    
-    if format_type == 'both':
-        # Create a zip file containing both MIDI and PDF
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Add combined.mid file (renamed to original_filename.mid)
-            midi_dir = os.path.join(output_dir, 'midi')
-            combined_midi_path = os.path.join(midi_dir, 'combined.mid')
-            if os.path.exists(combined_midi_path):
-                zip_file.write(combined_midi_path, f'{original_filename}.mid')
-            
-            # Add score.pdf file (renamed to original_filename.pdf)
-            score_dir = os.path.join(output_dir, 'score')
-            score_pdf_path = os.path.join(score_dir, 'score.pdf')
-            if os.path.exists(score_pdf_path):
-                zip_file.write(score_pdf_path, f'{original_filename}.pdf')
-        
-        zip_buffer.seek(0)
-        
-        # Cleanup
-        progress_tracker.cleanup_session(session_id)
-        shutil.rmtree(output_dir, ignore_errors=True)
-        
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=f"{original_filename}.zip",
-            mimetype='application/zip'
-        )
-    
-    else:
-        # Original logic for single format
-        for format_check, ext, subdir in [('midi', 'mid', 'midi'), ('pdf', 'pdf', 'score')]:
-            if format_type == format_check:
-                search_dir = os.path.join(output_dir, subdir)
-                if os.path.exists(search_dir):
-                    output_files = [f for f in os.listdir(search_dir) if f.endswith(f".{ext}")]
-                    if output_files:
-                        output_path = os.path.join(search_dir, output_files[0])
-                        
-                        with open(output_path, 'rb') as f:
-                            file_data = BytesIO(f.read())
-                        
-                        # Cleanup
-                        progress_tracker.cleanup_session(session_id)
-                        shutil.rmtree(output_dir, ignore_errors=True)
-                        
-                        return send_file(
-                            file_data,
-                            as_attachment=True,
-                            download_name=f"{original_filename}.{ext}",
-                            mimetype='application/octet-stream'
-                        )
+    download_path = progress_data.get('download_path')
+    if not download_path or not os.path.exists(download_path):
+        return {'error': 'No output file found'}, 404
     
-    return {'error': 'No output file found'}, 500
+    # Files are kept for resumed downloads and retries, the session reaper removes them
+    return send_file(
+        download_path,
+        as_attachment=True,
+        download_name=progress_data.get('download_name', os.path.basename(download_path)),
+        mimetype='application/zip' if download_path.endswith('.zip') else 'application/octet-stream',
+        conditional=True,
+        etag=True,
+    )
+
+@app.route('/artifacts/<session_id>')
+def list_artifacts(session_id):
+    """List the result files published so far, available while the job is still running"""
+    progress_data = progress_tracker.get_progress(session_id)
+    if not progress_data:
+        return {'error': 'Session not found'}, 404
+
+    return jsonify({
+        'status': progress_data['status'],
+        'first_result_seconds': progress_data.get('first_result_seconds'),
+        'artifacts': [
+            {
+                'name': artifact['name'],
+                'size': artifact['size'],
+                'url': f"/artifacts/{session_id}/{artifact['name']}",
+            }
+            for artifact in progress_data.get('artifacts', [])
+        ],
+    })
+
+@app.route('/artifacts/<session_id>/<name>')
+def download_artifact(session_id, name):
+    """Download a single published result file"""
+    progress_data = progress_tracker.get_progress(session_id)
+    if not progress_data:
+        return {'error': 'Session not found'}, 404
+
+    # Only files published through the progress tracker are served
+    for artifact in progress_data.get('artifacts', []):
+        if artifact['name'] == name and os.path.exists(artifact['path']):
+            original_filename = progress_data.get('original_filename', 'converted')
+            return send_file(
+                artifact['path'],
+                as_attachment=True,
+                download_name=f"{original_filename}_{name}",
+                mimetype='application/octet-stream',
+                conditional=True,
+                etag=True,
+            )
+    return {'error': 'Artifact not found'}, 404
+
+def _score_musicxml(session_id):
+    # score.musicxml is written before the PDF, so pages can be shown while the PDF is rendered
+    progress_data = progress_tracker.get_progress(session_id)
+    if not progress_data or not progress_data.get('output_dir'):
+        return None
+    musicxml_path = os.path.join(progress_data['output_dir'], 'score', 'score.musicxml')
+    return musicxml_path if os.path.exists(musicxml_path) else None
+
+def _score_error(e):
+    # The score can expire between the lookup and the load, a broken one is worth a retry
+    if isinstance(e, OSError):
+        return {'error': 'Score not ready or session not found'}, 404
+    return {'error': f'Score could not be loaded: {e}'}, 503
+
+@app.route('/score/<session_id>/pages')
+def score_pages(session_id):
+    """Number of score pages, available as soon as the MusicXML is written"""
+    if not verovio_renderer.is_available():
+        return {'error': 'Page rendering is not available'}, 501
+    musicxml_path = _score_musicxml(session_id)
+    if musicxml_path is None:
+        return {'error': 'Score not ready or session not found'}, 404
+    try:
+        pages = verovio_renderer.page_count(musicxml_path)
+    except (OSError, RuntimeError) as e:
+        return _score_error(e)
+    return jsonify({'pages': pages})
+
+@app.route('/score/<session_id>/page/<int:page>')
+def score_page(session_id, page):
+    """Render a single score page to SVG on demand"""
+    if not verovio_renderer.is_available():
+        return {'error': 'Page rendering is not available'}, 501
+    musicxml_path = _score_musicxml(session_id)
+    if musicxml_path is None:
+        return {'error': 'Score not ready or session not found'}, 404
+    try:
+        svg = verovio_renderer.render_page(musicxml_path, page)
+    except ValueError as e:
+        return {'error': str(e)}, 404
+    except (OSError, RuntimeError) as e:
+        return _score_error(e)
+    return Response(svg, mimetype='image/svg+xml')
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Hit/miss counters of the result and activation caches"""
+    return jsonify({
+        'results': result_cache.stats(),
+        'activations': activation_cache.stats(),
+    })
 
 @app.route('/')
 def index():
@@ -179,4 +283,9 @@ if __name__ == '__main__':
     with open(js_path, 'w', encoding='utf-8') as f:
         f.write(new_js_content)
 
+    # Load the transcription model before the first request arrives
+    midi_gen.warmup_model()
+    print(f" * basic-pitch model ready: {midi_gen.get_inference_stats()}")
+    warmup_separation()
+
     app.run(port=5000)
@@ -0,0 +1,182 @@
+# Adds the project root to the path
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import time
+import tempfile
+import argparse
+
+import numpy as np
+
+
+def timed(fn, *args, **kwargs):
+    """Call `fn` and return its result with the seconds it took"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def random_note_arrays(n_notes: int, n_parts: int = 1, seed: int = 0) -> list[np.ndarray]:
+    """(n, 4) arrays of random notes with start, end, pitch and velocity, one per part"""
+    rng = np.random.default_rng(seed)
+    note_arrays = []
+    for _ in range(n_parts):
+        starts = np.sort(rng.uniform(0, n_notes / 4, n_notes))
+        note_arrays.append(np.column_stack([
+            starts, starts + rng.uniform(0.05, 1.5, n_notes),
+            rng.integers(36, 90, n_notes), rng.integers(40, 110, n_notes),
+        ]))
+    return note_arrays
+
+
+def random_note_dicts(n_notes: int, seed: int = 0) -> list[dict]:
+    """Random ground truth notes as dicts with pitch, start, end and velocity"""
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.uniform(0, n_notes / 8, n_notes))
+    return [
+        {'pitch': int(p), 'start': float(s), 'end': float(s + d), 'velocity': 80}
+        for p, s, d in zip(rng.integers(40, 80, n_notes), starts, rng.uniform(0.1, 1.0, n_notes))
+    ]
+
+
+def jittered(notes: list[dict], offset: float = 0.0, onset_jitter: float = 0.03, offset_jitter: float = 0.05,
+             drop: float = 0.1, seed: int = 1) -> list[dict]:
+    """Predictions: the notes moved by -`offset`, with jittered onsets and offsets and a fraction dropped"""
+    rng = np.random.default_rng(seed)
+    return [
+        {**note, 'start': note['start'] - offset + rng.normal(0, onset_jitter),
+         'end': note['end'] - offset + rng.normal(0, offset_jitter)}
+        for note in notes if rng.random() > drop
+    ]
+
+
+def bench_matching(args):
+    """One-to-one note matcher against the nested-loop F1"""
+    from src.utils import evaluation
+    from src.utils.note_matching import match_f1
+
+    gt_notes = random_note_dicts(args.notes)
+    # Some notes dropped and some added a semitone off
+    pred_notes = jittered(gt_notes) + [dict(note, pitch=note['pitch'] + 1) for note in gt_notes[:args.notes // 10]]
+
+    naive, naive_seconds = timed(evaluation.f1_score_with_overlap_naive, pred_notes, gt_notes, min_overlap=0.25)
+    fast, fast_seconds = timed(match_f1, pred_notes, gt_notes, min_overlap=0.25)
+    print(f"Nested loop: {naive_seconds:.3f}s {naive}")
+    print(f"Matcher:     {fast_seconds:.3f}s {fast} ({naive_seconds / fast_seconds:.0f}x)")
+
+
+def bench_deviation(args):
+    """Single-pass deviation metrics against the per-metric loops"""
+    from src.utils import evaluation
+    from src.utils.deviation_metrics import deviation_metrics
+
+    gt_notes = random_note_dicts(args.notes)
+    pred_notes = jittered(gt_notes)
+
+    def loops():
+        return {
+            "pitch_deviation": evaluation.pitch_deviation(pred_notes, gt_notes),
+            "onset_deviation": evaluation.onset_deviation(pred_notes, gt_notes),
+            "duration_deviation": evaluation.duration_deviation(pred_notes, gt_notes),
+            "density_deviation": evaluation.density_deviation(pred_notes, gt_notes),
+        }
+
+    loop_result, loop_seconds = timed(loops)
+    single_pass, single_pass_seconds = timed(deviation_metrics, pred_notes, gt_notes)
+    print(f"Per-metric loops: {loop_seconds:.3f}s {loop_result}")
+    print(f"Single pass:      {single_pass_seconds:.3f}s {single_pass} ({loop_seconds / single_pass_seconds:.0f}x)")
+
+
+def bench_alignment(args):
+    """FFT alignment against a brute-force F1 sweep over all offsets"""
+    from src.utils.alignment import find_offset
+    from src.utils.note_matching import match_f1
+
+    gt_notes = random_note_dicts(args.notes)
+    pred_notes = jittered(gt_notes, offset=args.offset, onset_jitter=0.02, offset_jitter=0.04)
+
+    def sweep():
+        offsets = np.round(np.arange(-args.max_offset, args.max_offset + args.step / 2, args.step), 6)
+        f1 = [match_f1([{**n, 'start': n['start'] + o, 'end': n['end'] + o} for n in pred_notes], gt_notes)["f1_score"]
+              for o in offsets]
+        return offsets[int(np.argmax(f1))], max(f1)
+
+    (sweep_offset, sweep_f1), sweep_seconds = timed(sweep)
+    (offset, result), fft_seconds = timed(find_offset, pred_notes, gt_notes, args.max_offset, args.step)
+    print(f"Brute force: {sweep_seconds:.3f}s offset {sweep_offset:.2f} F1 {sweep_f1:.4f}")
+    print(f"FFT:         {fft_seconds:.3f}s offset {offset:.2f} F1 {result['f1_score']:.4f} "
+          f"({sweep_seconds / fft_seconds:.0f}x)")
+
+
+def bench_musicxml(args):
+    """NumPy MusicXML writer against music21"""
+    from src.data.musicxml_writer import write_musicxml
+
+    note_arrays = random_note_arrays(args.notes, args.parts)
+    names = [f"Part{i}" for i in range(args.parts)]
+    output_dir = tempfile.mkdtemp()
+
+    with open(os.path.join(output_dir, "fast.musicxml"), "w", encoding="utf-8") as f:
+        _, fast_seconds = timed(write_musicxml, f, note_arrays, names, "Benchmark")
+    print(f"NumPy writer: {fast_seconds:.3f}s")
+
+    if not args.skip_music21:
+        from music21 import stream
+        from src.data.postprocess import notes_to_part
+
+        def write_music21():
+            score = stream.Score([notes_to_part(notes, name) for notes, name in zip(note_arrays, names)])
+            score.write("musicxml", fp=os.path.join(output_dir, "music21.musicxml"))
+
+        _, music21_seconds = timed(write_music21)
+        print(f"music21: {music21_seconds:.3f}s ({music21_seconds / fast_seconds:.1f}x)")
+
+
+def bench_render(args):
+    """Verovio against MuseScore on one MusicXML score"""
+    from src.utils.render_service import render_service
+    from src.utils.verovio_renderer import verovio_renderer
+
+    os.makedirs(args.output, exist_ok=True)
+    _, seconds = timed(verovio_renderer.render_page, args.musicxml, 1)
+    print(f"Verovio first page (cold): {seconds:.3f}s")
+    verovio_renderer.render(args.musicxml, os.path.join(args.output, "verovio.pdf"))
+    print(f"Verovio: {verovio_renderer.timing_stats()}")
+
+    _, seconds = timed(render_service.render, args.musicxml, os.path.join(args.output, "musescore.pdf"))
+    print(f"MuseScore PDF: {seconds:.3f}s")
+    render_service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the fast code paths against the ones they replace.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="Compare Verovio and MuseScore rendering times for a MusicXML score")
+    render.add_argument("musicxml", type=str, help="Path to the MusicXML score")
+    render.add_argument("--output", type=str, default="output/render_benchmark")
+    render.set_defaults(run=bench_render)
+
+    musicxml = commands.add_parser("musicxml", help="Compare the NumPy MusicXML writer and music21 on random notes")
+    musicxml.add_argument("--notes", type=int, default=10000, help="Number of notes per part")
+    musicxml.add_argument("--parts", type=int, default=2)
+    musicxml.add_argument("--skip_music21", action="store_true")
+    musicxml.set_defaults(run=bench_musicxml)
+
+    matching = commands.add_parser("matching", help="Compare the note matcher and the nested-loop F1")
+    matching.add_argument("--notes", type=int, default=5000, help="Number of ground truth notes")
+    matching.set_defaults(run=bench_matching)
+
+    deviation = commands.add_parser("deviation", help="Compare the single-pass deviation metrics and the per-metric loops")
+    deviation.add_argument("--notes", type=int, default=5000, help="Number of ground truth notes")
+    deviation.set_defaults(run=bench_deviation)
+
+    alignment = commands.add_parser("alignment", help="Compare the FFT alignment and a brute-force F1 sweep")
+    alignment.add_argument("--notes", type=int, default=2000, help="Number of ground truth notes")
+    alignment.add_argument("--offset", type=float, default=0.73, help="True offset of the predictions in seconds")
+    alignment.add_argument("--max-offset", type=float, default=2.0)
+    alignment.add_argument("--step", type=float, default=0.01)
+    alignment.set_defaults(run=bench_alignment)
+
+    args = parser.parse_args()
+    args.run(args)
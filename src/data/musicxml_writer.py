@@ -0,0 +1,300 @@
+import numpy as np
+from typing import Optional, TextIO
+from xml.sax.saxutils import escape
+
+# Quantization grids in quarter notes, the same as music21's MIDI import (sixteenths and eighth triplets)
+QUANTIZE_DIVISORS = (4, 3)
+
+# MusicXML <divisions>: ticks per quarter note, fine enough for every grid in QUANTIZE_DIVISORS
+DIVISIONS = 12
+# 4/4 measures
+MEASURE_TICKS = 4 * DIVISIONS
+
+# Representable durations in ticks -> (type, dots, triplet), longest first
+NOTE_TYPES = [
+    (48, ("whole", 0, False)),
+    (36, ("half", 1, False)),
+    (24, ("half", 0, False)),
+    (18, ("quarter", 1, False)),
+    (12, ("quarter", 0, False)),
+    (9, ("eighth", 1, False)),
+    (8, ("quarter", 0, True)),
+    (6, ("eighth", 0, False)),
+    (4, ("eighth", 0, True)),
+    (3, ("16th", 0, False)),
+    (2, ("16th", 0, True)),
+    (1, ("32nd", 0, True)),
+]
+
+# Pitch spelling of the twelve pitch classes as music21 does it by default
+PITCH_SPELLING = [
+    ("C", 0), ("C", 1), ("D", 0), ("E", -1), ("E", 0), ("F", 0),
+    ("F", 1), ("G", 0), ("G", 1), ("A", 0), ("B", -1), ("B", 0),
+]
+
+
+def quantize(quarters: np.ndarray) -> np.ndarray:
+    """
+    Snap every value to the nearest point of any of the grids in QUANTIZE_DIVISORS.
+    """
+    candidates = np.stack([np.round(quarters * d) / d for d in QUANTIZE_DIVISORS])
+    best = np.argmin(np.abs(candidates - quarters), axis=0)
+    return candidates[best, np.arange(len(quarters))]
+
+
+def split_duration(ticks: int, position: Optional[int] = None) -> list[int]:
+    """
+    Split a duration into representable note values, e.g. 15 ticks -> [12, 3].
+
+    With the start `position`, durations off the sixteenth grid are split at beats
+    first, so triplet values never cross a beat and every beat of triplets forms one group.
+    """
+    if position is not None and (position % 3 or ticks % 3):
+        head = min(ticks, -position % DIVISIONS)
+        tail = (ticks - head) % DIVISIONS
+        return split_duration(head) + split_duration(ticks - head - tail) + split_duration(tail)
+    parts = []
+    for value, _ in NOTE_TYPES:
+        while ticks >= value:
+            parts.append(value)
+            ticks -= value
+    return parts
+
+
+def quantize_notes(notes: np.ndarray, bpm: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Quantize note starts and ends to ticks.
+
+    Args:
+        notes (np.ndarray): Array of shape (n, 4) with start and end in seconds, MIDI pitch and velocity.
+        bpm (float): Tempo used to convert seconds to quarter notes.
+
+    Returns:
+        tuple: Start ticks, end ticks and pitches, sorted by quantized start, end and pitch,
+            so the notes of a chord are adjacent. Every note lasts at least a sixteenth,
+            notes that quantize to the same pitch, start and end are kept once.
+    """
+    starts = np.rint(quantize(notes[:, 0] * bpm / 60) * DIVISIONS).astype(np.int64)
+    ends = np.rint(quantize(notes[:, 1] * bpm / 60) * DIVISIONS).astype(np.int64)
+    ends = np.maximum(ends, starts + DIVISIONS // QUANTIZE_DIVISORS[0])
+    pitches = notes[:, 2].astype(np.int64)
+
+    order = np.lexsort((pitches, ends, starts))
+    starts, ends, pitches = starts[order], ends[order], pitches[order]
+    keep = np.r_[True, (np.diff(starts) != 0) | (np.diff(ends) != 0) | (np.diff(pitches) != 0)]
+    return starts[keep], ends[keep], pitches[keep]
+
+
+def assign_voices(starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Group notes into chords and chords into voices that do not overlap.
+
+    Notes with equal start and end form a chord. Every chord goes into the first
+    voice that is free at its start.
+
+    Returns:
+        tuple: Index of the first note of every chord, chord sizes and the voice (from 0) of every chord.
+    """
+    chord_starts = np.flatnonzero(np.r_[True, (np.diff(starts) != 0) | (np.diff(ends) != 0)])
+    chord_sizes = np.diff(np.r_[chord_starts, len(starts)])
+
+    voices = np.zeros(len(chord_starts), dtype=np.int64)
+    voice_ends = []
+    for i, first in enumerate(chord_starts):
+        start = starts[first]
+        for voice, voice_end in enumerate(voice_ends):
+            if voice_end <= start:
+                break
+        else:
+            voice = len(voice_ends)
+            voice_ends.append(0)
+        voice_ends[voice] = ends[first]
+        voices[i] = voice
+    return chord_starts, chord_sizes, voices
+
+
+def split_at_barlines(starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, ...]:
+    """
+    Split events that cross barlines into one piece per measure.
+
+    Returns:
+        tuple: Index of the source event, piece start, piece end and whether the piece
+            is tied to the next and from the previous piece.
+    """
+    first_measure = starts // MEASURE_TICKS
+    last_measure = (ends - 1) // MEASURE_TICKS
+    counts = last_measure - first_measure + 1
+    source = np.repeat(np.arange(len(starts)), counts)
+    measure = first_measure[source] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    piece_starts = np.maximum(starts[source], measure * MEASURE_TICKS)
+    piece_ends = np.minimum(ends[source], (measure + 1) * MEASURE_TICKS)
+    return source, piece_starts, piece_ends, piece_ends < ends[source], piece_starts > starts[source]
+
+
+def _pitch_xml(pitch: int) -> str:
+    step, alter = PITCH_SPELLING[pitch % 12]
+    alter_xml = f"<alter>{alter}</alter>" if alter else ""
+    return f"<pitch><step>{step}</step>{alter_xml}<octave>{pitch // 12 - 1}</octave></pitch>"
+
+
+def _note_xml(ticks: int, voice: int, pitch: Optional[int] = None, chord: bool = False,
+              tie_start: bool = False, tie_stop: bool = False,
+              tuplet_start: bool = False, tuplet_stop: bool = False) -> str:
+    note_type, dots, triplet = dict(NOTE_TYPES)[ticks]
+    xml = ["<note>"]
+    if chord:
+        xml.append("<chord/>")
+    xml.append("<rest/>" if pitch is None else _pitch_xml(pitch))
+    xml.append(f"<duration>{ticks}</duration>")
+    if tie_stop:
+        xml.append('<tie type="stop"/>')
+    if tie_start:
+        xml.append('<tie type="start"/>')
+    xml.append(f"<voice>{voice}</voice><type>{note_type}</type>")
+    xml.append("<dot/>" * dots)
+    if triplet:
+        xml.append("<time-modification><actual-notes>3</actual-notes><normal-notes>2</normal-notes></time-modification>")
+    if tie_start or tie_stop or tuplet_start or tuplet_stop:
+        xml.append("<notations>")
+        if tie_stop:
+            xml.append('<tied type="stop"/>')
+        if tie_start:
+            xml.append('<tied type="start"/>')
+        if tuplet_start:
+            xml.append('<tuplet type="start" bracket="yes"/>')
+        if tuplet_stop:
+            xml.append('<tuplet type="stop"/>')
+        xml.append("</notations>")
+    xml.append("</note>")
+    return "".join(xml)
+
+
+class _Part:
+    """Quantized notes of one part, split into measure-sized pieces per voice"""
+
+    def __init__(self, notes: np.ndarray, bpm: float):
+        self.pieces = {}
+        self.n_measures = 0
+        self.clef = ("G", 2)
+        if not len(notes):
+            return
+
+        starts, ends, pitches = quantize_notes(notes, bpm)
+        if np.median(pitches) < 60:
+            self.clef = ("F", 4)
+        chord_starts, chord_sizes, voices = assign_voices(starts, ends)
+        source, piece_starts, piece_ends, tie_start, tie_stop = split_at_barlines(
+            starts[chord_starts], ends[chord_starts]
+        )
+        self.n_measures = int((ends.max() - 1) // MEASURE_TICKS + 1)
+
+        # (measure, voice) -> [(start, end, pitches, tie start, tie stop)], in start order
+        for i in range(len(source)):
+            chord = source[i]
+            first = chord_starts[chord]
+            key = (int(piece_starts[i] // MEASURE_TICKS), int(voices[chord]))
+            self.pieces.setdefault(key, []).append((
+                int(piece_starts[i]), int(piece_ends[i]), pitches[first:first + chord_sizes[chord]].tolist(),
+                bool(tie_start[i]), bool(tie_stop[i]),
+            ))
+        self.n_voices = int(voices.max()) + 1
+
+    def measure_xml(self, measure: int) -> str:
+        if not self.n_measures:
+            return ""
+        xml = []
+        measure_start = measure * MEASURE_TICKS
+        voices = [voice for voice in range(self.n_voices) if (measure, voice) in self.pieces]
+        if not voices:
+            return (f'<note><rest measure="yes"/><duration>{MEASURE_TICKS}</duration>'
+                    f'<voice>1</voice></note>')
+        for n, voice in enumerate(voices):
+            if n:
+                xml.append(f"<backup><duration>{MEASURE_TICKS}</duration></backup>")
+            # (ticks, pitches or None for a rest, tie start, tie stop) in time order
+            events = []
+            position = measure_start
+            for start, end, pitches, tie_start, tie_stop in self.pieces[(measure, voice)]:
+                events.extend((ticks, None, False, False) for ticks in split_duration(start - position, position))
+                values = split_duration(end - start, start)
+                for j, ticks in enumerate(values):
+                    # Values that are not representable as one note are tied together
+                    events.append((ticks, pitches, tie_start or j < len(values) - 1, tie_stop or j > 0))
+                position = end
+            events.extend(
+                (ticks, None, False, False)
+                for ticks in split_duration(measure_start + MEASURE_TICKS - position, position)
+            )
+            xml.extend(self._events_xml(events, measure_start, voice + 1))
+        return "".join(xml)
+
+    @staticmethod
+    def _events_xml(events: list, position: int, voice: int) -> list[str]:
+        # Runs of triplet values within a beat get a tuplet bracket
+        triplet = [dict(NOTE_TYPES)[ticks][2] for ticks, *_ in events]
+        xml = []
+        for i, (ticks, pitches, tie_start, tie_stop) in enumerate(events):
+            end = position + ticks
+            run_starts = triplet[i] and (i == 0 or position % DIVISIONS == 0 or not triplet[i - 1])
+            run_ends = triplet[i] and (end % DIVISIONS == 0 or i == len(events) - 1 or not triplet[i + 1])
+            # A single triplet value needs no bracket
+            bracket = not (run_starts and run_ends)
+            if pitches is None:
+                xml.append(_note_xml(ticks, voice, tuplet_start=run_starts and bracket,
+                                     tuplet_stop=run_ends and bracket))
+            else:
+                for k, pitch in enumerate(pitches):
+                    xml.append(_note_xml(ticks, voice, pitch, k > 0, tie_start, tie_stop,
+                                         run_starts and bracket and k == 0, run_ends and bracket and k == 0))
+            position = end
+        return xml
+
+
+def write_musicxml(f: TextIO, note_arrays: list, names: list, title: str, bpm: float = 120.0):
+    """
+    Stream a MusicXML score measure by measure into `f`.
+
+    Args:
+        f (TextIO): Output file.
+        note_arrays (list[np.ndarray]): One (n, 4) array per part with start and end in seconds,
+            MIDI pitch and velocity.
+        names (list[str]): Part names.
+        title (str): Score title.
+        bpm (float): Tempo of the score, written as a metronome mark.
+    """
+    parts = [_Part(notes, bpm) for notes in note_arrays]
+    n_measures = max([part.n_measures for part in parts] + [1])
+
+    f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+    f.write('<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 3.1 Partwise//EN" '
+            '"http://www.musicxml.org/dtds/partwise.dtd">\n')
+    f.write('<score-partwise version="3.1">\n')
+    f.write(f"<work><work-title>{escape(title)}</work-title></work>\n")
+    f.write(f"<movement-title>{escape(title)}</movement-title>\n<part-list>\n")
+    for i, name in enumerate(names, start=1):
+        f.write(f'<score-part id="P{i}"><part-name>{escape(name)}</part-name>'
+                f'<part-abbreviation>{escape(name[:3].capitalize())}</part-abbreviation></score-part>\n')
+    f.write("</part-list>\n")
+
+    for i, part in enumerate(parts, start=1):
+        f.write(f'<part id="P{i}">\n')
+        for measure in range(n_measures):
+            f.write(f'<measure number="{measure + 1}">')
+            if measure == 0:
+                sign, line = part.clef
+                f.write(f"<attributes><divisions>{DIVISIONS}</divisions><key><fifths>0</fifths></key>"
+                        f"<time><beats>4</beats><beat-type>4</beat-type></time>"
+                        f"<clef><sign>{sign}</sign><line>{line}</line></clef></attributes>")
+                if i == 1:
+                    f.write(f'<direction placement="above"><direction-type><metronome><beat-unit>quarter</beat-unit>'
+                            f'<per-minute>{bpm:g}</per-minute></metronome></direction-type>'
+                            f'<sound tempo="{bpm:g}"/></direction>')
+            if part.n_measures > measure:
+                f.write(part.measure_xml(measure))
+            else:
+                f.write(f'<note><rest measure="yes"/><duration>{MEASURE_TICKS}</duration><voice>1</voice></note>')
+            if measure == n_measures - 1:
+                f.write('<barline location="right"><bar-style>light-heavy</bar-style></barline>')
+            f.write("</measure>\n")
+        f.write("</part>\n")
+    f.write("</score-partwise>\n")
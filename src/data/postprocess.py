@@ -2,9 +2,32 @@ import os
 os.environ["QT_QPA_PLATFORM"] = "offscreen"
 
 import glob
-from music21 import converter, stream, instrument, metadata, environment, tempo
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from music21 import converter, stream, instrument, metadata, environment, tempo, note, chord, freezeThaw
 from PIL import Image
-import subprocess
+from src.utils.render_service import render_service
+from src.utils.verovio_renderer import verovio_renderer
+from src.data.musicxml_writer import write_musicxml, quantize, QUANTIZE_DIVISORS
+
+# Number of processes building score parts from in-memory notes, 1 builds them in the calling process
+SCORE_WORKERS = int(os.environ.get("SCORE_WORKERS", min(4, os.cpu_count() or 1)))
+
+# 'fast' writes score.musicxml with the NumPy writer, 'music21' builds and writes music21 streams
+SCORE_WRITER = os.environ.get("SCORE_WRITER", "fast")
+
+# 'musescore' renders through the MuseScore render service, 'verovio' in-process without an X server
+SCORE_ENGINE = os.environ.get("SCORE_ENGINE", "musescore")
+
+_score_pool = None
+
+
+def get_score_renderer():
+    """Renderer for MusicXML to PDF selected by SCORE_ENGINE, MuseScore if Verovio is not installed"""
+    if SCORE_ENGINE == "verovio" and verovio_renderer.is_available():
+        return verovio_renderer
+    return render_service
 
 
 def get_midi_name(midi):
@@ -76,14 +99,188 @@ def midi_treatment(midi_file, output_dir):
     musicxml_path = os.path.join(output_dir, "score.musicxml")
     score.write('musicxml', fp=musicxml_path)
 
-    # Call MuseScore via CLI to convert XML to PDF without GUI
+    # Convert XML to PDF with the configured engine
     pdf_path = os.path.join(output_dir, "score.pdf")
-    try:
-        subprocess.run(['xvfb-run', '--auto-servernum', '--server-args=-screen 0 640x480x24',str(us['musicxmlPath']), musicxml_path, '-o', pdf_path], check=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"MuseScore PDF generation failed:\n{e}")
+    get_score_renderer().render(musicxml_path, pdf_path)
     
 
+def _has_overlaps(measure) -> bool:
+    end = 0.0
+    for element in measure.notes:
+        if element.offset < end:
+            return True
+        end = max(end, element.offset + element.quarterLength)
+    return False
+
+
+def notes_to_part(notes: np.ndarray, name: str, bpm: float = 120.0) -> stream.Part:
+    """
+    Build a music21 part directly from note events, without writing and parsing a MIDI file.
+
+    Args:
+        notes (np.ndarray): Array of shape (n, 4) with start and end in seconds, MIDI pitch and velocity.
+        name (str): Part and instrument name.
+        bpm (float): Tempo used to convert seconds to quarter notes.
+
+    Returns:
+        stream.Part: Part with measures, ties and voices where notes overlap.
+    """
+    part = stream.Part()
+    instr = instrument.Instrument()
+    instr.partName = name
+    instr.partAbbreviation = name[:3].capitalize()
+    instr.instrumentName = name
+    part.insert(0, instr)
+
+    if len(notes):
+        notes = notes[np.lexsort((notes[:, 2], notes[:, 0]))]
+        onsets = quantize(notes[:, 0] * bpm / 60)
+        durations = np.maximum(quantize((notes[:, 1] - notes[:, 0]) * bpm / 60), 1 / QUANTIZE_DIVISORS[0])
+
+        # Notes with the same quantized onset and duration become one chord
+        group_starts = np.flatnonzero(np.r_[True, (np.diff(onsets) != 0) | (np.diff(durations) != 0)])
+        group_ends = np.r_[group_starts[1:], len(notes)]
+        for start, end in zip(group_starts, group_ends):
+            pitches = notes[start:end, 2].astype(int)
+            if len(pitches) == 1:
+                element = note.Note(int(pitches[0]), quarterLength=float(durations[start]))
+            else:
+                element = chord.Chord([int(p) for p in pitches], quarterLength=float(durations[start]))
+            element.volume.velocity = int(notes[start:end, 3].max())
+            part.insert(float(onsets[start]), element)
+
+        overlapping = np.any(onsets[group_starts[1:]] < np.maximum.accumulate(
+            onsets[group_starts] + durations[group_starts])[:-1])
+    else:
+        overlapping = False
+
+    part.makeMeasures(inPlace=True)
+    if overlapping:
+        for measure in part.getElementsByClass(stream.Measure):
+            if _has_overlaps(measure):
+                measure.makeVoices(inPlace=True, fillGaps=True)
+    part.makeTies(inPlace=True)
+    return part
+
+
+def _build_part(notes: np.ndarray, name: str, bpm: float) -> str:
+    # Process pool task, the part is sent back in music21's own serialization
+    return freezeThaw.StreamFreezer(notes_to_part(notes, name, bpm)).writeStr()
+
+
+def _get_score_pool(workers: int) -> ProcessPoolExecutor:
+    global _score_pool
+    if _score_pool is None:
+        # Spawned, the parent may run TensorFlow which is not fork-safe
+        _score_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _score_pool
+
+
+def score_from_midis(midis, names, output_dir, original_filename=None, workers=SCORE_WORKERS):
+    """
+    Render the score of in-memory transcriptions, skipping the MIDI write/parse round trip.
+
+    Args:
+        midis (list[pretty_midi.PrettyMIDI]): One transcription per stem.
+        names (list[str]): Stem names, used as part names.
+        output_dir (str): Directory for score.musicxml and score.pdf.
+        original_filename (str): Score title, defaults to the joined part names.
+        workers (int): Processes building the parts, 1 builds them serially.
+    """
+    if not midis:
+        raise ValueError("No MIDI data to render")
+
+    names = [name.capitalize() for name in names]
+    tempo_changes = midis[0].get_tempo_changes()[1]
+    bpm = float(tempo_changes[0]) if len(tempo_changes) else 120.0
+    note_arrays = [
+        np.array(
+            [(n.start, n.end, n.pitch, n.velocity) for inst in midi.instruments for n in inst.notes],
+            dtype=np.float64,
+        ).reshape(-1, 4)
+        for midi in midis
+    ]
+
+    title = original_filename if original_filename is not None else " + ".join(names)
+
+    if SCORE_WRITER == "fast":
+        os.makedirs(output_dir, exist_ok=True)
+        musicxml_path = os.path.join(output_dir, "score.musicxml")
+        # Streamed into a temporary file, the score routes must never see a partial score
+        tmp_path = os.path.join(output_dir, "score.tmp.musicxml")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                write_musicxml(f, note_arrays, names, title, bpm)
+            os.replace(tmp_path, musicxml_path)
+        except Exception as e:
+            print(f"Fast MusicXML writer failed, falling back to music21: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        else:
+            render_musicxml(musicxml_path, output_dir)
+            return
+
+    parts = None
+    if workers > 1 and len(midis) > 1:
+        try:
+            pool = _get_score_pool(min(workers, len(midis)))
+            frozen = list(pool.map(_build_part, note_arrays, names, [bpm] * len(names)))
+            parts = []
+            for data in frozen:
+                thawer = freezeThaw.StreamThawer()
+                thawer.openStr(data)
+                parts.append(thawer.stream)
+        except Exception as e:
+            print(f"Parallel score building failed, building parts serially: {e}")
+    if parts is None:
+        parts = [notes_to_part(notes, name, bpm) for notes, name in zip(note_arrays, names)]
+
+    full_score = stream.Score()
+    full_score.metadata = metadata.Metadata()
+    full_score.metadata.title = title
+    parts[0].insert(0, tempo.MetronomeMark(number=bpm))
+    for part in parts:
+        full_score.append(part)
+
+    render_score(full_score, output_dir)
+
+
+def render_score(full_score, output_dir):
+    """
+    Remove duplicate tempi, write score.musicxml and convert it to score.pdf with the SCORE_ENGINE renderer.
+    """
+    us = environment.UserSettings()
+    us['musicxmlPath'] = '/usr/bin/mscore3'
+    us['musescoreDirectPNGPath'] = '/usr/bin/mscore3'
+
+    # Remove duplicate tempi
+    tempi = list(full_score.recurse().getElementsByClass(tempo.MetronomeMark))
+    if len(tempi) > 1:
+        for tm in tempi[1:]:
+            parent = tm.getContextByClass('Measure')
+            if parent:
+                parent.remove(tm)
+            else:
+                tm.activeSite.remove(tm)
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    musicxml_path = os.path.join(output_dir, "score.musicxml")
+    tmp_path = os.path.join(output_dir, "score.tmp.musicxml")
+    full_score.write('musicxml', fp=tmp_path)
+    os.replace(tmp_path, musicxml_path)
+    render_musicxml(musicxml_path, output_dir)
+
+
+def render_musicxml(musicxml_path, output_dir):
+    """
+    Convert a MusicXML file to score.pdf in `output_dir` with the SCORE_ENGINE renderer.
+    """
+    # MuseScore batches it with other pending scores, Verovio renders it in-process
+    pdf_path = os.path.join(output_dir, "score.pdf")
+    get_score_renderer().render(musicxml_path, pdf_path)
+
+
 def multi_midi_treatment(midi_dir, output_dir, original_filename=None):
     us = environment.UserSettings()
     us['musicxmlPath'] = '/usr/bin/mscore3'
@@ -92,7 +289,10 @@ def multi_midi_treatment(midi_dir, output_dir, original_filename=None):
     full_score = stream.Score()
     full_score.metadata = metadata.Metadata()
     
-    midi_files = sorted(glob.glob(os.path.join(midi_dir, "*.mid")))
+    # combined.mid may already be written next to the stems, it is not a part of its own
+    midi_files = sorted(
+        f for f in glob.glob(os.path.join(midi_dir, "*.mid")) if os.path.basename(f) != "combined.mid"
+    )
     if not midi_files:
         raise ValueError(f"No MIDI files found in {midi_dir}")
     
@@ -117,27 +317,5 @@ def multi_midi_treatment(midi_dir, output_dir, original_filename=None):
 
         full_score.append(part)
 
-    # Remove duplicate tempi
-    tempi = list(full_score.recurse().getElementsByClass(tempo.MetronomeMark))
-    if len(tempi) > 1:
-        for tm in tempi[1:]:
-            parent = tm.getContextByClass('Measure')
-            if parent:
-                parent.remove(tm)
-            else:
-                tm.activeSite.remove(tm)
-
-    os.makedirs(output_dir, exist_ok=True)
-
-    musicxml_path = os.path.join(output_dir, "score.musicxml")
-    full_score.write('musicxml', fp=musicxml_path)
-
-    pdf_path = os.path.join(output_dir, "score.pdf")
-    try:
-        subprocess.run([
-            'xvfb-run', '--auto-servernum', '--server-args=-screen 0 640x480x24',
-            str(us['musicxmlPath']), musicxml_path, '-o', pdf_path
-        ], check=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"MuseScore PDF generation failed:\n{e}")
+    render_score(full_score, output_dir)
     
\ No newline at end of file
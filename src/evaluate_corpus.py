@@ -0,0 +1,250 @@
+# Adds the project root to the path
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import glob
+import time
+import hashlib
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import mir_eval
+
+from src.utils import evaluation
+from src.utils import midi_loading as ml
+
+# Number of MIDI pairs evaluated at the same time
+CORPUS_WORKERS = int(os.environ.get("CORPUS_WORKERS", os.cpu_count() or 1))
+
+# The results table is rewritten after this many finished pairs, so an interrupted run loses little
+CHECKPOINT_EVERY = 20
+
+MIDI_EXTENSIONS = (".mid", ".midi")
+
+# Counts are summed in the total row, every other metric is averaged
+COUNT_COLUMNS = ["true_positives", "false_positives", "false_negatives", "predicted_notes", "ground_truth_notes"]
+
+
+def midi_files(root: str, suffix: str = "") -> dict[str, str]:
+    """
+    Find all MIDI files below `root`, keyed by their path relative to `root` without
+    extension and without `suffix` (e.g. "_pred"), so predictions and ground truth pair up by name.
+    """
+    files = {}
+    for path in sorted(glob.glob(os.path.join(root, "**", "*"), recursive=True)):
+        stem, ext = os.path.splitext(os.path.relpath(path, root))
+        if ext.lower() not in MIDI_EXTENSIONS:
+            continue
+        if suffix and stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+        files[stem.replace(os.sep, "/")] = path
+    return files
+
+
+def pair_files(pred_dir: str, gt_dir: str, pred_suffix: str = "", gt_suffix: str = "") -> list[tuple[str, str, str]]:
+    """
+    Pair predicted and ground truth MIDI files by name.
+
+    Returns:
+        list[tuple]: (name, predicted path, ground truth path) for every name found in both directories.
+    """
+    pred = midi_files(pred_dir, pred_suffix)
+    gt = midi_files(gt_dir, gt_suffix)
+    unpaired = sorted(set(pred) ^ set(gt))
+    if unpaired:
+        print(f"Skipping {len(unpaired)} unpaired files, e.g. {unpaired[:5]}")
+    return [(name, pred[name], gt[name]) for name in sorted(set(pred) & set(gt))]
+
+
+def file_hash(path: str) -> str:
+    """Content hash of a file, used to skip pairs whose inputs have not changed"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def mir_eval_scores(predicted_notes, ground_truth_notes) -> dict:
+    """
+    All `mir_eval.transcription` scores, as printed by `evaluation_test.py`, over all non-drum notes.
+
+    Pitches are converted to Hz as mir_eval expects and notes without duration are dropped,
+    mir_eval rejects them.
+    """
+    def columns(notes):
+        keep = notes.end > notes.start
+        intervals = np.column_stack([notes.start[keep], notes.end[keep]])
+        return intervals, mir_eval.util.midi_to_hz(notes.pitch[keep].astype(np.float64))
+
+    ref_intervals, ref_pitches = columns(ground_truth_notes)
+    est_intervals, est_pitches = columns(predicted_notes)
+    scores = mir_eval.transcription.evaluate(ref_intervals, ref_pitches, est_intervals, est_pitches)
+    return {"mir_" + name.lower().replace("f-measure", "f1"): float(value) for name, value in scores.items()}
+
+
+def evaluate_pair(name: str, pred_path: str, gt_path: str, tolerance_note: float, overlap_note: float) -> dict:
+    """
+    Evaluate one pair in a worker process.
+
+    Errors are recorded in the row instead of raised, so one broken file does not stop the corpus.
+    """
+    start = time.perf_counter()
+    row = {"name": name, "predicted_midi": pred_path, "ground_truth": gt_path}
+    try:
+        predicted_notes = ml.extract_note_array(ml.load_midi(pred_path))
+        # Ground truth rarely changes between runs, read it through the note cache
+        ground_truth_notes = ml.extract_note_array(gt_path)
+        row["predicted_notes"] = len(predicted_notes)
+        row["ground_truth_notes"] = len(ground_truth_notes)
+        row.update(evaluation.evaluate_notes(predicted_notes, ground_truth_notes, tolerance_note, overlap_note))
+        row.update(mir_eval_scores(predicted_notes, ground_truth_notes))
+        row["error"] = None
+    except Exception as e:
+        row["error"] = str(e)
+    row["seconds"] = time.perf_counter() - start
+    return row
+
+
+def parquet_available() -> bool:
+    return any(importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet"))
+
+
+def results_path(output_path: str) -> str:
+    """Output path to use, Parquet falls back to CSV next to it without a Parquet engine"""
+    if output_path.endswith(".parquet") and not parquet_available():
+        fallback = output_path[:-len(".parquet")] + ".csv"
+        print(f"pyarrow/fastparquet not installed, writing {fallback} instead")
+        return fallback
+    return output_path
+
+
+def read_results(path: str) -> pd.DataFrame:
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+
+
+def write_results(df: pd.DataFrame, path: str):
+    """Write the table to a temporary file first, so an interrupted write keeps the previous table"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if path.endswith(".parquet"):
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def aggregate_rows(files: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mean and median over all evaluated files, plus a total row with summed counts
+    and the F1 score, precision and recall computed from them.
+    """
+    ok = files[files["error"].isna()]
+    metrics = [c for c in ok.columns if c not in COUNT_COLUMNS and pd.api.types.is_numeric_dtype(ok[c])
+               and c not in ("tolerance", "overlap")]
+    rows = []
+    for kind, values in (("mean", ok[metrics].mean()), ("median", ok[metrics].median())):
+        rows.append({"row": kind, "name": f"__{kind}__", "files": len(ok), **values.to_dict()})
+
+    counts = ok.reindex(columns=COUNT_COLUMNS).sum()
+    precision = counts["true_positives"] / counts["predicted_notes"] if counts["predicted_notes"] else 0.0
+    recall = counts["true_positives"] / counts["ground_truth_notes"] if counts["ground_truth_notes"] else 0.0
+    rows.append({
+        "row": "total", "name": "__total__", "files": len(ok), **counts.to_dict(),
+        "precision": precision, "recall": recall, "f1_score": evaluation.f1_score(precision, recall),
+    })
+    return pd.DataFrame(rows)
+
+
+def evaluate_corpus(pred_dir: str, gt_dir: str, output_path: str, tolerance_note: float = 0.1,
+                    overlap_note: float = 0.1, workers: int = CORPUS_WORKERS, pred_suffix: str = "",
+                    gt_suffix: str = "", force: bool = False) -> pd.DataFrame:
+    """
+    Evaluate every pair of predicted and ground truth MIDI files in a process pool.
+
+    The table holds one row per file (`row == "file"`) followed by the aggregate rows
+    (`mean`, `median`, `total`). Rows of an earlier run are kept when both input hashes
+    and the evaluation parameters are unchanged and the pair did not fail, only the
+    remaining pairs are evaluated again.
+
+    Args:
+        pred_dir (str): Directory of predicted MIDI files.
+        gt_dir (str): Directory of ground truth MIDI files.
+        output_path (str): Results table, `.parquet` or `.csv`.
+        tolerance_note (float): Passed to `evaluation.evaluate_notes`.
+        overlap_note (float): Passed to `evaluation.evaluate_notes`.
+        workers (int): Number of worker processes.
+        pred_suffix (str): Suffix stripped from predicted file names before pairing.
+        gt_suffix (str): Suffix stripped from ground truth file names before pairing.
+        force (bool): Evaluate every pair, ignoring an earlier table.
+
+    Returns:
+        pd.DataFrame: The table that was written.
+    """
+    output_path = results_path(output_path)
+    pairs = pair_files(pred_dir, gt_dir, pred_suffix, gt_suffix)
+    if not pairs:
+        raise ValueError(f"No MIDI files in {pred_dir} pair up with {gt_dir}")
+
+    hashes = {name: (file_hash(pred), file_hash(gt)) for name, pred, gt in pairs}
+    previous = pd.DataFrame() if force else read_results(output_path)
+    done = {}
+    if not previous.empty:
+        for record in previous[previous["row"] == "file"].to_dict("records"):
+            unchanged = (
+                hashes.get(record["name"]) == (record["predicted_hash"], record["ground_truth_hash"])
+                and record["tolerance"] == tolerance_note and record["overlap"] == overlap_note
+                and pd.isna(record["error"])
+            )
+            if unchanged:
+                done[record["name"]] = record
+    todo = [pair for pair in pairs if pair[0] not in done]
+    print(f"{len(pairs)} pairs, {len(done)} unchanged, evaluating {len(todo)} with {workers} workers")
+
+    rows = dict(done)
+
+    def table() -> pd.DataFrame:
+        files = pd.DataFrame([rows[name] for name, _, _ in pairs if name in rows])
+        return pd.concat([files, aggregate_rows(files)], ignore_index=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(evaluate_pair, name, pred, gt, tolerance_note, overlap_note) for name, pred, gt in todo]
+        for i, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            pred_hash, gt_hash = hashes[row["name"]]
+            rows[row["name"]] = {"row": "file", **row, "predicted_hash": pred_hash, "ground_truth_hash": gt_hash,
+                                 "tolerance": tolerance_note, "overlap": overlap_note}
+            if row["error"]:
+                print(f"[{i}/{len(todo)}] {row['name']}: {row['error']}")
+            else:
+                print(f"[{i}/{len(todo)}] {row['name']}: F1 {row['f1_score']:.4f} ({row['seconds']:.2f}s)")
+            if i % CHECKPOINT_EVERY == 0:
+                write_results(table(), output_path)
+
+    df = table()
+    write_results(df, output_path)
+    total = df[df["row"] == "total"].iloc[0]
+    print(f"Wrote {output_path}: {int(total['files'])} files, total F1 {total['f1_score']:.4f}")
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a directory of predicted MIDI files against ground truth.")
+    parser.add_argument("pred_dir", help="Directory of predicted MIDI files")
+    parser.add_argument("gt_dir", help="Directory of ground truth MIDI files")
+    parser.add_argument("-o", "--output", default="output/corpus_evaluation.parquet", help="Results table, .parquet or .csv")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--overlap", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=CORPUS_WORKERS)
+    parser.add_argument("--pred-suffix", default="", help="Suffix of predicted file names, e.g. _pred")
+    parser.add_argument("--gt-suffix", default="", help="Suffix of ground truth file names, e.g. _gt")
+    parser.add_argument("--force", action="store_true", help="Evaluate all pairs again")
+    args = parser.parse_args()
+
+    evaluate_corpus(args.pred_dir, args.gt_dir, args.output, args.tolerance, args.overlap,
+                    args.workers, args.pred_suffix, args.gt_suffix, args.force)
@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+from src.job_scheduler import QueueFullError
+
+# 'thread' runs jobs inside the web process, 'sqlite' hands them to `src.worker` processes
+JOB_BACKEND = os.environ.get("JOB_BACKEND", "thread")
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join("output", "jobs.sqlite3"))
+JOB_QUEUE_DEPTH = int(os.environ.get("JOB_QUEUE_DEPTH", 8))
+
+# A running job whose worker has not sent a heartbeat for this long is queued again
+JOB_HEARTBEAT_SECONDS = 10
+JOB_STALE_SECONDS = 60
+JOB_MAX_ATTEMPTS = 3
+
+
+class PersistentJobQueue:
+    """
+    Durable local job queue and progress store backed by SQLite.
+
+    The web tier enqueues jobs and reads progress, any number of worker processes
+    (see `src/worker.py`) claim jobs and write progress back. Jobs and progress
+    survive restarts of either side.
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH, max_queue: int = JOB_QUEUE_DEPTH):
+        self.db_path = db_path
+        self.max_queue = max_queue
+        self._local = threading.local()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    session_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    claimed_at REAL,
+                    heartbeat_at REAL,
+                    worker_id TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, enqueued_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS progress (
+                    session_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread, autocommit unless a transaction is opened explicitly
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    # ========================= Jobs =========================
+
+    def enqueue(self, session_id: str, payload: dict) -> int:
+        """
+        Add a job to the queue.
+
+        Args:
+            session_id (str): Progress session of the job.
+            payload (dict): JSON-serializable arguments for `run_model.process_audio`.
+
+        Returns:
+            int: Queue position of the job (1 = next to run).
+
+        Raises:
+            QueueFullError: If `max_queue` jobs are already waiting.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queue:
+                raise QueueFullError(self.retry_after())
+            conn.execute(
+                "INSERT INTO jobs (session_id, status, payload, enqueued_at) VALUES (?, 'queued', ?, ?)",
+                (session_id, json.dumps(payload), time.time())
+            )
+            position = queued + 1
+            self._write_progress(conn, session_id, {
+                'progress': 0,
+                'total': 100,
+                'current_step': f'Waiting in queue (position {position})',
+                'status': 'queued',
+                'queue_position': position,
+                'output_dir': payload.get('output_dir'),
+                'input_path': payload.get('input_path'),
+                'last_updated': time.time()
+            })
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return position
+
+    def claim(self, worker_id: str) -> Optional[tuple[str, dict]]:
+        """
+        Take the oldest waiting job, jobs of crashed workers are queued again first.
+
+        Returns:
+            tuple: (session_id, payload), None if the queue is empty.
+        """
+        self.requeue_stale()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT session_id, payload FROM jobs WHERE status = 'queued' ORDER BY enqueued_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, claimed_at = ?, heartbeat_at = ?, "
+                    "attempts = attempts + 1 WHERE session_id = ?",
+                    (worker_id, now, now, row[0])
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, session_id: str):
+        """Mark the job as still being worked on"""
+        self._connect().execute("UPDATE jobs SET heartbeat_at = ? WHERE session_id = ?", (time.time(), session_id))
+
+    def complete(self, session_id: str):
+        """Mark the job as done"""
+        self._connect().execute("UPDATE jobs SET status = 'done' WHERE session_id = ?", (session_id,))
+
+    def fail(self, session_id: str, error: str):
+        """Mark the job as failed"""
+        self._connect().execute(
+            "UPDATE jobs SET status = 'error', error = ? WHERE session_id = ?", (error, session_id)
+        )
+
+    def requeue_stale(self, stale_seconds: float = JOB_STALE_SECONDS) -> int:
+        """
+        Queue running jobs again whose worker stopped sending heartbeats, or give
+        up on them after `JOB_MAX_ATTEMPTS`.
+
+        Returns:
+            int: Number of requeued jobs.
+        """
+        conn = self._connect()
+        deadline = time.time() - stale_seconds
+        error = 'Worker lost too often'
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            failed = [row[0] for row in conn.execute(
+                "SELECT session_id FROM jobs WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                (deadline, JOB_MAX_ATTEMPTS)
+            ).fetchall()]
+            conn.executemany("UPDATE jobs SET status = 'error', error = ? WHERE session_id = ?",
+                             [(error, session_id) for session_id in failed])
+            # The progress is failed too, so clients stop waiting for the job
+            for session_id in failed:
+                row = conn.execute("SELECT data FROM progress WHERE session_id = ?", (session_id,)).fetchone()
+                data = json.loads(row[0]) if row is not None else {'progress': 0, 'total': 100}
+                data.update({
+                    'current_step': f'Error: {error}',
+                    'status': 'error',
+                    'last_updated': time.time(),
+                    'version': data.get('version', 0) + 1,
+                })
+                self._write_progress(conn, session_id, data)
+            requeued = conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL WHERE status = 'running' AND heartbeat_at < ?",
+                (deadline,)
+            ).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return requeued
+
+    def is_full(self) -> bool:
+        """Check whether a new job would be rejected"""
+        queued = self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return queued >= self.max_queue
+
+    def retry_after(self) -> int:
+        """
+        Estimate in seconds until a queue slot frees up, from recent job durations.
+        """
+        row = self._connect().execute(
+            "SELECT AVG(updated_at - claimed_at), COUNT(DISTINCT worker_id) FROM ("
+            "  SELECT jobs.claimed_at, jobs.worker_id, progress.updated_at FROM jobs "
+            "  JOIN progress USING (session_id) WHERE jobs.status = 'done' "
+            "  ORDER BY jobs.claimed_at DESC LIMIT 20)"
+        ).fetchone()
+        if row[0] is None:
+            return 30
+        return max(1, int(row[0] / max(1, row[1])))
+
+    def stats(self) -> dict:
+        """Get the number of jobs per status and the queue limit"""
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        stats = {status: count for status, count in rows}
+        return {
+            'queued': stats.get('queued', 0),
+            'running': stats.get('running', 0),
+            'done': stats.get('done', 0),
+            'error': stats.get('error', 0),
+            'max_queue': self.max_queue,
+            'retry_after': self.retry_after(),
+        }
+
+    def timing_stats(self, limit: int = 100) -> dict:
+        """
+        Mean time to the first artifact and to completion of the last `limit` completed jobs,
+        read from the `first_result_seconds` and `total_seconds` fields of their progress.
+        """
+        rows = self._connect().execute(
+            "SELECT json_extract(data, '$.first_result_seconds'), json_extract(data, '$.total_seconds') "
+            "FROM progress WHERE json_extract(data, '$.status') = 'completed' ORDER BY updated_at DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        first = [row[0] for row in rows if row[0] is not None]
+        total = [row[1] for row in rows if row[1] is not None]
+        return {
+            'jobs': len(total),
+            'mean_first_result_seconds': sum(first) / len(first) if first else None,
+            'mean_total_seconds': sum(total) / len(total) if total else None,
+        }
+
+    # ========================= Progress =========================
+
+    @staticmethod
+    def _write_progress(conn: sqlite3.Connection, session_id: str, data: dict):
+        conn.execute(
+            "INSERT OR REPLACE INTO progress (session_id, data, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data), time.time())
+        )
+
+    def write_progress(self, session_id: str, data: dict):
+        """Store the progress session dict"""
+        self._write_progress(self._connect(), session_id, data)
+
+    def read_progress(self, session_id: str) -> Optional[dict]:
+        """Read a progress session dict, the queue position of waiting jobs is computed on read"""
+        conn = self._connect()
+        row = conn.execute("SELECT data FROM progress WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        if data.get('status') == 'queued':
+            position = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND enqueued_at <= "
+                "(SELECT enqueued_at FROM jobs WHERE session_id = ?)", (session_id,)
+            ).fetchone()[0]
+            data['queue_position'] = position
+            data['current_step'] = f'Waiting in queue (position {position})'
+            # The position changes without a write, so it stands in for the version while queued
+            data['version'] = -position
+        return data
+
+    def pop_expired_progress(self, finished_before: float, unfinished_before: float) -> list[dict]:
+        """
+        Remove finished sessions last updated before `finished_before` and unfinished
+        sessions last updated before `unfinished_before`, together with their jobs.
+
+        Sessions whose job is still queued or running are never removed, a worker
+        will still read their input and write their output.
+
+        Returns:
+            list[dict]: The removed session dicts, to clean up their files.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT progress.session_id, progress.data, progress.updated_at FROM progress "
+                "LEFT JOIN jobs USING (session_id) "
+                "WHERE progress.updated_at < ? AND (jobs.status IS NULL OR jobs.status NOT IN ('queued', 'running'))",
+                (max(finished_before, unfinished_before),)
+            ).fetchall()
+            expired = []
+            for session_id, data, updated_at in rows:
+                data = json.loads(data)
+                finished = data.get('status') in ('completed', 'error')
+                if updated_at < (finished_before if finished else unfinished_before):
+                    expired.append((session_id, data))
+            ids = [(session_id,) for session_id, _ in expired]
+            conn.executemany("DELETE FROM progress WHERE session_id = ?", ids)
+            conn.executemany("DELETE FROM jobs WHERE session_id = ?", ids)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [data for _, data in expired]
+
+    def delete_progress(self, session_id: str):
+        """Remove a progress session"""
+        self._connect().execute("DELETE FROM progress WHERE session_id = ?", (session_id,))
+
+
+_job_queue = None
+
+
+def get_job_queue() -> PersistentJobQueue:
+    """Get the process-wide job queue, opened on first use"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = PersistentJobQueue()
+    return _job_queue
@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Callable
+
+from src.progress_tracker import progress_tracker
+
+# Number of jobs processed at the same time and number of jobs allowed to wait
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 1))
+JOB_QUEUE_DEPTH = int(os.environ.get("JOB_QUEUE_DEPTH", 8))
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    Bounded job queue served by a fixed number of worker threads.
+
+    Waiting jobs see their queue position through their progress session.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_DEPTH):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._durations = deque(maxlen=20)
+
+    def _start_workers(self):
+        # Called with the condition held
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, session_id: str, fn: Callable, *args, **kwargs) -> int:
+        """
+        Add a job to the queue.
+
+        Args:
+            session_id (str): Progress session of the job, errors are reported to it.
+            fn (Callable): The job, called as `fn(*args, **kwargs)` by a worker.
+
+        Returns:
+            int: Queue position of the job (1 = next to run).
+
+        Raises:
+            QueueFullError: If `max_queue` jobs are already waiting.
+        """
+        with self._condition:
+            if len(self._pending) >= self.max_queue:
+                raise QueueFullError(self.retry_after())
+            self._pending.append((session_id, fn, args, kwargs))
+            position = len(self._pending)
+            progress_tracker.queue_session(session_id, position)
+            # The session and its files must not expire while the job waits or runs
+            progress_tracker.pin_session(session_id)
+            self._start_workers()
+            self._condition.notify()
+        return position
+
+    def is_full(self) -> bool:
+        """Check whether a new job would be rejected"""
+        with self._condition:
+            return len(self._pending) >= self.max_queue
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                session_id, fn, args, kwargs = self._pending.popleft()
+                self._running += 1
+                for position, (waiting_id, *_) in enumerate(self._pending, start=1):
+                    progress_tracker.set_queue_position(waiting_id, position)
+
+            start = time.perf_counter()
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                progress_tracker.error_session(session_id, str(e))
+            finally:
+                progress_tracker.unpin_session(session_id)
+                with self._condition:
+                    self._running -= 1
+                    self._durations.append(time.perf_counter() - start)
+
+    def retry_after(self) -> int:
+        """
+        Estimate in seconds until a queue slot frees up, from recent job durations.
+        """
+        if not self._durations:
+            return 30
+        mean_duration = sum(self._durations) / len(self._durations)
+        return max(1, int(mean_duration / max(1, self.workers)))
+
+    def stats(self) -> dict:
+        """Get queue length, running jobs and limits"""
+        with self._condition:
+            return {
+                'queued': len(self._pending),
+                'running': self._running,
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'retry_after': self.retry_after(),
+            }
+
+
+# Global instance
+job_scheduler = JobScheduler()
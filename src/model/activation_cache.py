@@ -0,0 +1,110 @@
+import os
+import shutil
+import hashlib
+import threading
+from typing import Optional
+
+import numpy as np
+
+# Raw basic-pitch outputs, one subdirectory of memory-mappable .npy files per audio hash
+ACTIVATION_CACHE_DIR = os.environ.get("ACTIVATION_CACHE_DIR", os.path.join("output", "activation_cache"))
+ACTIVATION_CACHE_MAX_BYTES = int(os.environ.get("ACTIVATION_CACHE_MAX_BYTES", 4 * 1024 ** 3))
+# Off by default: web jobs rarely see the same audio twice, parameter sweeps (model_optimizer) turn it on
+ACTIVATION_CACHE_ENABLED = os.environ.get("ACTIVATION_CACHE_ENABLED", "0") == "1"
+
+OUTPUT_KEYS = ("note", "onset", "contour")
+
+
+class ActivationCache:
+    """
+    Stage-level cache for the model output (note/onset/contour activations).
+
+    With the activations on disk, a change of `onset_threshold`, `frame_threshold`
+    or `minimum_note_length` only re-runs the note decoding, not the network.
+    """
+
+    def __init__(self, root: str = ACTIVATION_CACHE_DIR, max_bytes: int = ACTIVATION_CACHE_MAX_BYTES,
+                 enabled: bool = ACTIVATION_CACHE_ENABLED):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def audio_key(audio: np.ndarray) -> str:
+        """
+        Hash of the audio at the model sample rate.
+        """
+        return hashlib.blake2b(np.ascontiguousarray(audio, dtype=np.float32).tobytes(), digest_size=20).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def load(self, key: str) -> Optional[dict]:
+        """
+        Get the cached model output for `key`.
+
+        The arrays are memory-mapped copy-on-write, so loading is cheap and the
+        note decoding may still modify them.
+
+        Returns:
+            dict: 'note', 'onset' and 'contour' activations, None if not cached.
+        """
+        entry_dir = self._entry_dir(key)
+        paths = {k: os.path.join(entry_dir, f"{k}.npy") for k in OUTPUT_KEYS}
+        if not all(os.path.exists(path) for path in paths.values()):
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        with self._lock:
+            self._stats['hits'] += 1
+        os.utime(entry_dir)
+        return {k: np.load(path, mmap_mode='c') for k, path in paths.items()}
+
+    def save(self, key: str, model_output: dict):
+        """
+        Store the model output for `key`.
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for k in OUTPUT_KEYS:
+            np.save(os.path.join(tmp_dir, f"{k}.npy"), np.asarray(model_output[k], dtype=np.float32))
+        with self._lock:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self._stats['stores'] += 1
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits into `max_bytes`.
+        """
+        with self._lock:
+            if not os.path.isdir(self.root):
+                return
+            entries = []
+            for key in os.listdir(self.root):
+                entry_dir = self._entry_dir(key)
+                if ".tmp-" in key or not os.path.isdir(entry_dir):
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+                entries.append((os.stat(entry_dir).st_mtime, size, entry_dir))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                self._stats['evictions'] += 1
+
+    def stats(self) -> dict:
+        """Get hit/miss/store/eviction counters."""
+        with self._lock:
+            return {**self._stats, 'enabled': self.enabled}
+
+
+# Global instance
+activation_cache = ActivationCache()
@@ -1,8 +1,35 @@
 import os
+import time
+import threading
+import numpy as np
+import librosa
 import pretty_midi
-from basic_pitch.inference import predict, predict_and_save, Model
-from basic_pitch import ICASSP_2022_MODEL_PATH
+from basic_pitch.inference import predict, predict_and_save, Model, unwrap_output
+from basic_pitch.constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE, FFT_HOP
+from basic_pitch import ICASSP_2022_MODEL_PATH, note_creation
 from src.model.model_parameter import INSTRUMENT_PARAMS
+from src.model.activation_cache import activation_cache
+
+# Process-wide model registry: model path -> loaded basic-pitch Model
+_MODELS: dict = {}
+_MODELS_LOCK = threading.Lock()
+
+# Load and inference timings, see `get_inference_stats`
+_STATS = {
+    "load_seconds": {},
+    "warmup_seconds": {},
+    "calls": 0,
+    "total_inference_seconds": 0.0,
+    "last_inference_seconds": None,
+}
+
+# Windowing as done by `basic_pitch.inference.run_inference`
+N_OVERLAPPING_FRAMES = 30
+OVERLAP_LEN = N_OVERLAPPING_FRAMES * FFT_HOP
+HOP_SIZE = AUDIO_N_SAMPLES - OVERLAP_LEN
+
+# Number of windows per forward pass in `predict_midi_batch`
+PREDICT_BATCH_SIZE = int(os.environ.get("PREDICT_BATCH_SIZE", 64))
 
 # Prototype
 # predict_and_save(
@@ -14,6 +41,71 @@ from src.model.model_parameter import INSTRUMENT_PARAMS
 #     <save-notes>,
 # )
 #model_output, midi_data, note_events = predict("input/audio/file.wav")
+def get_model(model_path=ICASSP_2022_MODEL_PATH) -> Model:
+    """
+    Get the basic-pitch model for `model_path`, loading it only on the first call.
+
+    Args:
+        model_path: Path to the saved basic-pitch model.
+
+    Returns:
+        Model: The shared, already deserialized model.
+    """
+    key = str(model_path)
+    with _MODELS_LOCK:
+        if key not in _MODELS:
+            start = time.perf_counter()
+            _MODELS[key] = Model(model_path)
+            _STATS["load_seconds"][key] = time.perf_counter() - start
+            print(f"Loaded basic-pitch model in {_STATS['load_seconds'][key]:.2f}s")
+        return _MODELS[key]
+
+
+def warmup_model(model_path=ICASSP_2022_MODEL_PATH) -> Model:
+    """
+    Load the model and run it once on a silent dummy window, so the first real
+    request does not pay the graph tracing latency.
+    """
+    model = get_model(model_path)
+    start = time.perf_counter()
+    model.predict(np.zeros((1, AUDIO_N_SAMPLES, 1), dtype=np.float32))
+    _STATS["warmup_seconds"][str(model_path)] = time.perf_counter() - start
+    return model
+
+
+def get_inference_stats() -> dict:
+    """
+    Get model load, warmup and per-call inference timings.
+    """
+    with _MODELS_LOCK:
+        stats = {k: (v.copy() if isinstance(v, dict) else v) for k, v in _STATS.items()}
+    stats["mean_inference_seconds"] = stats["total_inference_seconds"] / stats["calls"] if stats["calls"] else None
+    return stats
+
+
+def _record_inference(start: float):
+    elapsed = time.perf_counter() - start
+    with _MODELS_LOCK:
+        _STATS["calls"] += 1
+        _STATS["total_inference_seconds"] += elapsed
+        _STATS["last_inference_seconds"] = elapsed
+    return elapsed
+
+
+def configure_tf_threads(intra_op_threads: int, inter_op_threads: int = 1):
+    """
+    Cap the TensorFlow thread pools of the current process.
+
+    Has to run before TensorFlow executes its first op, later calls are ignored.
+    """
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError:
+        print("TensorFlow is already initialized, thread limits unchanged")
+
+
 def get_instrument_from_filename(filename: str) -> str:
     """
     Extrahiert das Instrument anhand des Dateinamens.
@@ -23,9 +115,12 @@ def get_instrument_from_filename(filename: str) -> str:
             return key
     return "other"  # Fallback, falls nichts gefunden
 
-def transcribe_with_optimal_params(wav_path: str, output_dir: str):
+def transcribe_with_optimal_params(wav_path: str, output_dir: str, audio=None):
     """
     Führt die Transkription mit den zum Instrument passenden Parametern aus.
+
+    Ist `audio` (mono, mit `AUDIO_SAMPLE_RATE`) gesetzt, wird es direkt verwendet
+    und `wav_path` dient nur zur Bestimmung des Instruments.
     """
     instrument = get_instrument_from_filename(wav_path)
     params = INSTRUMENT_PARAMS[instrument]
@@ -33,7 +128,7 @@ def transcribe_with_optimal_params(wav_path: str, output_dir: str):
     output_path = os.path.join(output_dir, f"{instrument}.mid")
     print(f"Found Instrument: {instrument}")
     return predict_midi(
-        audio_path=wav_path,
+        audio_path=wav_path if audio is None else audio,
         onset_threshold=params["onset_threshold"],
         frame_threshold=params["frame_threshold"],
         minimum_note_length=params["minimum_note_length"]
@@ -49,7 +144,7 @@ def predict_midi(
     Predicts a MIDI file from an audio input using basic-pitch with custom hyperparameters.
 
     Args:
-        audio_path (str): Path to the audio file.
+        audio_path (str): Path to the audio file, or a mono numpy array at `AUDIO_SAMPLE_RATE`.
         output_path (str): Path to save the predicted MIDI file.
         onset_threshold (float): Threshold for detecting note onsets (0.0 - 1.0).
         frame_threshold (float): Threshold for detecting note frames (0.0 - 1.0).
@@ -58,18 +153,224 @@ def predict_midi(
     Returns:
         str: Path to the saved MIDI file.
     """
-    print(f"🎶 Predicting MIDI for: {audio_path}")
+    params = dict(onset_threshold=onset_threshold, frame_threshold=frame_threshold, minimum_note_length=minimum_note_length)
+    in_memory = not isinstance(audio_path, (str, os.PathLike))
+    if not in_memory:
+        print(f"🎶 Predicting MIDI for: {audio_path}")
     print(f"Using hyperparameters: onset_threshold={onset_threshold}, frame_threshold={frame_threshold}, min_note_length={minimum_note_length}")
 
+    if in_memory or activation_cache.enabled:
+        # Batched path, with the activation cache enabled the network only runs for unseen audio
+        return predict_midi_batch([audio_path], [params])[0]
+
+    start = time.perf_counter()
     _, midi_data, _ = predict(
         audio_path=audio_path,
-        model_or_model_path=ICASSP_2022_MODEL_PATH,
+        model_or_model_path=get_model(),
+        onset_threshold=onset_threshold,
+        frame_threshold=frame_threshold,
+        minimum_note_length=minimum_note_length
+    )
+    print(f"Inference took {_record_inference(start):.2f}s")
+    return midi_data
+
+def load_model_audio(audio) -> np.ndarray:
+    """
+    Load audio at the basic-pitch sample rate.
+
+    Args:
+        audio: Path to an audio file, or a mono numpy array already at `AUDIO_SAMPLE_RATE`.
+
+    Returns:
+        np.ndarray: Mono float32 audio.
+    """
+    if isinstance(audio, (str, os.PathLike)):
+        audio, _ = librosa.load(str(audio), sr=AUDIO_SAMPLE_RATE, mono=True)
+    return np.asarray(audio, dtype=np.float32)
+
+
+def window_audio(audio: np.ndarray) -> np.ndarray:
+    """
+    Cut audio into the overlapping, fixed-length model windows.
+
+    Returns:
+        np.ndarray: Windows of shape (n_windows, AUDIO_N_SAMPLES, 1).
+    """
+    n_windows = int(np.ceil((len(audio) + OVERLAP_LEN // 2) / HOP_SIZE))
+    padded = np.zeros((n_windows - 1) * HOP_SIZE + AUDIO_N_SAMPLES, dtype=np.float32)
+    padded[OVERLAP_LEN // 2:OVERLAP_LEN // 2 + len(audio)] = audio
+    windows = np.lib.stride_tricks.sliding_window_view(padded, AUDIO_N_SAMPLES)[::HOP_SIZE]
+    return windows[..., np.newaxis]
+
+
+def decode_notes(
+    model_output: dict,
+    onset_threshold: float = 0.5,
+    frame_threshold: float = 0.5,
+    minimum_note_length: int = 50
+):
+    """
+    Turn raw model activations into notes, this is the cheap part of `predict`.
+
+    Returns:
+        tuple: The PrettyMIDI object and the list of note events.
+    """
+    min_note_len = int(np.round(minimum_note_length / 1000 * (AUDIO_SAMPLE_RATE / FFT_HOP)))
+    return note_creation.model_output_to_notes(
+        model_output,
+        onset_thresh=onset_threshold,
+        frame_thresh=frame_threshold,
+        min_note_len=min_note_len,
+    )
+
+
+def run_batched_inference(audios: list, batch_size: int = PREDICT_BATCH_SIZE) -> list[dict]:
+    """
+    Run the model on the windows of several audio signals in shared batches.
+
+    All windows are packed into large batches for the forward pass and the
+    activations are split back out per signal afterwards.
+
+    Args:
+        audios (list): Mono audio arrays at `AUDIO_SAMPLE_RATE`.
+        batch_size (int): Number of windows per forward pass.
+
+    Returns:
+        list[dict]: Unwrapped model output ('note', 'onset', 'contour') per audio.
+    """
+    model = get_model()
+    windows = [window_audio(audio) for audio in audios]
+    counts = [len(w) for w in windows]
+    all_windows = np.concatenate(windows)
+
+    outputs = {"note": [], "onset": [], "contour": []}
+    start = time.perf_counter()
+    for i in range(0, len(all_windows), batch_size):
+        for key, value in model.predict(all_windows[i:i + batch_size]).items():
+            outputs[key].append(value)
+    elapsed = _record_inference(start)
+    print(f"Batched inference on {len(all_windows)} windows of {len(audios)} signals took {elapsed:.2f}s")
+
+    outputs = {key: np.concatenate(value) for key, value in outputs.items()}
+    bounds = np.cumsum([0] + counts)
+    return [
+        {
+            key: unwrap_output(value[bounds[i]:bounds[i + 1]], len(audio), N_OVERLAPPING_FRAMES)
+            for key, value in outputs.items()
+        }
+        for i, audio in enumerate(audios)
+    ]
+
+
+def predict_midi_batch(
+    audio_paths: list,
+    params: list[dict] = None,
+    batch_size: int = PREDICT_BATCH_SIZE
+) -> list[pretty_midi.PrettyMIDI]:
+    """
+    Predicts MIDI for several audio inputs (e.g. all stems of a track) with one batched model run.
+
+    Args:
+        audio_paths (list): Paths to audio files or mono arrays at `AUDIO_SAMPLE_RATE`.
+        params (list[dict]): Per input 'onset_threshold', 'frame_threshold' and
+            'minimum_note_length'. Defaults to the `predict_midi` defaults.
+        batch_size (int): Number of windows per forward pass.
+
+    Returns:
+        list[pretty_midi.PrettyMIDI]: One MIDI object per input, in input order.
+    """
+    if params is None:
+        params = [{}] * len(audio_paths)
+    audios = [load_model_audio(audio) for audio in audio_paths]
+    model_outputs = get_model_outputs(audios, batch_size)
+    return [decode_notes(output, **p)[0] for output, p in zip(model_outputs, params)]
+
+
+def get_model_outputs(audios: list, batch_size: int = PREDICT_BATCH_SIZE, use_cache: bool = None) -> list[dict]:
+    """
+    Get the model output for several audio signals, from the activation cache
+    where possible. Only the signals that are not cached yet run through the model.
+
+    Args:
+        audios (list): Mono audio arrays at `AUDIO_SAMPLE_RATE`.
+        batch_size (int): Number of windows per forward pass.
+        use_cache (bool): Read and write the activation cache, defaults to `activation_cache.enabled`.
+
+    Returns:
+        list[dict]: Model output ('note', 'onset', 'contour') per audio.
+    """
+    if use_cache is None:
+        use_cache = activation_cache.enabled
+    if not use_cache:
+        return run_batched_inference(audios, batch_size)
+
+    keys = [activation_cache.audio_key(audio) for audio in audios]
+    outputs = [activation_cache.load(key) for key in keys]
+    missing = [i for i, output in enumerate(outputs) if output is None]
+    if missing:
+        computed = run_batched_inference([audios[i] for i in missing], batch_size)
+        for i, output in zip(missing, computed):
+            activation_cache.save(keys[i], output)
+            outputs[i] = output
+    return outputs
+
+
+def activation_key(audio) -> str:
+    """
+    Get the activation cache key of an audio file or array, see `redecode_midi`.
+    """
+    return activation_cache.audio_key(load_model_audio(audio))
+
+
+def redecode_midi(
+    key: str,
+    onset_threshold: float = 0.5,
+    frame_threshold: float = 0.5,
+    minimum_note_length: int = 50
+) -> pretty_midi.PrettyMIDI:
+    """
+    Re-run only the note decoding on cached activations with new thresholds.
+
+    Args:
+        key (str): Activation cache key, see `activation_key`.
+        onset_threshold (float): Threshold for detecting note onsets (0.0 - 1.0).
+        frame_threshold (float): Threshold for detecting note frames (0.0 - 1.0).
+        minimum_note_length (int): Minimum note duration in milliseconds.
+
+    Returns:
+        pretty_midi.PrettyMIDI: The transcription with the new parameters.
+    """
+    model_output = activation_cache.load(key)
+    if model_output is None:
+        raise ValueError(f"No cached activations for key {key}, run predict_midi first")
+    midi_data, _ = decode_notes(
+        model_output,
         onset_threshold=onset_threshold,
         frame_threshold=frame_threshold,
         minimum_note_length=minimum_note_length
     )
     return midi_data
 
+
+def transcribe_batch_with_optimal_params(wav_paths: list, batch_size: int = PREDICT_BATCH_SIZE, names: list[str] = None):
+    """
+    Transcribes several stems at once, each with the parameters of its instrument.
+
+    Args:
+        wav_paths (list): Paths to the stem files, or mono arrays at `AUDIO_SAMPLE_RATE`.
+        batch_size (int): Number of windows per forward pass.
+        names (list[str]): Stem names used to pick the instrument, defaults to the file names.
+
+    Returns:
+        tuple[list, list]: MIDI objects and instrument names, in the order of `wav_paths`.
+    """
+    if names is None:
+        names = [str(path) for path in wav_paths]
+    instruments = [get_instrument_from_filename(name) for name in names]
+    params = [INSTRUMENT_PARAMS[instrument] for instrument in instruments]
+    return predict_midi_batch(wav_paths, params, batch_size), instruments
+
+
 def combine_midis(midi_list: list[pretty_midi.PrettyMIDI], names: list[str]) -> pretty_midi.PrettyMIDI:
     combined = pretty_midi.PrettyMIDI()
     for i, (midi, name) in enumerate(zip(midi_list, names)):
@@ -1,24 +1,111 @@
+import os
+import copy
 import json
 import time
+import shutil
 import threading
-from typing import Dict, Optional
+from collections import deque
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
+
+# How often sessions that only live in the attached store are re-read while waiting for a change
+STORE_POLL_SECONDS = 0.5
+
+# Finished sessions expire after SESSION_TTL_SECONDS, unfinished ones after SESSION_STALE_SECONDS without update
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", 3600))
+SESSION_STALE_SECONDS = float(os.environ.get("SESSION_STALE_SECONDS", 6 * 3600))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 200))
+REAPER_INTERVAL_SECONDS = float(os.environ.get("REAPER_INTERVAL_SECONDS", 60))
+
+FINISHED_STATUSES = ('completed', 'error')
 
 class ProgressTracker:
     def __init__(self):
         self._progress_data: Dict[str, Dict] = {}
         self._lock = threading.Lock()
-    
+        # Notified on every session change, see `wait_for_change`
+        self._changed = threading.Condition(self._lock)
+        # Optional shared storage (e.g. `job_queue.PersistentJobQueue`) for multi-process setups
+        self._store = None
+        self._reaper = None
+        # Sessions of jobs that are waiting or running in the scheduler, never expired
+        self._pinned = set()
+        self._eviction_stats = {'expired': 0, 'evicted': 0, 'files_removed': 0}
+        # Seconds from job start to the first artifact and to completion, of recent jobs
+        self._first_result_times = deque(maxlen=100)
+        self._total_times = deque(maxlen=100)
+
+    def attach_store(self, store):
+        """Mirror every session change to `store` and read sessions from it that are not known locally"""
+        with self._lock:
+            self._store = store
+
+    def _persist(self, session_id: str):
+        # Called with the lock held
+        if self._store is not None and session_id in self._progress_data:
+            self._store.write_progress(session_id, self._progress_data[session_id])
+
+    def _changed_session(self, session_id: str):
+        # Called with the lock held after every change: bump the version, persist and wake up waiters
+        session = self._progress_data[session_id]
+        session['version'] = session.get('version', 0) + 1
+        self._persist(session_id)
+        self._changed.notify_all()
+
+    def _set_session(self, session_id: str, data: Dict):
+        # Called with the lock held, a re-created session keeps counting versions
+        previous = self._progress_data.get(session_id)
+        if previous is not None:
+            data['version'] = previous.get('version', 0)
+        self._progress_data[session_id] = data
+        self._changed_session(session_id)
+        if previous is None:
+            self._enforce_max_sessions()
+
     def create_session(self, session_id: str, total_steps: int = 100):
         """Create a new progress tracking session"""
         with self._lock:
-            self._progress_data[session_id] = {
+            self._set_session(session_id, {
                 'progress': 0,
                 'total': total_steps,
                 'current_step': '',
                 'status': 'starting',
+                'started_at': time.time(),
+                'artifacts': [],
+                'last_updated': time.time()
+            })
+
+    def queue_session(self, session_id: str, position: int, total_steps: int = 100):
+        """Create a session for a job that waits in the job queue"""
+        with self._lock:
+            self._set_session(session_id, {
+                'progress': 0,
+                'total': total_steps,
+                'current_step': f'Waiting in queue (position {position})',
+                'status': 'queued',
+                'queue_position': position,
                 'last_updated': time.time()
-            }
-    
+            })
+
+    def set_queue_position(self, session_id: str, position: int):
+        """Update the queue position of a waiting session"""
+        with self._lock:
+            session = self._progress_data.get(session_id)
+            if session is not None and session['status'] == 'queued':
+                session.update({
+                    'current_step': f'Waiting in queue (position {position})',
+                    'queue_position': position,
+                    'last_updated': time.time()
+                })
+                self._changed_session(session_id)
+
+    def set_session_info(self, session_id: str, **info):
+        """Attach additional information (e.g. output_dir, format) to a session"""
+        with self._lock:
+            if session_id in self._progress_data:
+                self._progress_data[session_id].update(info)
+                self._changed_session(session_id)
+
     def update_progress(self, session_id: str, progress: int, step_name: str = ''):
         """Update the progress for a given session"""
         with self._lock:
@@ -29,18 +116,40 @@ class ProgressTracker:
                     'status': 'processing',
                     'last_updated': time.time()
                 })
-    
+                self._changed_session(session_id)
+
+    def add_artifact(self, session_id: str, name: str, path: str):
+        """Publish a finished result file (e.g. the MIDI of one stem) while the job is still running"""
+        with self._lock:
+            session = self._progress_data.get(session_id)
+            if session is None:
+                return
+            now = time.time()
+            artifacts = session.setdefault('artifacts', [])
+            if not artifacts and 'started_at' in session:
+                session['first_result_seconds'] = now - session['started_at']
+                self._first_result_times.append(session['first_result_seconds'])
+            artifacts[:] = [artifact for artifact in artifacts if artifact['name'] != name]
+            artifacts.append({'name': name, 'path': path, 'size': os.path.getsize(path), 'created': now})
+            session['last_updated'] = now
+            self._changed_session(session_id)
+
     def complete_session(self, session_id: str):
         """Mark a session as completed"""
         with self._lock:
             if session_id in self._progress_data:
+                session = self._progress_data[session_id]
+                if 'started_at' in session:
+                    session['total_seconds'] = time.time() - session['started_at']
+                    self._total_times.append(session['total_seconds'])
                 self._progress_data[session_id].update({
                     'progress': self._progress_data[session_id]['total'],
                     'current_step': 'Completed',
                     'status': 'completed',
                     'last_updated': time.time()
                 })
-    
+                self._changed_session(session_id)
+
     def error_session(self, session_id: str, error_message: str):
         """Mark a session as having an error"""
         with self._lock:
@@ -50,16 +159,170 @@ class ProgressTracker:
                     'status': 'error',
                     'last_updated': time.time()
                 })
-    
-    def get_progress(self, session_id: str) -> Optional[Dict]:
-        """Get the current progress for a session"""
+                self._changed_session(session_id)
+
+    def _snapshot(self, session_id: str) -> Optional[Mapping]:
+        # Called without the lock: only the in-memory lookup takes it, the store is read outside
         with self._lock:
-            return self._progress_data.get(session_id, None)
-    
+            session = self._progress_data.get(session_id, None)
+            if session is not None:
+                return MappingProxyType(copy.deepcopy(session))
+            store = self._store
+        if store is None:
+            return None
+        # A fresh dict decoded from the store, nothing else references it
+        session = store.read_progress(session_id)
+        return MappingProxyType(session) if session is not None else None
+
+    def get_progress(self, session_id: str) -> Optional[Mapping]:
+        """Get an immutable snapshot of the current progress for a session"""
+        return self._snapshot(session_id)
+
+    def wait_for_change(self, session_id: str, version: int, timeout: float = 15.0) -> Optional[Mapping]:
+        """
+        Block until the session has a version other than `version`, or until `timeout` passes.
+
+        Returns:
+            Mapping: Snapshot of the session, unchanged if the timeout passed. None if the session does not exist.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self._snapshot(session_id)
+            remaining = deadline - time.monotonic()
+            if snapshot is None or snapshot.get('version') != version or remaining <= 0:
+                return snapshot
+            with self._lock:
+                session = self._progress_data.get(session_id)
+                if session is not None:
+                    # Changed between the snapshot and taking the lock, the notification is already gone
+                    if session.get('version') == version:
+                        self._changed.wait(remaining)
+                else:
+                    # Changes made by other processes are not notified, poll the store instead
+                    self._changed.wait(min(remaining, STORE_POLL_SECONDS))
+
+    # ========================= Expiry =========================
+
+    def _enforce_max_sessions(self):
+        # Called with the lock held: evict the least recently updated finished sessions
+        excess = len(self._progress_data) - MAX_SESSIONS
+        if excess <= 0:
+            return
+        finished = sorted(
+            (session['last_updated'], session_id)
+            for session_id, session in self._progress_data.items()
+            if session['status'] in FINISHED_STATUSES and session_id not in self._pinned
+        )
+        victims = [self._progress_data.pop(session_id) for _, session_id in finished[:excess]]
+        self._eviction_stats['evicted'] += len(victims)
+        if victims:
+            # Files are removed by a separate thread, not while the lock is held
+            threading.Thread(target=self._remove_files, args=(victims,), daemon=True).start()
+
+    def _remove_files(self, sessions: list):
+        """Delete the output directory and uploaded input file of expired sessions"""
+        removed = 0
+        for session in sessions:
+            output_dir = session.get('output_dir')
+            if output_dir and os.path.isdir(output_dir):
+                shutil.rmtree(output_dir, ignore_errors=True)
+                removed += 1
+            input_path = session.get('input_path')
+            if input_path and os.path.exists(input_path):
+                os.remove(input_path)
+                removed += 1
+        with self._lock:
+            self._eviction_stats['files_removed'] += removed
+
+    def pin_session(self, session_id: str):
+        """Keep a session from expiring while its job waits or runs, see `unpin_session`"""
+        with self._lock:
+            self._pinned.add(session_id)
+
+    def unpin_session(self, session_id: str):
+        """Let a session expire again once its job has finished"""
+        with self._lock:
+            self._pinned.discard(session_id)
+
+    def reap_expired(self, now: Optional[float] = None) -> int:
+        """
+        Remove expired sessions together with their files.
+
+        Pinned sessions are kept however old their last update is, a queued job
+        can wait and a running job can work for longer than `SESSION_STALE_SECONDS`.
+
+        Returns:
+            int: Number of expired sessions.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [
+                session_id for session_id, session in self._progress_data.items()
+                if session_id not in self._pinned and now - session['last_updated'] > (
+                    SESSION_TTL_SECONDS if session['status'] in FINISHED_STATUSES else SESSION_STALE_SECONDS
+                )
+            ]
+            victims = [self._progress_data.pop(session_id) for session_id in expired]
+            if self._store is not None:
+                victims += self._store.pop_expired_progress(now - SESSION_TTL_SECONDS, now - SESSION_STALE_SECONDS)
+            self._eviction_stats['expired'] += len(victims)
+        self._remove_files(victims)
+        return len(victims)
+
+    def start_reaper(self, interval: float = REAPER_INTERVAL_SECONDS):
+        """Start the background thread that expires sessions every `interval` seconds"""
+        def reap():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reap_expired()
+                except Exception as e:
+                    print(f"Session reaper failed: {e}")
+
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=reap, name="session-reaper", daemon=True)
+                self._reaper.start()
+
+    def eviction_stats(self) -> Dict:
+        """Get the number of live, expired and evicted sessions"""
+        with self._lock:
+            stats = dict(self._eviction_stats)
+            stats['sessions'] = len(self._progress_data)
+            stats['max_sessions'] = MAX_SESSIONS
+            stats['ttl_seconds'] = SESSION_TTL_SECONDS
+        return stats
+
+    def timing_stats(self) -> Dict:
+        """
+        Get the mean time to the first artifact and to completion of recent jobs.
+
+        With an attached store the jobs run in other processes, their timings are read from the store.
+        """
+        with self._lock:
+            store = self._store
+            first, total = list(self._first_result_times), list(self._total_times)
+        if store is not None:
+            return store.timing_stats()
+        return {
+            'jobs': len(total),
+            'mean_first_result_seconds': sum(first) / len(first) if first else None,
+            'mean_total_seconds': sum(total) / len(total) if total else None,
+        }
+
+    def release_session(self, session_id: str):
+        """Drop a session from local memory only, it stays available in the attached store"""
+        with self._lock:
+            self._persist(session_id)
+            self._progress_data.pop(session_id, None)
+
     def cleanup_session(self, session_id: str):
         """Remove a session from tracking"""
         with self._lock:
             self._progress_data.pop(session_id, None)
+            if self._store is not None:
+                self._store.delete_progress(session_id)
+            self._changed.notify_all()
 
 # Global instance
-progress_tracker = ProgressTracker()
\ No newline at end of file
+progress_tracker = ProgressTracker()
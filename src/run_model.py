@@ -4,11 +4,43 @@
 # from model.model_parameter import INSTRUMENT_PARAMS
 # import model.midi_generator as midi_gen
 
-import os, subprocess
+import os
+import zipfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
+import numpy as np
+import librosa
 from pathlib import Path
 from src.model import midi_generator as midi_gen
+from src.model.model_parameter import INSTRUMENT_PARAMS
 from src.data import postprocess as post_proc
+from src.utils.separation_service import separation_service, split_in_subprocess
+from src.utils.result_cache import result_cache, RESULT_CACHE_ENABLED
+from src.streaming import stream_transcription, notes_to_midi, STREAM_RMS
+
+# 'inprocess' keeps a warm Spleeter separator, 'subprocess' runs split.py in an isolated interpreter
+SEPARATION_MODE = os.environ.get("SEPARATION_MODE", "inprocess")
+NB_STEMS = int(os.environ.get("NB_STEMS", 5))
+
+# Number of stems transcribed concurrently and whether they run in 'thread' or 'process' workers,
+# 'batch' packs the windows of all stems into shared forward passes instead
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", min(5, os.cpu_count() or 1)))
+TRANSCRIBE_EXECUTOR = os.environ.get("TRANSCRIBE_EXECUTOR", "thread")
+
+# Stems are handed to transcription in memory, set KEEP_STEMS=1 to also write them to disk
+KEEP_STEMS = os.environ.get("KEEP_STEMS", "0") == "1"
+STEM_FORMAT = os.environ.get("STEM_FORMAT", "flac")  # 'flac' or 'pcm16'
+
+# Sample rate of the separated stems, same as `split.split_audio`. Kept stems are written at
+# this rate in both separation modes, transcription resamples them to `midi_gen.AUDIO_SAMPLE_RATE`
+SEPARATION_SAMPLE_RATE = 44100
+
+# Chunked, bounded-memory mode for long recordings
+STREAMING = os.environ.get("STREAMING", "0") == "1"
+
+# Process pool is kept alive between jobs so every worker loads the model only once
+_process_pool = None
 
 # RAW_AUDIO_PATH = 'data/raw/busoni_sonata/Busoni_sonata_no2_op_8-BV_61_Scherzo.mp3'
 # PRED_MIDI_PATH = 'output/model_midi/Busoni_sonata_no2_op_8-BV_61_Scherzo_basic_pitch.mid'
@@ -16,7 +48,208 @@ from src.data import postprocess as post_proc
 # TMP_PRED_MIDI_PATH = 'output/model_midi/tmp_pred.mid'
 
 
-def process_audio(audio_file, output_path, format, session_id=None, original_filename=None):
+def warmup_separation():
+    """Load the Spleeter separator before the first job, if separation runs in this process"""
+    if SEPARATION_MODE == "inprocess" and separation_service.is_available():
+        separation_service.warmup(NB_STEMS)
+        print(f" * Spleeter separator ready: {separation_service.stats['load_seconds']}")
+
+
+def _init_transcription_worker(intra_op_threads: int):
+    """
+    Initializer for process workers: cap TensorFlow threads so the workers
+    together do not oversubscribe the CPUs, then load the model once.
+    """
+    os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+    midi_gen.configure_tf_threads(intra_op_threads)
+    midi_gen.warmup_model()
+
+
+def _transcribe_stem(name: str, source, midi_dir: str):
+    """
+    Transcribe a single stem and write its MIDI file.
+
+    `source` is the path of the stem file or the in-memory stem at the model rate.
+    """
+    print(f"Predicting MidiFile for:{name}")
+    if isinstance(source, (str, os.PathLike)):
+        midi, instrument = midi_gen.transcribe_with_optimal_params(
+            wav_path=str(source),
+            output_dir=str(midi_dir)
+        )
+    else:
+        midi, instrument = midi_gen.transcribe_with_optimal_params(
+            wav_path=name,
+            output_dir=str(midi_dir),
+            audio=source
+        )
+    midi.write(os.path.join(midi_dir, f"{name}.mid"))
+    return midi, instrument
+
+
+def _get_executor(max_workers: int, executor: str):
+    global _process_pool
+    if executor == "process":
+        if _process_pool is None:
+            intra_op_threads = max(1, (os.cpu_count() or 1) // max_workers)
+            # TensorFlow is not fork-safe, so workers are spawned
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_transcription_worker,
+                initargs=(intra_op_threads,),
+            )
+        return _process_pool
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+def transcribe_stems(stems, midi_dir: str, session_id=None,
+                     max_workers: int = TRANSCRIBE_WORKERS, executor: str = TRANSCRIBE_EXECUTOR):
+    """
+    Transcribe all stems concurrently.
+
+    Args:
+        stems: Paths to the stem audio files, or a dict stem name -> mono audio
+            already resampled to `midi_gen.AUDIO_SAMPLE_RATE`.
+        midi_dir (str): Directory for the per-stem MIDI files.
+        session_id (str): Progress session to report per-stem progress to.
+        max_workers (int): Number of stems transcribed at the same time.
+        executor (str): 'thread' shares one model in this process,
+            'process' uses a pool of warm worker processes,
+            'batch' runs all stems through one batched model run.
+
+    Returns:
+        tuple[list, list]: MIDI objects and instrument names, in the order of `stems`.
+    """
+    from src.progress_tracker import progress_tracker
+
+    if isinstance(stems, dict):
+        stems = list(stems.items())
+    else:
+        stems = [(Path(path).stem, str(path)) for path in stems]
+    names = [name for name, _ in stems]
+
+    total_stems = len(stems)
+    results = [None] * total_stems
+    if total_stems == 0:
+        return [], []
+
+    if executor == "batch":
+        midis, instrument_names = midi_gen.transcribe_batch_with_optimal_params(
+            [source for _, source in stems], names=names
+        )
+        for name, midi in zip(names, midis):
+            midi.write(os.path.join(midi_dir, f"{name}.mid"))
+            if session_id:
+                progress_tracker.add_artifact(session_id, f"{name}.mid", os.path.join(midi_dir, f"{name}.mid"))
+        if session_id:
+            progress_tracker.update_progress(session_id, 70, f"Generated MIDI for {total_stems} stems")
+        return midis, instrument_names
+
+    pool = _get_executor(max(1, min(max_workers, total_stems)), executor)
+    try:
+        futures = {
+            pool.submit(_transcribe_stem, name, source, str(midi_dir)): i
+            for i, (name, source) in enumerate(stems)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            results[i] = future.result()
+            if session_id:
+                # Every stem can be downloaded as soon as its MIDI is written
+                progress_tracker.add_artifact(session_id, f"{names[i]}.mid", os.path.join(midi_dir, f"{names[i]}.mid"))
+                progress_value = 40 + (done * 30 // total_stems)  # 40-70% for MIDI generation
+                progress_tracker.update_progress(
+                    session_id, progress_value,
+                    f"Generated MIDI for: {names[i]} ({done}/{total_stems})"
+                )
+    finally:
+        if executor != "process":
+            pool.shutdown()
+
+    midis = [midi for midi, _ in results]
+    instrument_names = [instrument for _, instrument in results]
+    return midis, instrument_names
+
+
+def transcribe_streaming(audio_file: str, midi_dir: str, session_id=None):
+    """
+    Transcribe a long recording with `streaming.stream_transcription`.
+
+    Memory stays roughly constant, only the note events are collected. Stems whose
+    mean RMS over all chunks stays below `STREAM_RMS` are dropped, as the batch path
+    drops quiet stems of the whole recording.
+
+    Returns:
+        tuple[list, list]: MIDI objects and instrument names, sorted by stem name.
+    """
+    from src.progress_tracker import progress_tracker
+
+    # Progress moves from 15 to 70 with the transcribed part of the recording
+    duration = librosa.get_duration(path=audio_file) if session_id else None
+    note_events, levels = {}, {}
+    for chunk_end, name, events, level in stream_transcription(audio_file, NB_STEMS):
+        note_events.setdefault(name, []).extend(events)
+        if level is not None:
+            levels.setdefault(name, []).append(level)
+        if session_id:
+            minutes, seconds = divmod(int(chunk_end), 60)
+            progress = 15 + int(55 * min(1.0, chunk_end / duration)) if duration else 40
+            progress_tracker.update_progress(session_id, progress, f"Transcribed up to {minutes:02d}:{seconds:02d}")
+
+    midis, instrument_names = [], []
+    for name in sorted(note_events):
+        if np.mean(levels.get(name, [0.0])) < STREAM_RMS:
+            print(f"Dropping quiet stem {name}")
+            continue
+        midi = notes_to_midi(note_events[name])
+        midi.write(os.path.join(midi_dir, f"{name}.mid"))
+        if session_id:
+            progress_tracker.add_artifact(session_id, f"{name}.mid", os.path.join(midi_dir, f"{name}.mid"))
+        midis.append(midi)
+        instrument_names.append(midi_gen.get_instrument_from_filename(name))
+    return midis, instrument_names
+
+
+def build_download(output_path: str, format: str, original_filename: str = None) -> tuple[str, str]:
+    """
+    Prepare the file served by `/download`, once per job.
+
+    'both' is bundled into a ZIP next to the results: the MIDI file is deflated,
+    the PDF is already compressed and is stored as is.
+
+    Returns:
+        tuple: (path of the file, download name).
+    """
+    name = original_filename or "converted"
+    combined_midi = os.path.join(output_path, "midi", "combined.mid")
+    score_pdf = os.path.join(output_path, "score", "score.pdf")
+    if format == 'midi':
+        return combined_midi, f"{name}.mid"
+    if format == 'pdf':
+        return score_pdf, f"{name}.pdf"
+
+    bundle = os.path.join(output_path, "bundle.zip")
+    with zipfile.ZipFile(bundle + ".tmp", 'w') as zip_file:
+        if os.path.exists(combined_midi):
+            zip_file.write(combined_midi, f"{name}.mid", compress_type=zipfile.ZIP_DEFLATED)
+        if os.path.exists(score_pdf):
+            zip_file.write(score_pdf, f"{name}.pdf", compress_type=zipfile.ZIP_STORED)
+    os.replace(bundle + ".tmp", bundle)
+    return bundle, f"{name}.zip"
+
+
+def _complete(session_id, output_path, format, original_filename):
+    # The download is built by the worker, the web tier only streams it from disk
+    download_path, download_name = build_download(output_path, format, original_filename)
+    if session_id:
+        from src.progress_tracker import progress_tracker
+        progress_tracker.set_session_info(session_id, download_path=download_path, download_name=download_name)
+        progress_tracker.complete_session(session_id)
+
+
+def process_audio(audio_file, output_path, format, session_id=None, original_filename=None, keep_stems=KEEP_STEMS,
+                  use_cache=RESULT_CACHE_ENABLED, streaming=STREAMING):
     from src.progress_tracker import progress_tracker
     
     if session_id:
@@ -27,83 +260,105 @@ def process_audio(audio_file, output_path, format, session_id=None, original_fil
     midi_dir = os.path.join(output_path, "midi")
     score_dir = os.path.join(output_path, "score")
 
-    os.makedirs(stem_dir, exist_ok=True)
     os.makedirs(midi_dir, exist_ok=True)
     os.makedirs(score_dir, exist_ok=True)
     
-    # Store output_dir in progress data for later cleanup
+    # Store output_dir and input file in progress data for later cleanup
     if session_id:
-        progress_tracker._progress_data[session_id]['output_dir'] = output_path
-        progress_tracker._progress_data[session_id]['format'] = format
+        progress_tracker.set_session_info(session_id, output_dir=output_path, input_path=audio_file, format=format)
         if original_filename:
-            progress_tracker._progress_data[session_id]['original_filename'] = original_filename
-
-    '''
-    Split the main audio into seperate instrument stems
-    '''
-    if session_id:
-        progress_tracker.update_progress(session_id, 15, "Splitting audio into instrument stems...")
-        
-    #stems = splt.split_audio(audio_file)
-    subprocess.run([
-        "/content/music_venv310/bin/python3.10", 
-        "src/utils/split.py", 
-        audio_file, 
-        "--remove_drums",
-        "--output", stem_dir,
-    ], check=True)
+            progress_tracker.set_session_info(session_id, original_filename=original_filename)
 
-    if session_id:
-        progress_tracker.update_progress(session_id, 40, "Audio splitting completed, starting MIDI generation...")
+    cache_key = None
+    stems = None
+    if streaming:
+        # Bounded memory: the recording is separated and transcribed chunk by chunk
+        midis, instrument_names = transcribe_streaming(audio_file, midi_dir, session_id)
+    else:
+        in_process = SEPARATION_MODE == "inprocess" and separation_service.is_available()
+        audio_input = audio_file
+        if use_cache:
+            if in_process:
+                # Decoded once: hashed for the cache lookup and then handed to the separation
+                audio = result_cache.load_audio(audio_file)
+                cache_key = result_cache.make_key(audio, nb_stems=NB_STEMS, instrument_params=INSTRUMENT_PARAMS,
+                                                  title=original_filename)
+            else:
+                # The subprocess decodes the file itself, only its bytes are hashed here
+                cache_key = result_cache.make_key(audio_file, nb_stems=NB_STEMS, instrument_params=INSTRUMENT_PARAMS,
+                                                  title=original_filename)
+            if result_cache.restore(cache_key, format, output_path):
+                print(f"Result cache hit: {cache_key}")
+                if session_id:
+                    # Same artifacts as a full run: one MIDI per stem, then the combined one
+                    for name in sorted(os.listdir(midi_dir)):
+                        if name.endswith(".mid") and name != "combined.mid":
+                            progress_tracker.add_artifact(session_id, name, os.path.join(midi_dir, name))
+                    progress_tracker.add_artifact(session_id, "combined.mid", os.path.join(midi_dir, "combined.mid"))
+                _complete(session_id, output_path, format, original_filename)
+                return
+            if in_process:
+                audio_input = audio
 
-    # import tensorflow as tf
-    # tf.keras.backend.clear_session()
-    midis = []
-    instrument_names = []
-    
-    # Count stems for progress calculation
-    stem_files = list(Path(stem_dir).iterdir())
-    total_stems = len(stem_files)
-    
-    for i, wav_path in enumerate(stem_files):
-        name = Path(wav_path).stem
-        print(f"Predicting MidiFile for:{name}")
-        
-        if session_id:
-            progress_value = 40 + (i * 30 // total_stems)  # 40-70% for MIDI generation
-            progress_tracker.update_progress(session_id, progress_value, f"Generating MIDI for: {name}")
-        
         '''
-        Iterate over all stems and generate .mid + score
+        Split the main audio into seperate instrument stems
         '''
-        #wav_path = stem_dir / f"{name}.wav"
-        #sf.write(wav_path, wav, 44100)
-        # Generate MIDI file for this stem
-        midi, instrument = midi_gen.transcribe_with_optimal_params(
-            wav_path=str(wav_path),
-            output_dir=str(midi_dir)
-        )
-        midi.write(os.path.join(midi_dir, f"{name}.mid"))
-        
-        midis.append(midi)
-        instrument_names.append(instrument)
+        if session_id:
+            progress_tracker.update_progress(session_id, 15, "Splitting audio into instrument stems...")
         
+        if in_process:
+            # Stems stay in memory, resampled once to the rate of the transcription model
+            stems = separation_service.separate(
+                audio_input, NB_STEMS, target_sr=None if keep_stems else midi_gen.AUDIO_SAMPLE_RATE
+            )
+            stems.pop('drums', None)
+            stems = dict(sorted(stems.items()))
+            if keep_stems:
+                # Written at the separation rate, like the stems of the subprocess path
+                separation_service.write_stems(stems, stem_dir, SEPARATION_SAMPLE_RATE, STEM_FORMAT)
+                stems = {
+                    name: librosa.resample(y, orig_sr=SEPARATION_SAMPLE_RATE, target_sr=midi_gen.AUDIO_SAMPLE_RATE)
+                    for name, y in stems.items()
+                }
+        else:
+            split_in_subprocess(audio_file, stem_dir, remove_drums=True, nb_stems=NB_STEMS)
+            # Sorted so the part order of the combined MIDI is stable
+            stems = sorted(Path(stem_dir).iterdir())
+
+        if session_id:
+            progress_tracker.update_progress(session_id, 40, "Audio splitting completed, starting MIDI generation...")
+
+        # import tensorflow as tf
+        # tf.keras.backend.clear_session()
+
+        midis, instrument_names = transcribe_stems(stems, midi_dir, session_id)
+
     if session_id:
         progress_tracker.update_progress(session_id, 75, "Combining MIDI files...")
 
+    # Combine all generated MIDI files into one, published before the slower score rendering
+    combined_midi = os.path.join(midi_dir, "combined.mid")
+    midi_gen.combine_midis(midis, instrument_names).write(combined_midi)
+    if session_id:
+        progress_tracker.add_artifact(session_id, "combined.mid", combined_midi)
+
     if session_id:
         progress_tracker.update_progress(session_id, 85, "Generating score from MIDI...")
 
     # Generate score from MIDI and save in `score_dir`
     # Always generate PDF for 'both' format, or when specifically requested
     if format in ['pdf', 'both']:
-        post_proc.multi_midi_treatment(midi_dir, score_dir, original_filename)
+        # Parts are built from the in-memory transcriptions, not from the MIDI files just written
+        post_proc.score_from_midis(midis, instrument_names, score_dir, original_filename)
 
-    # Combine all generated MIDI files into one
-    midi_gen.combine_midis(midis, instrument_names).write(os.path.join(midi_dir, "combined.mid"))
-    
-    if session_id:
-        progress_tracker.complete_session(session_id)
+    if cache_key:
+        result_cache.store(
+            cache_key, output_path,
+            stems=stems if isinstance(stems, dict) else None,
+            stems_sr=midi_gen.AUDIO_SAMPLE_RATE,
+        )
+
+    _complete(session_id, output_path, format, original_filename)
 
 
 if __name__=='__main__':
@@ -113,6 +368,7 @@ if __name__=='__main__':
     parser.add_argument('input', type=str, help='Path to the input audio file')
     parser.add_argument('--output', type=str, required=False, default='output/')
     parser.add_argument('--format', type=str, choices=['midi', 'pdf', 'both'], required=False, default='midi')
+    parser.add_argument('--streaming', action='store_true', help='Process long recordings chunk by chunk')
     args = parser.parse_args()
 
-    process_audio(args.input, args.output, args.format)
+    process_audio(args.input, args.output, args.format, streaming=args.streaming or STREAMING)
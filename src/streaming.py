@@ -0,0 +1,203 @@
+import os
+import subprocess
+from typing import Iterator, Optional
+
+import numpy as np
+import librosa
+import pretty_midi
+
+from src.model import midi_generator as midi_gen
+from src.model.model_parameter import INSTRUMENT_PARAMS
+from src.utils.separation_service import separation_service
+
+# Audio is processed in chunks of this length, with extra context on both sides
+STREAM_CHUNK_SECONDS = float(os.environ.get("STREAM_CHUNK_SECONDS", 30.0))
+STREAM_OVERLAP_SECONDS = float(os.environ.get("STREAM_OVERLAP_SECONDS", 2.0))
+
+# Sample rate of the separation, same as `split.split_audio`
+STREAM_SR = 44100
+
+# Stems are kept if their mean RMS over all chunks reaches this, like `split.RMS_DEFAULT` for a whole recording
+STREAM_RMS = float(os.environ.get("STREAM_RMS", 0.005))
+
+# Notes ending this close to the end of their window may have been cut off there and are continued in the next chunk
+OPEN_NOTE_TOLERANCE = 0.1
+
+
+def iter_audio_chunks(
+        audio_file: str,
+        chunk_seconds: float = STREAM_CHUNK_SECONDS,
+        overlap_seconds: float = STREAM_OVERLAP_SECONDS,
+        sr: int = STREAM_SR,
+    ) -> Iterator[tuple[float, float, float, np.ndarray]]:
+    """
+    Decode an audio file piece by piece with ffmpeg and yield overlapping chunks.
+
+    Only the current chunk, the tail of the previous one and the head of the next
+    one are held in memory, independent of the length of the recording.
+
+    Yields:
+        tuple: (chunk start, chunk end, window start, window) with times in seconds.
+            The window covers the chunk plus up to `overlap_seconds` of context on each side.
+    """
+    chunk_len = int(chunk_seconds * sr)
+    overlap_len = int(overlap_seconds * sr)
+    process = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-i", audio_file, "-f", "f32le", "-ac", "1", "-ar", str(sr), "-"],
+        stdout=subprocess.PIPE,
+    )
+
+    def read_chunk() -> np.ndarray:
+        data = process.stdout.read(chunk_len * 4)
+        return np.frombuffer(data, dtype=np.float32)
+
+    try:
+        previous_tail = np.zeros(0, dtype=np.float32)
+        current = read_chunk()
+        chunk_start = 0
+        while len(current):
+            following = read_chunk()
+            window = np.concatenate([previous_tail, current, following[:overlap_len]])
+            yield (
+                chunk_start / sr,
+                (chunk_start + len(current)) / sr,
+                (chunk_start - len(previous_tail)) / sr,
+                window,
+            )
+            previous_tail = current[-overlap_len:] if overlap_len else np.zeros(0, dtype=np.float32)
+            chunk_start += len(current)
+            current = following
+    finally:
+        process.stdout.close()
+        process.wait()
+    if process.returncode:
+        raise RuntimeError(f"ffmpeg failed to decode {audio_file}")
+
+
+def merge_chunk_notes(
+        open_notes: list,
+        events: list,
+        chunk_start: float,
+        chunk_end: float,
+        window_end: float,
+        tolerance: float = OPEN_NOTE_TOLERANCE,
+    ) -> tuple[list, list]:
+    """
+    Assign the notes of one window to its chunk and join notes sustained across chunk boundaries.
+
+    Notes starting in the chunk belong to it. A note reaching the end of the window
+    may continue beyond it, so it stays open. The next window sees the same note
+    starting in its leading overlap: its end replaces the cut-off end of the open
+    note, extending it however far it sustains past the boundary, or trimming it
+    if the note actually ended earlier.
+
+    Args:
+        open_notes (list): Notes left open by the previous chunk.
+        events (list): Note events (start, end, pitch, amplitude, pitch_bends) of this window, absolute times.
+        chunk_start (float): Start of the chunk in seconds.
+        chunk_end (float): End of the chunk in seconds.
+        window_end (float): End of the window, i.e. the chunk plus its trailing context.
+        tolerance (float): Slack in seconds for notes cut off at the window end.
+
+    Returns:
+        tuple: (finished notes, notes still open at the end of this window), both as note event tuples.
+    """
+    open_notes = [list(note) for note in open_notes]
+    continued = set()
+    # Latest onsets first: of several same-pitch notes in the overlap, the last one is the sustained note
+    for event in sorted((event for event in events if event[0] < chunk_start), key=lambda event: -event[0]):
+        start, end, pitch = event[:3]
+        # Emitted with the previous chunk, only gives the real end of a note cut off there
+        for i, note in enumerate(open_notes):
+            if i not in continued and note[2] == pitch and start <= note[1] + tolerance:
+                note[1] = end
+                continued.add(i)
+                break
+    new_notes = [list(event) for event in events if chunk_start <= event[0] < chunk_end]
+
+    finished, still_open = [], []
+    for i, note in enumerate(open_notes):
+        if i in continued and note[1] >= window_end - tolerance:
+            still_open.append(tuple(note))
+        else:
+            finished.append(tuple(note))
+    for note in new_notes:
+        (still_open if note[1] >= window_end - tolerance else finished).append(tuple(note))
+    return finished, still_open
+
+
+def stream_transcription(
+        audio_file: str,
+        nb_stems: int = 5,
+        remove_drums: bool = True,
+        chunk_seconds: float = STREAM_CHUNK_SECONDS,
+        overlap_seconds: float = STREAM_OVERLAP_SECONDS,
+    ) -> Iterator[tuple[float, str, list, Optional[float]]]:
+    """
+    Separate and transcribe a recording chunk by chunk.
+
+    Every chunk is separated with the warm Spleeter separator and its stems are
+    transcribed in one batched model run, with the context of the neighbouring
+    chunks. Every note is emitted once, by the chunk it starts in; notes sustained
+    across a chunk boundary are joined, see `merge_chunk_notes`. Activations are
+    not cached here.
+
+    Noise reduction runs per window, the overlap gives it the context of the
+    neighbouring chunks. The RMS stem filter of `split.split_audio` would decide per
+    chunk, so it is turned off: every stem is transcribed in every chunk and its RMS
+    is reported instead, the caller drops quiet stems over the whole recording
+    (see `STREAM_RMS`).
+
+    Yields:
+        tuple: (chunk end in seconds, stem name, note events with absolute times, mean RMS of the
+            stem in this chunk). Note events are (start, end, pitch, amplitude, pitch_bends) as
+            produced by basic-pitch. After the last chunk, the notes still open are flushed
+            with an RMS of None.
+    """
+    open_notes = {}
+    chunk_end = 0.0
+    for chunk_start, chunk_end, window_start, window in iter_audio_chunks(audio_file, chunk_seconds, overlap_seconds):
+        stems = separation_service.separate(window, nb_stems, target_sr=midi_gen.AUDIO_SAMPLE_RATE, rms=0.0)
+        if remove_drums:
+            stems.pop('drums', None)
+        if not stems:
+            continue
+
+        window_end = window_start + len(window) / STREAM_SR
+        sr = midi_gen.AUDIO_SAMPLE_RATE
+        names = sorted(stems)
+        outputs = midi_gen.get_model_outputs([stems[name] for name in names], use_cache=False)
+        for name, output in zip(names, outputs):
+            params = INSTRUMENT_PARAMS[midi_gen.get_instrument_from_filename(name)]
+            _, note_events = midi_gen.decode_notes(output, **params)
+            shifted = [
+                (start + window_start, end + window_start, pitch, amplitude, bends)
+                for start, end, pitch, amplitude, bends in note_events
+            ]
+            finished, open_notes[name] = merge_chunk_notes(
+                open_notes.get(name, []), shifted, chunk_start, chunk_end, window_end
+            )
+            chunk = stems[name][int((chunk_start - window_start) * sr):int((chunk_end - window_start) * sr)]
+            level = float(np.mean(librosa.feature.rms(y=chunk))) if len(chunk) else 0.0
+            yield chunk_end, name, finished, level
+
+    for name, notes in open_notes.items():
+        if notes:
+            yield chunk_end, name, notes, None
+
+
+def notes_to_midi(note_events: list) -> pretty_midi.PrettyMIDI:
+    """
+    Build a single-instrument MIDI object from basic-pitch note events.
+    """
+    midi = pretty_midi.PrettyMIDI()
+    inst = pretty_midi.Instrument(program=0)
+    for start, end, pitch, amplitude, _ in sorted(note_events, key=lambda event: event[0]):
+        inst.notes.append(pretty_midi.Note(
+            velocity=int(np.round(127 * amplitude)),
+            pitch=int(pitch),
+            start=float(start),
+            end=float(end),
+        ))
+    midi.instruments.append(inst)
+    return midi
@@ -0,0 +1,146 @@
+import numpy as np
+
+from src.utils.note_array import NoteArray
+from src.utils.note_matching import note_columns, match_f1
+
+# Pitches whose onset rolls are transformed together, bounds the memory of long pieces
+PITCH_CHUNK = 16
+
+
+def onset_roll(pitch: np.ndarray, start: np.ndarray, pitches: np.ndarray, origin: float, n_bins: int,
+               step: float, width: int = 0) -> np.ndarray:
+    """
+    Count onsets per pitch and time bin.
+
+    Args:
+        pitch (np.ndarray): Pitch of every note.
+        start (np.ndarray): Onset of every note in seconds.
+        pitches (np.ndarray): Sorted pitches that get a row, notes of other pitches are dropped.
+        origin (float): Time of the first bin in seconds.
+        n_bins (int): Number of time bins.
+        step (float): Bin size in seconds.
+        width (int): Spread every onset over `width` bins on each side, to tolerate small timing errors.
+
+    Returns:
+        np.ndarray: Roll of shape (len(pitches), n_bins).
+    """
+    roll = np.zeros((len(pitches), n_bins))
+    row = np.searchsorted(pitches, pitch)
+    keep = (row < len(pitches)) & (pitches[np.minimum(row, len(pitches) - 1)] == pitch)
+    bins = np.round((start[keep] - origin) / step).astype(np.int64)
+    np.add.at(roll, (row[keep], np.clip(bins, 0, n_bins - 1)), 1.0)
+    if width:
+        # Box filter along time via a cumulative sum
+        padded = np.pad(np.cumsum(roll, axis=1), ((0, 0), (width + 1, width)), mode='edge')
+        padded[:, :width + 1] = 0
+        roll = padded[:, 2 * width + 1:] - padded[:, :-2 * width - 1]
+    return roll
+
+
+def cross_correlation(pred, gt, max_offset: float, step: float, tolerance: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Onset agreement of the predicted and ground truth notes for every offset in `[-max_offset, max_offset]`.
+
+    Both note lists are binned into per-pitch onset rolls at `step` resolution and
+    correlated with the FFT, summing the spectra over all pitches before a single
+    inverse transform.
+
+    Args:
+        pred (tuple): Pitch, start and end arrays of the predicted notes, see `note_matching.note_columns`.
+        gt (tuple): Pitch, start and end arrays of the ground truth notes.
+        max_offset (float): Largest offset in seconds.
+        step (float): Offset resolution in seconds.
+        tolerance (float): Onsets closer than this in seconds still count as agreeing.
+
+    Returns:
+        tuple: Offsets in seconds, ascending, and the correlation at each offset.
+    """
+    pred_pitch, pred_start, _ = pred
+    gt_pitch, gt_start, _ = gt
+    max_lag = int(round(max_offset / step))
+    lags = np.arange(-max_lag, max_lag + 1)
+    pitches = np.intersect1d(pred_pitch, gt_pitch)
+    if not len(pitches):
+        return lags * step, np.zeros(len(lags))
+
+    origin = min(pred_start.min(), gt_start.min())
+    n_bins = int(np.ceil((max(pred_start.max(), gt_start.max()) - origin) / step)) + 1
+    # Lags up to max_lag must not wrap around
+    n_fft = 1 << int(np.ceil(np.log2(n_bins + max_lag + 1)))
+    # Spreading both rolls by half the tolerance gives a triangular peak of half-width `tolerance`
+    width = int(round(tolerance / step / 2))
+
+    spectrum = np.zeros(n_fft // 2 + 1, dtype=np.complex128)
+    for i in range(0, len(pitches), PITCH_CHUNK):
+        chunk = pitches[i:i + PITCH_CHUNK]
+        gt_roll = onset_roll(gt_pitch, gt_start, chunk, origin, n_bins, step, width)
+        pred_roll = onset_roll(pred_pitch, pred_start, chunk, origin, n_bins, step, width)
+        spectrum += np.sum(np.fft.rfft(gt_roll, n_fft) * np.conj(np.fft.rfft(pred_roll, n_fft)), axis=0)
+
+    correlation = np.fft.irfft(spectrum, n_fft)
+    # Index k holds lag k, negative lags wrap to the end
+    return lags * step, correlation[lags % n_fft]
+
+
+def find_offset(predicted_notes, ground_truth_notes, max_offset: float = 2.0, step: float = 0.01,
+                tolerance: float = 0.05, min_overlap: float = 0.25) -> tuple[float, dict]:
+    """
+    Find the time offset that, added to the predicted notes, best aligns them with the ground truth.
+
+    The coarse offset is the peak of the onset cross-correlation, see `cross_correlation`.
+    It is refined by computing the matched F1 score (`note_matching.match_f1`) for the
+    offsets within `tolerance` of the peak and for no offset at all, so the result is never
+    worse than leaving the notes as they are.
+
+    Args:
+        predicted_notes (NoteArray | list[dict]): Predicted notes with keys 'pitch', 'start' and 'end'.
+        ground_truth_notes (NoteArray | list[dict]): Ground truth notes with keys 'pitch', 'start' and 'end'.
+        max_offset (float): Largest offset in seconds, in either direction.
+        step (float): Offset resolution in seconds.
+        tolerance (float): Onset tolerance of the correlation and refinement window in seconds.
+        min_overlap (float): Required overlap for a match, see `note_matching.match_f1`.
+
+    Returns:
+        tuple: Offset in seconds and the F1 result at that offset.
+    """
+    if step <= 0:
+        raise ValueError(f"step must be positive, got {step}")
+    pred = note_columns(predicted_notes)
+    gt = note_columns(ground_truth_notes)
+    pitch, start, end = pred
+
+    def score(offset: float) -> dict:
+        return match_f1(NoteArray(pitch, np.zeros(len(pitch)), start + offset, end + offset),
+                        ground_truth_notes, min_overlap)
+
+    if not len(start) or not len(gt[0]):
+        return 0.0, score(0.0)
+
+    offsets, correlation = cross_correlation(pred, gt, max_offset, step, tolerance)
+    # Among equal peaks prefer the smallest shift
+    peaks = np.flatnonzero(correlation >= correlation.max() - 1e-6)
+    coarse = offsets[peaks[np.argmin(np.abs(offsets[peaks]))]]
+
+    window = int(round(tolerance / step))
+    candidates = coarse + step * np.arange(-window, window + 1)
+    candidates = np.round(candidates[np.abs(candidates) <= max_offset + step / 2] / step) * step
+    best_offset, best = 0.0, score(0.0)
+    for offset in sorted(candidates, key=lambda o: abs(o - coarse)):
+        result = score(float(offset))
+        if result["f1_score"] > best["f1_score"]:
+            best_offset, best = float(offset), result
+    return best_offset, best
+
+
+def align_notes(predicted_notes, ground_truth_notes, max_offset: float = 2.0, step: float = 0.01,
+                tolerance: float = 0.05, min_overlap: float = 0.25):
+    """
+    Shift the predicted notes by the offset of `find_offset`.
+
+    Returns:
+        tuple: Offset in seconds and the shifted notes, a `NoteArray` if one was given, else a list of dicts.
+    """
+    offset, _ = find_offset(predicted_notes, ground_truth_notes, max_offset, step, tolerance, min_overlap)
+    if isinstance(predicted_notes, NoteArray):
+        return offset, predicted_notes.shifted(offset)
+    return offset, [{**note, "start": note["start"] + offset, "end": note["end"] + offset} for note in predicted_notes]
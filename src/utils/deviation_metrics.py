@@ -0,0 +1,68 @@
+import numpy as np
+
+from src.utils.note_matching import note_columns
+
+
+def nearest_onsets(pred_start: np.ndarray, gt_start: np.ndarray) -> np.ndarray:
+    """
+    Index of the ground truth note with the closest onset for every predicted onset.
+
+    The ground truth onsets are sorted once and searched with `searchsorted`.
+    Ties go to the note that comes first in `gt_start`, like `np.argmin` over
+    the distances.
+
+    Returns:
+        np.ndarray: Indices into `gt_start`.
+    """
+    order = np.argsort(gt_start, kind='stable')
+    sorted_start = gt_start[order]
+    right = np.searchsorted(sorted_start, pred_start, side='left')
+    left = np.maximum(right - 1, 0)
+    # With equal onsets the first one in the stable order has the lowest original index
+    left = np.searchsorted(sorted_start, sorted_start[left], side='left')
+    right = np.minimum(right, len(sorted_start) - 1)
+
+    left_dist = np.abs(sorted_start[left] - pred_start)
+    right_dist = np.abs(sorted_start[right] - pred_start)
+    use_left = (left_dist < right_dist) | ((left_dist == right_dist) & (order[left] < order[right]))
+    return order[np.where(use_left, left, right)]
+
+
+def deviation_metrics(pred_notes, gt_notes, match_window: float = 0.1, binsize: float = 2.0) -> dict:
+    """
+    Pitch, onset, duration and density deviation in one pass.
+
+    Computes the same values as `evaluation.pitch_deviation`, `onset_deviation`,
+    `duration_deviation` and `density_deviation`, but finds the nearest ground
+    truth note of every predicted note only once, on columnar arrays.
+
+    Args:
+        pred_notes (list[dict]): Predicted notes with keys 'pitch', 'start' and 'end'.
+        gt_notes (list[dict]): Ground truth notes with keys 'pitch', 'start' and 'end'.
+        match_window (float): Maximum onset distance in seconds for the pitch deviation.
+        binsize (float): Bin size in seconds for the density deviation.
+
+    Returns:
+        dict: pitch_deviation, onset_deviation, duration_deviation and density_deviation.
+    """
+    metrics = dict.fromkeys(["pitch_deviation", "onset_deviation", "duration_deviation", "density_deviation"], np.nan)
+    if not len(pred_notes) or not len(gt_notes):
+        return metrics
+
+    pred_pitch, pred_start, pred_end = note_columns(pred_notes)
+    gt_pitch, gt_start, gt_end = note_columns(gt_notes)
+
+    nearest = nearest_onsets(pred_start, gt_start)
+    onset_diffs = np.abs(gt_start[nearest] - pred_start)
+    in_window = onset_diffs <= match_window
+    if in_window.any():
+        metrics["pitch_deviation"] = np.mean(np.abs(pred_pitch[in_window] - gt_pitch[nearest[in_window]]))
+    metrics["onset_deviation"] = np.mean(onset_diffs)
+    metrics["duration_deviation"] = np.mean(np.abs((pred_end - pred_start) - (gt_end - gt_start)[nearest]))
+
+    total_duration = max(pred_start.max(), gt_start.max(), 0)
+    bins = np.arange(0, total_duration + binsize, binsize)
+    gt_hist, _ = np.histogram(gt_start, bins=bins)
+    pred_hist, _ = np.histogram(pred_start, bins=bins)
+    metrics["density_deviation"] = np.mean(np.abs(gt_hist - pred_hist))
+    return metrics
@@ -1,4 +1,7 @@
 from src.utils import midi_loading as ml
+from src.utils import note_matching as nm
+from src.utils import deviation_metrics as dm
+from src.utils import alignment as al
 import numpy as np
 import librosa 
 
@@ -18,7 +21,34 @@ def f1_score(precision: float, recall: float) -> float:
     return 2 * (precision * recall) / (precision + recall)
 
 def f1_score_with_overlap(predicted_notes: dict, ground_truth_notes: dict, tolerance:float=3, min_overlap:float=0.25) -> dict:
+    """
+    Calculate the F1 score with overlap tolerance for predicted and ground truth notes.
+
+    A predicted note matches a ground truth note of the same pitch that overlaps it by at least
+    `min_overlap` times the shorter note's duration. Every note is matched at most once and the
+    number of matches is maximized, see `note_matching.match_notes`.
+
+    Args:
+        predicted_notes (dict): Dictionary of predicted notes with keys 'pitch', 'start', 'end', and 'instrument'.
+        ground_truth_notes (dict): Dictionary of ground truth notes with keys 'pitch', 'start', 'end', and 'instrument'.
+        tolerance (float): Tolerance for overlap in seconds (unused).
+        min_overlap (float): Minimum overlap required to consider a note as true positive. given as a percentage of the shorter note's duration.
+
+    Returns:
+        dict: A dictionary containing the F1 score, precision, and recall.
+    """
+    try:
+        result = nm.match_f1(predicted_notes, ground_truth_notes, min_overlap)
+    except Exception as e:
+        raise ValueError(f"Error calculating F1 score with overlap and instruments: {e}")
+    print(f"True Positives: {result['true_positives']}, False Positives: {result['false_positives']}, False Negatives: {result['false_negatives']}")
+    return result
+
+def f1_score_with_overlap_naive(predicted_notes: dict, ground_truth_notes: dict, tolerance:float=3, min_overlap:float=0.25) -> dict:
     """    
+        Original nested-loop version of `f1_score_with_overlap`, kept as benchmark reference.
+        A ground truth note can be matched by several predicted notes here.
+
         Calculate the F1 score with overlap tolerance for predicted and ground truth notes.
         This function compares predicted notes with ground truth notes, allowing for a specified tolerance in start and end times,
         and a minimum overlap duration to consider a note as a true positive.
@@ -100,19 +130,24 @@ def f1_score_with_overlap(predicted_notes: dict, ground_truth_notes: dict, toler
     except Exception as e:
         raise ValueError(f"Error calculating F1 score with overlap and instruments: {e}")
 
-def align_notes(predicted_notes:dict, ground_truth_notes:dict, max_offset=2.0, step=0.01)-> tuple[float, float, dict]:
+def align_notes(predicted_notes:dict, ground_truth_notes:dict, max_offset=2.0, step=0.01)-> tuple[float, list[dict]]:
     """
     Align the MIDI File to the Ground Truth File to achieve maximum F1 Score.
 
+    The offset is searched by onset cross-correlation and refined with the note matcher,
+    see `alignment.find_offset`.
+
     Args:
         predicted_notes (dict): Dictionary of predicted notes with keys 'pitch', 'start', 'end', and 'instrument'.
         ground_truth_notes (dict): Dictionary of ground truth notes with keys 'pitch', 'start', 'end', and 'instrument'.
-        max_offset (float): Maximum allowed note offset
+        max_offset (float): Maximum allowed note offset in seconds
+        step (float): Resolution of the offset search in seconds
+
+    Returns:
+        tuple: Offset added to the predicted notes and the shifted predicted notes.
     """
-        # Angenommen, beide Listen sind nach Startzeit sortiert:
-    offset = notes_gt[0]['start'] - notes_prd[0]['start']
-    notes_prd_aligned = [{**note, "start": note["start"] + offset, "end": note["end"] + offset} for note in notes_prd]
-    return offset, notes_prd_aligned
+    return al.align_notes(predicted_notes, ground_truth_notes, max_offset=max_offset, step=step)
+
 def pitch_deviation(pred_notes: list[dict], gt_notes: list[dict], match_window=0.1):
     """
     Computes the average absolute pitch difference between matched predicted and ground truth notes.
@@ -180,6 +215,35 @@ def density_deviation(pred_notes: list[dict], gt_notes: list[dict], binsize=2.0)
 
 
 
+def evaluate_notes(predicted_notes, ground_truth_notes, tolerance_note: float=0.1, overlap_note: float=0.1) -> dict:
+    """
+    Evaluate predicted notes against ground truth notes.
+
+    Args:
+        predicted_notes (NoteArray | list[dict]): Predicted notes.
+        ground_truth_notes (NoteArray | list[dict]): Ground truth notes.
+    Returns:
+        dict: F1 score, precision, recall, true/false positives, false negatives and deviation metrics.
+    """
+    try:
+        f1 = f1_score_with_overlap(predicted_notes, ground_truth_notes, tolerance=tolerance_note, min_overlap=overlap_note)
+        # Nearest ground truth notes are searched once for all four deviations
+        metrics = dm.deviation_metrics(predicted_notes, ground_truth_notes)
+        return {
+            "f1_score": f1['f1_score'],
+            "precision": f1['precision'],
+            "recall": f1['recall'],
+            "false_negatives": f1['false_negatives'],
+            "false_positives": f1['false_positives'],   
+            "true_positives": f1['true_positives'],
+            "pitch_deviation": metrics["pitch_deviation"],
+            "onset_deviation": metrics["onset_deviation"],
+            "duration_deviation": metrics["duration_deviation"],
+            "density_deviation": metrics["density_deviation"],
+        }
+    except Exception as e:
+        raise ValueError(f"Error calculating F1-Score: {e}")
+
 def evaluate_midi(midi_path_pred: str, midi_path_ground_truth: str, tolerance_note: float=0.1, overlap_note: float=0.1) -> dict:
     """
     Evaluate a MIDI file against ground truth data, considering instruments.
@@ -191,15 +255,14 @@ def evaluate_midi(midi_path_pred: str, midi_path_ground_truth: str, tolerance_no
         dict: A dictionary containing evaluation metrics per instrument.
     """
     try:
-        predicted_data = ml.load_midi(midi_path_pred)
-        ground_truth_data = ml.load_midi(midi_path_ground_truth)
+        # The ground truth is read through the note cache, predictions are usually new files
+        predicted_notes = ml.load_notes(midi_path_pred, cache=False)
+        ground_truth_notes = ml.load_notes(midi_path_ground_truth)
 
     except Exception as e:
         raise ValueError(f"Error loading MIDI files: {e}")
     
     try:
-        predicted_notes = ml.extract_all_notes(predicted_data)
-        ground_truth_notes = ml.extract_all_notes(ground_truth_data)
         #PAUSE = input("Press Enter to continue...")
         # Export notes to CSV files for further analysis
         print('===============================================')
@@ -209,37 +272,17 @@ def evaluate_midi(midi_path_pred: str, midi_path_ground_truth: str, tolerance_no
         #PAUSE = input("Press Enter to continue...")
         #print(predicted_notes)
         #print(ground_truth_notes)
-        if not predicted_notes or not ground_truth_notes:
+        if not len(predicted_notes) or not len(ground_truth_notes):
             raise ValueError("No notes found in one of the MIDI files.")
         
     except Exception as e:
         raise ValueError(f"Error extracting notes from MIDI files: {e}")      
 
-    try:
-        f1 = f1_score_with_overlap(predicted_notes, ground_truth_notes, tolerance=tolerance_note, min_overlap=overlap_note)
-        metrics = {
-        "pitch_deviation": pitch_deviation(predicted_notes, ground_truth_notes),
-        "onset_deviation": onset_deviation(predicted_notes, ground_truth_notes),
-        "duration_deviation": duration_deviation(predicted_notes, ground_truth_notes),
-        "density_deviation": density_deviation(predicted_notes, ground_truth_notes),
-}
-        return {
-            "f1_score": f1['f1_score'],
-            "predicted_midi": midi_path_pred,
-            "ground_truth": midi_path_ground_truth,
-            "precision": f1['precision'],
-            "recall": f1['recall'],
-            "false_negatives": f1['false_negatives'],
-            "false_positives": f1['false_positives'],   
-            "true_positives": f1['true_positives'],
-            "pitch_deviation": pitch_deviation(predicted_notes, ground_truth_notes),
-            "onset_deviation": onset_deviation(predicted_notes, ground_truth_notes),
-            "duration_deviation": duration_deviation(predicted_notes, ground_truth_notes),
-            "density_deviation": density_deviation(predicted_notes, ground_truth_notes),
-
-        }
-    except Exception as e:
-        raise ValueError(f"Error calculating F1-Score: {e}")
+    return {
+        "predicted_midi": midi_path_pred,
+        "ground_truth": midi_path_ground_truth,
+        **evaluate_notes(predicted_notes, ground_truth_notes, tolerance_note, overlap_note),
+    }
 
 if __name__ == "__main__":
     # Example usage
@@ -1,5 +1,7 @@
 import pretty_midi 
 import pandas as pd
+from src.utils.note_array import NoteArray
+from src.utils.note_cache import note_cache
 def extract_notes_(midi_data: pretty_midi.PrettyMIDI) -> dict[str, list]:
     """
     Extract notes from a PrettyMIDI object.
@@ -60,16 +62,48 @@ def get_midi_instrument_names(midi_data: pretty_midi.PrettyMIDI) -> list[str]:
     """
     return [instrument.name for instrument in midi_data.instruments if instrument.is_drum is False]
 
-def extract_all_notes(midi_data: pretty_midi.PrettyMIDI) -> list[dict]:
+def load_notes(midi_path: str, cache: bool = True) -> NoteArray:
+    """
+    Load the notes of a MIDI file into a `NoteArray`, through the on-disk note cache.
+
+    A file whose content was loaded before is read from the cache as memory maps
+    instead of being parsed again, see `note_cache.NoteCache`.
+
+    Args:
+        midi_path (str): Path to the MIDI file.
+        cache (bool): Use the note cache. Turn it off for files that are read only once, e.g. fresh predictions.
+
+    Returns:
+        NoteArray: The notes of all non-drum instruments, sorted by start time. May be empty.
+    """
+    if not (cache and note_cache.enabled):
+        return NoteArray.from_midi(load_midi(midi_path))
+    try:
+        key = note_cache.make_key(midi_path)
+    except OSError as e:
+        raise ValueError(f"Error loading MIDI file: {e}")
+    notes = note_cache.load(key)
+    if notes is None:
+        notes = NoteArray.from_midi(load_midi(midi_path))
+        note_cache.store(key, notes)
+    return notes
+
+def extract_all_notes(midi_data: pretty_midi.PrettyMIDI | str) -> list[dict]:
     """
     Extract notes from a PrettyMIDI object.
 
     Args:
-        midi_data (pretty_midi.PrettyMIDI): A PrettyMIDI object representing the MIDI file.
+        midi_data (pretty_midi.PrettyMIDI | str): A PrettyMIDI object representing the MIDI file,
+            or the path of a MIDI file, which is then read through the note cache (see `load_notes`).
 
     Returns:
         list[dict]: A list of dictionaries containing note information (pitch, velocity, start, end).
     """
+    if isinstance(midi_data, str):
+        all_notes = load_notes(midi_data).to_dicts()
+        if not all_notes:
+            raise ValueError("No notes found in the MIDI file.")
+        return all_notes
     all_notes = []
     print(f"Extracting Notes ...")
     for instrument in midi_data.instruments:
@@ -91,16 +125,32 @@ def extract_all_notes(midi_data: pretty_midi.PrettyMIDI) -> list[dict]:
     # print(all_notes)
     return all_notes
 
-def export_notes_to_csv(notes: list[dict], csv_path: str):
+def extract_note_array(midi_data: pretty_midi.PrettyMIDI | str) -> NoteArray:
+    """
+    Extract notes from a PrettyMIDI object into a columnar `NoteArray`.
+
+    Args:
+        midi_data (pretty_midi.PrettyMIDI | str): A PrettyMIDI object representing the MIDI file,
+            or the path of a MIDI file, which is then read through the note cache (see `load_notes`).
+
+    Returns:
+        NoteArray: The notes of all non-drum instruments, sorted by start time.
+    """
+    notes = load_notes(midi_data) if isinstance(midi_data, str) else NoteArray.from_midi(midi_data)
+    if not len(notes):
+        raise ValueError("No notes found in the MIDI file.")
+    return notes
+
+def export_notes_to_csv(notes: list[dict] | NoteArray, csv_path: str):
     """
     Export notes to a CSV file.
 
     Args:
-        notes (list[dict]): A list of dictionaries containing note information (pitch, velocity, start, end).
+        notes (list[dict] | NoteArray): Notes as a list of dictionaries (pitch, velocity, start, end) or a `NoteArray`.
         csv_path (str): Path to the output CSV file.
     """
 
-    df = pd.DataFrame(notes)
+    df = pd.DataFrame(notes.to_dict() if isinstance(notes, NoteArray) else notes)
     df.to_csv(csv_path, index=False, sep=";", decimal=",")
     print(f"Notes exported to {csv_path}")
 
@@ -5,6 +5,8 @@ from optuna import Trial
 from optuna.samplers import TPESampler  
 from optuna import visualization as vis
 #import model.midi_generator
+from src.model import midi_generator as midi_gen
+from src.model.activation_cache import activation_cache
 from src.utils import evaluation
 from src.utils import midi_loading
 
@@ -26,6 +28,33 @@ TMP_PRED_MIDI_PATH = 'output/model_midi/tmp_pred.mid'
 def plot_callback(study, trial):
     vis.plot_optimization_history(study).show()
 
+_gt_notes = None
+_activation_key = None
+
+
+def get_ground_truth_notes():
+    """Notes of `GT_MIDI_PATH`, extracted once for all trials"""
+    global _gt_notes
+    if _gt_notes is None:
+        _gt_notes = midi_loading.extract_note_array(GT_MIDI_PATH)
+    return _gt_notes
+
+
+def get_activation_key() -> str:
+    """
+    Activation cache key of `RAW_AUDIO_PATH`, computed once per study.
+
+    Runs the network if the activations are not cached yet, after that a trial only decodes notes.
+    """
+    global _activation_key
+    if _activation_key is None:
+        audio = midi_gen.load_model_audio(RAW_AUDIO_PATH)
+        _activation_key = activation_cache.audio_key(audio)
+        if activation_cache.load(_activation_key) is None:
+            midi_gen.get_model_outputs([audio], use_cache=True)
+    return _activation_key
+
+
 def objective_F1(trial: Trial,hyperparameter:dict ,search_space: dict, experiment_name: str, OUTPUT_PATH:str='output/optimization') -> float:
     """
     Optimize the model parameters using Optuna.
@@ -129,19 +158,18 @@ def objective_F1(trial: Trial,hyperparameter:dict ,search_space: dict, experimen
         f"\033[35mTolerance:\033[0m \033[1m{tolerance}\033[0m, "
         f"\033[36mMinimum Overlap:\033[0m \033[1m{min_overlap}\033[0m\n"
     )    
-    # Predict the MIDI file using the model with the given hyperparameters
-    _, midi_data, _ = predict(
-        audio_path= RAW_AUDIO_PATH,
+    # Decode the cached activations with the given hyperparameters, the network ran once per study
+    midi_data = midi_gen.redecode_midi(
+        get_activation_key(),
         onset_threshold=params['onset_threshold'],
         frame_threshold=params['frame_threshold'],
-        minimum_note_length=params['minimum_note_length'],
-        model_or_model_path=ICASSP_2022_MODEL_PATH
+        minimum_note_length=params['minimum_note_length']
     )
     midi_data.write(TMP_PRED_MIDI_PATH)
-    # Evaluate the generated MIDI file
-    evaluation_result = evaluation.evaluate_midi(
-        midi_path_pred=TMP_PRED_MIDI_PATH,
-        midi_path_ground_truth=GT_MIDI_PATH,
+    # Evaluate the predicted notes in memory against the ground truth loaded once
+    evaluation_result = evaluation.evaluate_notes(
+        midi_loading.extract_note_array(midi_data),
+        get_ground_truth_notes(),
         tolerance_note=params['tolerance'],
         overlap_note=params['minimum_overlap']    
     )
@@ -208,6 +236,12 @@ def optimize_model(hyperparameter_search_space=None,
             "minimum_overlap": (0.3, 0.5)
         }
 
+    # Load the model once for all trials
+    midi_gen.warmup_model()
+    # Trials only change the decoding thresholds, keep the activations of RAW_AUDIO_PATH on disk
+    activation_cache.enabled = True
+    get_activation_key()
+
     sampler = TPESampler(seed=42)
     study = optuna.create_study(directions=["maximize", "minimize", "minimize", "minimize", "minimize"],
                                 sampler=sampler, storage="sqlite:///example.db",
@@ -220,6 +254,7 @@ def optimize_model(hyperparameter_search_space=None,
                                               hyperparameter_search_space, experiment_name=experiment_name), n_trials=200)
     print("Best hyperparameters:", study.best_params)
     print("Best F1 score:", study.best_value)
+    print("Inference stats:", midi_gen.get_inference_stats())
     optuna.visualization.plot_pareto_front(study)
 
 
@@ -302,7 +337,7 @@ if __name__ == "__main__":
             onset_threshold=args.onset_threshold,
             frame_threshold=args.frame_threshold,
             minimum_note_length=args.minimum_note_length,
-            model_or_model_path=ICASSP_2022_MODEL_PATH,
+            model_or_model_path=midi_gen.get_model(),
             #midi_tempo = 180
             #melodia_trick=False
         )
@@ -385,7 +420,7 @@ if __name__ == "__main__":
             onset_threshold=hyperparameter['onset_threshold'],
             frame_threshold=hyperparameter['frame_threshold'],
             minimum_note_length=hyperparameter['minimum_note_length'],
-            model_or_model_path=ICASSP_2022_MODEL_PATH
+            model_or_model_path=midi_gen.get_model()
         )
         TMP_PRED_MIDI_PATH = 'output/model_midi/OMORI.mid'
         midi_data.write(TMP_PRED_MIDI_PATH)
@@ -0,0 +1,146 @@
+import os
+import struct
+import hashlib
+import zipfile
+import threading
+from typing import Optional
+
+import numpy as np
+
+from src.utils.note_array import NoteArray, NOTE_FIELDS
+
+# Directory of the cached note arrays, one .npz file per MIDI file content
+NOTE_CACHE_DIR = os.environ.get("NOTE_CACHE_DIR", os.path.join("output", "note_cache"))
+NOTE_CACHE_ENABLED = os.environ.get("NOTE_CACHE_ENABLED", "1") == "1"
+
+# Part of every key, bump it when the note extraction changes so old entries are no longer used
+NOTE_CACHE_VERSION = 1
+
+
+def _memmap_npz(path: str) -> dict[str, np.ndarray]:
+    """
+    Open the arrays of an uncompressed .npz file as read-only memory maps.
+
+    `np.load` ignores `mmap_mode` for .npz files and reads every member. The members
+    written by `np.savez` are stored without compression, so each .npy payload is a
+    contiguous range of the file that can be mapped directly.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            name = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.load(zf.open(info))
+                continue
+            # Local file header: 30 bytes, then the file name and the extra field
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(f"{path} holds object arrays")
+            if not np.prod(shape):
+                # Empty arrays cannot be mapped
+                arrays[name] = np.zeros(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(f, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                     order="F" if fortran_order else "C")
+    return arrays
+
+
+class NoteCache:
+    """
+    On-disk cache of the notes extracted from MIDI files.
+
+    An entry is keyed by a hash of the MIDI file's content and holds the columns of its
+    `NoteArray` as an uncompressed .npz file:
+
+        <root>/<key>.npz
+
+    Entries are read as memory maps, so loading a cached file costs a hash of the
+    MIDI file instead of a full parse with pretty_midi.
+    """
+
+    def __init__(self, root: str = NOTE_CACHE_DIR, enabled: bool = NOTE_CACHE_ENABLED):
+        self.root = root
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+        }
+
+    @staticmethod
+    def make_key(midi_path: str) -> str:
+        """
+        Build the cache key from the content of a MIDI file.
+
+        Returns:
+            str: Hex digest identifying the file content.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"notes-v{NOTE_CACHE_VERSION}".encode("utf-8"))
+        with open(midi_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.npz")
+
+    def load(self, key: str) -> Optional[NoteArray]:
+        """
+        Load the notes stored under `key`.
+
+        Returns:
+            NoteArray | None: Memory-mapped notes, None if there is no usable entry.
+        """
+        path = self._entry_path(key)
+        try:
+            arrays = _memmap_npz(path)
+            notes = NoteArray(*(arrays[field] for field in NOTE_FIELDS), arrays["instrument_names"].tolist())
+        except FileNotFoundError:
+            notes = None
+        except Exception as e:
+            print(f"Ignoring broken note cache entry {path}: {e}")
+            notes = None
+        with self._lock:
+            self._stats['hits' if notes is not None else 'misses'] += 1
+        return notes
+
+    def store(self, key: str, notes: NoteArray):
+        """
+        Store the notes under `key`. The file is written next to its final path and
+        renamed, so concurrent readers never see a partial entry.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    **{field: getattr(notes, field) for field in NOTE_FIELDS},
+                    instrument_names=np.array(notes.instrument_names, dtype=str),
+                )
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not store note cache entry {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self._stats['stores'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, 'enabled': self.enabled, 'root': self.root}
+
+
+# Global instance
+note_cache = NoteCache()
@@ -0,0 +1,187 @@
+import numpy as np
+
+from src.utils.note_array import NoteArray
+
+
+def note_columns(notes) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Get pitch, start and end columns of a note list.
+
+    Args:
+        notes (NoteArray | list[dict]): Notes, as `NoteArray` or dicts with keys 'pitch', 'start' and 'end'.
+
+    Returns:
+        tuple: Pitch (int), start and end (float) arrays. The columns of a `NoteArray` are not copied.
+    """
+    if isinstance(notes, NoteArray):
+        return notes.pitch, notes.start, notes.end
+    return (
+        np.fromiter((note['pitch'] for note in notes), dtype=np.int64, count=len(notes)),
+        np.fromiter((note['start'] for note in notes), dtype=np.float64, count=len(notes)),
+        np.fromiter((note['end'] for note in notes), dtype=np.float64, count=len(notes)),
+    )
+
+
+def candidate_pairs(pred, gt, min_overlap: float = 0.25) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find all pairs of predicted and ground truth notes that may be matched.
+
+    A pair qualifies if both notes have the same pitch and overlap by at least
+    `min_overlap` times the duration of the shorter note. Per pitch, the ground
+    truth onsets are sorted once and the candidates of every predicted note are
+    found with `searchsorted`: only ground truth notes starting between
+    `pred start - longest gt duration` and `pred end` can overlap it.
+
+    Args:
+        pred (tuple): Pitch, start and end arrays of the predicted notes, see `note_columns`.
+        gt (tuple): Pitch, start and end arrays of the ground truth notes.
+        min_overlap (float): Required overlap as a fraction of the shorter note's duration.
+
+    Returns:
+        tuple: Indices into the predicted and the ground truth notes, one entry per pair.
+    """
+    pred_pitch, pred_start, pred_end = pred
+    gt_pitch, gt_start, gt_end = gt
+    pred_indices, gt_indices = [], []
+
+    for pitch in np.intersect1d(pred_pitch, gt_pitch):
+        p = np.flatnonzero(pred_pitch == pitch)
+        g = np.flatnonzero(gt_pitch == pitch)
+        g = g[np.argsort(gt_start[g], kind='stable')]
+        g_start, g_end = gt_start[g], gt_end[g]
+        longest = np.max(g_end - g_start)
+
+        lo = np.searchsorted(g_start, pred_start[p] - longest, side='left')
+        hi = np.searchsorted(g_start, pred_end[p], side='right')
+        counts = np.maximum(hi - lo, 0)
+        if not counts.sum():
+            continue
+        pi = np.repeat(np.arange(len(p)), counts)
+        gi = lo[pi] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        overlap = np.minimum(pred_end[p][pi], g_end[gi]) - np.maximum(pred_start[p][pi], g_start[gi])
+        shorter = np.minimum(pred_end[p][pi] - pred_start[p][pi], g_end[gi] - g_start[gi])
+        keep = overlap >= shorter * min_overlap
+        pred_indices.append(p[pi[keep]])
+        gt_indices.append(g[gi[keep]])
+
+    if not pred_indices:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(pred_indices), np.concatenate(gt_indices)
+
+
+def maximum_matching(n_left: int, n_right: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Maximum one-to-one matching of a bipartite graph (Hopcroft-Karp).
+
+    Args:
+        n_left (int): Number of left vertices.
+        n_right (int): Number of right vertices.
+        left (np.ndarray): Left vertex of every edge.
+        right (np.ndarray): Right vertex of every edge.
+
+    Returns:
+        np.ndarray: Matched right vertex for every left vertex, -1 if unmatched.
+    """
+    order = np.argsort(left, kind='stable')
+    adj = right[order].tolist()
+    indptr = np.searchsorted(left[order], np.arange(n_left + 1)).tolist()
+    match_left = [-1] * n_left
+    match_right = [-1] * n_right
+
+    # Greedy start, most vertices are matched here already
+    for u in range(n_left):
+        for v in adj[indptr[u]:indptr[u + 1]]:
+            if match_right[v] == -1:
+                match_left[u], match_right[v] = v, u
+                break
+
+    while True:
+        # Layer the graph from the free left vertices
+        dist = [-1] * n_left
+        queue = [u for u in range(n_left) if match_left[u] == -1 and indptr[u] < indptr[u + 1]]
+        for u in queue:
+            dist[u] = 0
+        found = False
+        head = 0
+        while head < len(queue):
+            u = queue[head]
+            head += 1
+            for v in adj[indptr[u]:indptr[u + 1]]:
+                w = match_right[v]
+                if w == -1:
+                    found = True
+                elif dist[w] == -1:
+                    dist[w] = dist[u] + 1
+                    queue.append(w)
+        if not found:
+            break
+
+        # Augment along vertex-disjoint paths, iterative DFS to avoid deep recursion
+        pointer = indptr[:-1]
+        for root in range(n_left):
+            if match_left[root] != -1 or dist[root] != 0:
+                continue
+            stack, path = [root], []
+            while stack:
+                u = stack[-1]
+                if pointer[u] == indptr[u + 1]:
+                    dist[u] = -1
+                    stack.pop()
+                    if path:
+                        path.pop()
+                    continue
+                v = adj[pointer[u]]
+                pointer[u] += 1
+                w = match_right[v]
+                if w == -1:
+                    path.append(v)
+                    for x, y in zip(stack, path):
+                        match_left[x], match_right[y] = y, x
+                    break
+                if dist[w] == dist[u] + 1:
+                    stack.append(w)
+                    path.append(v)
+
+    return np.array(match_left, dtype=np.int64)
+
+
+def match_notes(predicted_notes, ground_truth_notes, min_overlap: float = 0.25) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Match predicted to ground truth notes one-to-one, maximizing the number of matches.
+
+    Returns:
+        tuple: Indices of the matched predicted notes and of their ground truth notes.
+    """
+    pred = note_columns(predicted_notes)
+    gt = note_columns(ground_truth_notes)
+    pred_indices, gt_indices = candidate_pairs(pred, gt, min_overlap)
+    matches = maximum_matching(len(pred[0]), len(gt[0]), pred_indices, gt_indices)
+    matched = np.flatnonzero(matches >= 0)
+    return matched, matches[matched]
+
+
+def match_f1(predicted_notes, ground_truth_notes, min_overlap: float = 0.25) -> dict:
+    """
+    F1 score of a one-to-one note matching, see `match_notes`.
+
+    Returns:
+        dict: f1_score, precision, recall, false_negatives, false_positives and true_positives,
+            the same keys as `evaluation.f1_score_with_overlap`.
+    """
+    from src.utils.evaluation import f1_score
+
+    matched, _ = match_notes(predicted_notes, ground_truth_notes, min_overlap)
+    true_positives = len(matched)
+    false_positives = len(predicted_notes) - true_positives
+    false_negatives = len(ground_truth_notes) - true_positives
+    precision = true_positives / len(predicted_notes) if len(predicted_notes) else 0.0
+    recall = true_positives / len(ground_truth_notes) if len(ground_truth_notes) else 0.0
+    return dict(
+        f1_score=f1_score(precision, recall),
+        precision=precision,
+        recall=recall,
+        false_negatives=false_negatives,
+        false_positives=false_positives,
+        true_positives=true_positives
+    )
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional
+
+MSCORE_PATH = os.environ.get("MSCORE_PATH", "/usr/bin/mscore3")
+
+# Number of MuseScore processes running at the same time
+RENDER_CONCURRENCY = int(os.environ.get("RENDER_CONCURRENCY", 2))
+# Scores arriving within RENDER_BATCH_WINDOW seconds share one MuseScore start, up to RENDER_BATCH_SIZE
+RENDER_BATCH_SIZE = int(os.environ.get("RENDER_BATCH_SIZE", 8))
+RENDER_BATCH_WINDOW = float(os.environ.get("RENDER_BATCH_WINDOW", 0.2))
+
+XVFB_SCREEN = "640x480x24"
+
+
+class RenderService:
+    """
+    MusicXML to PDF conversion with MuseScore, without per-score startup cost.
+
+    One Xvfb display is kept alive for the lifetime of the process. Pending
+    scores are collected into MuseScore batch job files (`mscore3 -j`), so
+    concurrent PDF jobs share a single MuseScore start. At most `concurrency`
+    MuseScore processes run at once.
+    """
+
+    def __init__(self, mscore: str = MSCORE_PATH, concurrency: int = RENDER_CONCURRENCY,
+                 batch_size: int = RENDER_BATCH_SIZE, batch_window: float = RENDER_BATCH_WINDOW):
+        self.mscore = mscore
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._slots = threading.Semaphore(concurrency)
+        self._dispatcher = None
+        self._display_lock = threading.Lock()
+        self._xvfb = None
+        self._display = None
+        # Updated by the batch threads under `_condition`
+        self._stats = {
+            'batches': 0,
+            'scores': 0,
+            'failures': 0,
+            'last_batch_seconds': None,
+        }
+
+    # ========================= Display =========================
+
+    def _ensure_display(self) -> Optional[str]:
+        """
+        Start Xvfb on first use, or again if it died.
+
+        Returns:
+            str: The DISPLAY value, None if Xvfb is not installed.
+        """
+        with self._display_lock:
+            if self._xvfb is not None and self._xvfb.poll() is None:
+                return self._display
+            if shutil.which("Xvfb") is None:
+                return None
+
+            # Xvfb picks a free display number and reports it through the pipe
+            read_fd, write_fd = os.pipe()
+            with os.fdopen(read_fd) as pipe:
+                try:
+                    self._xvfb = subprocess.Popen(
+                        ["Xvfb", "-displayfd", str(write_fd), "-screen", "0", XVFB_SCREEN, "-nolisten", "tcp"],
+                        pass_fds=(write_fd,),
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                    )
+                finally:
+                    os.close(write_fd)
+                number = pipe.readline().strip()
+            if not number:
+                raise RuntimeError("Xvfb failed to start")
+            self._display = f":{number}"
+            print(f"Render service: Xvfb running on display {self._display}")
+            return self._display
+
+    def shutdown(self):
+        """Stop the Xvfb display"""
+        with self._display_lock:
+            if self._xvfb is not None and self._xvfb.poll() is None:
+                self._xvfb.terminate()
+                self._xvfb.wait()
+            self._xvfb = None
+
+    # ========================= Rendering =========================
+
+    def render(self, musicxml_path: str, pdf_path: str, timeout: Optional[float] = None):
+        """
+        Convert a MusicXML file to PDF, blocking until it is written.
+
+        Raises:
+            RuntimeError: If MuseScore did not produce `pdf_path`.
+        """
+        future = Future()
+        with self._condition:
+            self._pending.append((os.path.abspath(musicxml_path), os.path.abspath(pdf_path), future))
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name="render-dispatcher", daemon=True)
+                self._dispatcher.start()
+            self._condition.notify()
+        future.result(timeout)
+
+    def _dispatch(self):
+        while True:
+            # While all slots are busy, further scores pile up and join the next batch
+            self._slots.acquire()
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                if len(self._pending) < self.batch_size:
+                    self._condition.wait(self.batch_window)
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            threading.Thread(target=self._run_batch, args=(batch,), daemon=True).start()
+
+    def _command(self, job_path: str, display: Optional[str]) -> list[str]:
+        if display is None:
+            # No persistent display available: fall back to a throwaway X server per batch
+            return ["xvfb-run", "--auto-servernum", f"--server-args=-screen 0 {XVFB_SCREEN}",
+                    self.mscore, "-j", job_path]
+        return [self.mscore, "-j", job_path]
+
+    def _run_batch(self, batch: list):
+        start = time.perf_counter()
+        job_path = None
+        try:
+            display = self._ensure_display()
+            for _, pdf_path, _ in batch:
+                if os.path.exists(pdf_path):
+                    os.remove(pdf_path)
+            with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as job_file:
+                json.dump([{"in": musicxml_path, "out": pdf_path} for musicxml_path, pdf_path, _ in batch], job_file)
+                job_path = job_file.name
+
+            env = dict(os.environ)
+            if display is not None:
+                env["DISPLAY"] = display
+            result = subprocess.run(self._command(job_path, display), env=env, capture_output=True, text=True)
+
+            # A failing score does not abort the batch, so every output is checked on its own
+            failures = 0
+            for musicxml_path, pdf_path, future in batch:
+                if os.path.exists(pdf_path):
+                    future.set_result(pdf_path)
+                else:
+                    failures += 1
+                    future.set_exception(RuntimeError(
+                        f"MuseScore PDF generation failed for {musicxml_path}:\n{result.stderr}"
+                    ))
+            with self._condition:
+                self._stats['batches'] += 1
+                self._stats['scores'] += len(batch)
+                self._stats['failures'] += failures
+                self._stats['last_batch_seconds'] = time.perf_counter() - start
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            if job_path is not None:
+                os.remove(job_path)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Get batch/score/failure counters and the duration of the last batch"""
+        with self._condition:
+            return {**self._stats, 'pending': len(self._pending)}
+
+
+# Global instance
+render_service = RenderService()
+atexit.register(render_service.shutdown)
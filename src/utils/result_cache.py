@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from typing import Optional
+
+import numpy as np
+
+# Local artifact directory and its size limit, least recently used entries are evicted first
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join("output", "result_cache"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1") == "1"
+
+# Sample rate the audio is decoded at before hashing, same as `split.split_audio`
+CACHE_AUDIO_SR = 44100
+
+# Files kept from the score directory: the PDF and the MusicXML the score page routes render from
+SCORE_FILES = ("score.pdf", "score.musicxml")
+
+
+class ResultCache:
+    """
+    Content-addressed cache for pipeline results.
+
+    An entry is keyed by a hash of the decoded audio plus the pipeline parameters
+    and holds the stems, the per-stem MIDI files, `combined.mid` and, if it was
+    requested once, `score.pdf` with its `score.musicxml`:
+
+        <root>/<key>/stems/*.flac
+        <root>/<key>/midi/*.mid
+        <root>/<key>/score/score.pdf
+        <root>/<key>/score/score.musicxml
+        <root>/<key>/meta.json
+    """
+
+    def __init__(self, root: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+        }
+
+    @staticmethod
+    def load_audio(audio_file: str) -> np.ndarray:
+        """
+        Decode an audio file the same way the separation does, so the result can
+        be hashed and then handed on without decoding it a second time.
+        """
+        import librosa
+        audio, _ = librosa.load(audio_file, sr=CACHE_AUDIO_SR, mono=True)
+        return audio
+
+    @staticmethod
+    def make_key(audio, **params) -> str:
+        """
+        Build the cache key from the decoded audio and the pipeline parameters.
+
+        Args:
+            audio (np.ndarray | str): Decoded mono audio, or the path of an audio file whose
+                bytes are hashed without decoding it. The two kinds of keys never match each other.
+            **params: Pipeline parameters, e.g. `nb_stems` and `instrument_params`, and the score
+                `title`, which is part of the cached PDF.
+
+        Returns:
+            str: Hex digest identifying the result.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        if isinstance(audio, (str, os.PathLike)):
+            digest.update(b"file:")
+            with open(audio, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        else:
+            digest.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    @staticmethod
+    def _has_format(entry_dir: str, format: str) -> bool:
+        if not os.path.exists(os.path.join(entry_dir, "midi", "combined.mid")):
+            return False
+        if format in ['pdf', 'both']:
+            return all(os.path.exists(os.path.join(entry_dir, "score", name)) for name in SCORE_FILES)
+        return True
+
+    def restore(self, key: str, format: str, output_path: str) -> bool:
+        """
+        Put the cached artifacts for `key` into `output_path`.
+
+        Args:
+            key (str): Cache key from `make_key`.
+            format (str): Requested output format ('midi', 'pdf' or 'both').
+            output_path (str): Job output directory, gets the `midi/` and `score/` subdirectories.
+
+        Returns:
+            bool: True on a cache hit, False if the job has to run.
+        """
+        entry_dir = self._entry_dir(key)
+        # Linked under the lock, so `store` and `evict` cannot remove the entry halfway through
+        with self._lock:
+            if not self._has_format(entry_dir, format):
+                self._stats['misses'] += 1
+                return False
+            restored = []
+            try:
+                # Mark as recently used
+                os.utime(entry_dir)
+                for subdir in ["midi", "score"]:
+                    src_dir = os.path.join(entry_dir, subdir)
+                    if not os.path.isdir(src_dir):
+                        continue
+                    dst_dir = os.path.join(output_path, subdir)
+                    os.makedirs(dst_dir, exist_ok=True)
+                    for name in os.listdir(src_dir):
+                        _link_or_copy(os.path.join(src_dir, name), os.path.join(dst_dir, name))
+                        restored.append(os.path.join(dst_dir, name))
+            except OSError as e:
+                # E.g. the entry was removed by another process, run the job instead
+                print(f"Result cache restore of {key} failed: {e}")
+                for path in restored:
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._stats['misses'] += 1
+                return False
+            self._stats['hits'] += 1
+        return True
+
+    def store(self, key: str, output_path: str, stems: Optional[dict] = None, stems_sr: Optional[int] = None):
+        """
+        Add the artifacts of a finished job to the cache.
+
+        Args:
+            key (str): Cache key from `make_key`.
+            output_path (str): Job output directory with `midi/` and optionally `score/`.
+            stems (dict): In-memory stems (stem name -> mono audio) to keep as FLAC.
+            stems_sr (int): Sample rate of `stems`.
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        for subdir in ["stems", "midi", "score"]:
+            src_dir = os.path.join(output_path, subdir)
+            if not os.path.isdir(src_dir):
+                continue
+            dst_dir = os.path.join(tmp_dir, subdir)
+            os.makedirs(dst_dir, exist_ok=True)
+            for name in os.listdir(src_dir):
+                if subdir == "score" and name not in SCORE_FILES:
+                    continue
+                _link_or_copy(os.path.join(src_dir, name), os.path.join(dst_dir, name))
+
+        if stems and not os.path.isdir(os.path.join(tmp_dir, "stems")):
+            import soundfile as sf
+            os.makedirs(os.path.join(tmp_dir, "stems"))
+            for stem, audio in stems.items():
+                sf.write(os.path.join(tmp_dir, "stems", f"{stem}.flac"), audio, stems_sr, subtype="PCM_16")
+
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({'key': key, 'created': time.time()}, f)
+
+        with self._lock:
+            # An entry without the PDF is replaced by one that has it
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self._stats['stores'] += 1
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits into `max_bytes`.
+        """
+        with self._lock:
+            if not os.path.isdir(self.root):
+                return
+            entries = []
+            for key in os.listdir(self.root):
+                entry_dir = self._entry_dir(key)
+                if not os.path.isdir(entry_dir) or ".tmp-" in key:
+                    continue
+                entries.append((os.stat(entry_dir).st_mtime, _dir_size(entry_dir), entry_dir))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                self._stats['evictions'] += 1
+
+    def stats(self) -> dict:
+        """Get hit/miss/store/eviction counters."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+def _link_or_copy(src: str, dst: str):
+    """Hard link `src` to `dst`, copy if linking is not possible (e.g. across file systems)."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+# Global instance
+result_cache = ResultCache()
@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+import subprocess
+from typing import Dict, Optional
+
+# Interpreter used for the isolated subprocess fallback (Spleeter needs Python 3.10)
+SPLIT_PYTHON = os.environ.get("SPLIT_PYTHON", "/content/music_venv310/bin/python3.10")
+SPLIT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "split.py")
+
+
+class SeparationService:
+    """
+    Long-lived wrapper around `split.split_audio` / `split.split_and_write`.
+
+    Spleeter, TensorFlow and the model weights are imported and loaded only once
+    per process. One `Separator` is kept warm per `nb_stems` configuration and
+    reused for every job.
+    """
+
+    def __init__(self):
+        self._separators: Dict[int, object] = {}
+        # One lock per separator, a Spleeter graph is not safe to run concurrently
+        self._separator_locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._splt = None
+        self.stats = {
+            'load_seconds': {},
+            'jobs': 0,
+            'last_job_seconds': None,
+        }
+
+    def _split_module(self):
+        """Import the split module (and with it Spleeter/TensorFlow) on first use."""
+        if self._splt is None:
+            from src.utils import split as splt
+            self._splt = splt
+        return self._splt
+
+    def is_available(self) -> bool:
+        """Check whether Spleeter can be imported in the current interpreter."""
+        try:
+            self._split_module()
+            return True
+        except ImportError:
+            return False
+
+    def get_separator(self, nb_stems: int):
+        """
+        Get the warm separator for `nb_stems`, building it on first request.
+
+        Args:
+            nb_stems (int): Number of stems to separate (2, 4, or 5).
+
+        Returns:
+            tuple: The Spleeter separator and the lock guarding it.
+        """
+        with self._lock:
+            if nb_stems not in self._separators:
+                splt = self._split_module()
+                start = time.perf_counter()
+                self._separators[nb_stems] = splt.get_separator(nb_stems)
+                self._separator_locks[nb_stems] = threading.Lock()
+                self.stats['load_seconds'][nb_stems] = time.perf_counter() - start
+            return self._separators[nb_stems], self._separator_locks[nb_stems]
+
+    def warmup(self, nb_stems: Optional[int] = None):
+        """
+        Build the separator and run it once on a short silent buffer, so the
+        model weights are loaded before the first real job arrives.
+        """
+        import numpy as np
+
+        splt = self._split_module()
+        nb_stems = nb_stems or splt.NB_STEMS_DEFAULT
+        separator, lock = self.get_separator(nb_stems)
+        start = time.perf_counter()
+        with lock:
+            separator.separate(np.zeros((44100, 2), dtype=np.float32))
+        self.stats['load_seconds'][nb_stems] += time.perf_counter() - start
+
+    def separate(self, file, nb_stems: Optional[int] = None, **kwargs) -> dict:
+        """
+        Split an audio file into stems with the warm separator.
+
+        Args:
+            file (str): Path to the input audio file.
+            nb_stems (int): Number of stems to separate (2, 4, or 5).
+            **kwargs: Further arguments for `split.split_audio`.
+
+        Returns:
+            dict: Stem name -> mono audio as numpy array.
+        """
+        splt = self._split_module()
+        nb_stems = nb_stems or splt.NB_STEMS_DEFAULT
+        separator, lock = self.get_separator(nb_stems)
+        start = time.perf_counter()
+        # Only the separator run is serialized, decoding and denoising of other jobs go on meanwhile
+        prediction = splt.split_audio(file, nb_stems, separator=separator, lock=lock, **kwargs)
+        self._record_job(start)
+        return prediction
+
+    def separate_and_write(self, input_file: str, output_dir: str, nb_stems: Optional[int] = None, **kwargs):
+        """
+        Split an audio file and write the stems to `output_dir` with the warm separator.
+
+        Args:
+            input_file (str): Path to the input audio file.
+            output_dir (str): Directory for the stem files.
+            nb_stems (int): Number of stems to separate (2, 4, or 5).
+            **kwargs: Further arguments for `split.split_and_write`.
+        """
+        splt = self._split_module()
+        nb_stems = nb_stems or splt.NB_STEMS_DEFAULT
+        separator, lock = self.get_separator(nb_stems)
+        start = time.perf_counter()
+        splt.split_and_write(input_file, output_dir, nb_stems, separator=separator, lock=lock, **kwargs)
+        self._record_job(start)
+
+    def write_stems(self, prediction: dict, output_dir: str, sr: int, stem_format: str = "flac"):
+        """
+        Write in-memory stems to disk as FLAC or PCM16, see `split.write_stems`.
+        """
+        return self._split_module().write_stems(prediction, output_dir, sr, stem_format)
+
+    def _record_job(self, start: float):
+        with self._lock:
+            self.stats['jobs'] += 1
+            self.stats['last_job_seconds'] = time.perf_counter() - start
+
+
+def split_in_subprocess(input_file: str, output_dir: str, remove_drums: bool = True, nb_stems: int = 5,
+                        python: str = SPLIT_PYTHON):
+    """
+    Fallback for isolated environments: run `split.py` in a separate interpreter.
+    """
+    command = [python, SPLIT_SCRIPT, input_file, "--output", output_dir, "--nb_stems", str(nb_stems)]
+    if remove_drums:
+        command.append("--remove_drums")
+    subprocess.run(command, check=True)
+
+
+# Global instance
+separation_service = SeparationService()
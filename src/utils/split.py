@@ -5,6 +5,7 @@ import argparse
 NB_STEMS_DEFAULT = 5
 PROP_DECREASE_DEFAULT = 0.5
 RMS_DEFAULT = 0.005
+STEM_FORMAT_DEFAULT = "flac"
 
 
 if __name__ == "__main__":
@@ -19,6 +20,9 @@ if __name__ == "__main__":
                         help="Noise reduction strength (0 to 1)")
     parser.add_argument("--rms", type=float, default=RMS_DEFAULT, 
                         help="Minimum RMS to keep a stem")
+    parser.add_argument("--stem_format", type=str, default=STEM_FORMAT_DEFAULT,
+                        choices=["flac", "pcm16", "float"],
+                        help="Encoding of the written stem files")
 
     args = parser.parse_args()
 
@@ -35,26 +39,67 @@ from spleeter.separator import Separator
 from pathlib import Path 
 
 
+def get_separator(nb_stems=NB_STEMS_DEFAULT):
+    """
+    Build a Spleeter separator for the given stem configuration.
+
+    Args:
+        nb_stems (int): Number of stems to separate (2, 4, or 5).
+
+    Returns:
+        Separator: A Spleeter separator, the model weights are loaded on first use.
+    """
+    # 2 stems (vocals, accompaniment)
+    # 4 stems (vocals, drums, bass, other)
+    # 5 stems (piano, vocals, drums, bass, other)
+    return Separator(f'spleeter:{nb_stems}stems', multiprocess=False) #Turned off multiprocessing as it causes problem in windows env
+
+
 def split_audio(
         file, 
         nb_stems=NB_STEMS_DEFAULT, 
         prop_decrease=PROP_DECREASE_DEFAULT, 
         rms=RMS_DEFAULT,
+        separator=None,
+        target_sr=None,
+        lock=None,
     ):
+    """
+    Split an audio file into mono instrument stems.
+
+    Args:
+        file (str): Path to the input audio file, or already decoded mono audio at 44.1 kHz.
+        nb_stems (int): Number of stems to separate (2, 4, or 5).
+        prop_decrease (float): Noise reduction strength (0 to 1).
+        rms (float): Minimum RMS to keep a stem.
+        separator (Separator): Warm separator to reuse, a new one is built if None.
+        target_sr (int): Resample the kept stems once to this rate, stays at 44.1 kHz if None.
+        lock (threading.Lock): Held only while `separator` runs, decoding and denoising stay concurrent.
+
+    Returns:
+        dict: Stem name -> mono audio as numpy array.
+    """
     # Load the audio file
-    y_mono, sr = librosa.load(file, sr=44100, mono=True)
+    if isinstance(file, np.ndarray):
+        y_mono, sr = file, 44100
+    else:
+        y_mono, sr = librosa.load(file, sr=44100, mono=True)
 
     # Small noise reduction
     y_denoised = nr.reduce_noise(y=y_mono, sr=sr, prop_decrease=prop_decrease)
 
-    # Convert artificially to stereo for Spleeter
-    y_stereo = np.tile(y_denoised.reshape(-1, 1), (1, 2))
-
-    # 2 stems (vocals, accompaniment)
-    # 4 stems (vocals, drums, bass, other)
-    # 5 stems (piano, vocals, drums, bass, other)
-    separator = Separator(f'spleeter:{nb_stems}stems', multiprocess=False) #Turned off multiprocessing as it causes problem in windows env
-    prediction = separator.separate(y_stereo)
+    # Convert artificially to stereo for Spleeter. Its STFT concatenates the channels into a new
+    # array anyway, so a read-only view is enough here and saves nothing beyond the input copy
+    y_stereo = np.broadcast_to(y_denoised[:, np.newaxis], (len(y_denoised), 2))
+
+    # Reuse a warm separator if the caller provides one
+    if separator is None:
+        separator = get_separator(nb_stems)
+    if lock is None:
+        prediction = separator.separate(y_stereo)
+    else:
+        with lock:
+            prediction = separator.separate(y_stereo)
     
     ### Stems are stored in a dictionary:
     # piano = prediction['piano']
@@ -77,9 +122,46 @@ def split_audio(
     for stem in stems_to_delete:
         del prediction[stem]
 
+    # Resample once to the rate of the transcription model
+    if target_sr is not None and target_sr != sr:
+        for stem in prediction:
+            prediction[stem] = librosa.resample(prediction[stem], orig_sr=sr, target_sr=target_sr)
+
     return prediction
 
 
+def write_stems(prediction: dict, output_dir: str, sr: int = 44100, stem_format: str = STEM_FORMAT_DEFAULT):
+    """
+    Write stems to disk.
+
+    Args:
+        prediction (dict): Stem name -> mono audio as numpy array.
+        output_dir (str): Directory for the stem files.
+        sr (int): Sample rate of the stems.
+        stem_format (str): 'flac' (lossless, compressed), 'pcm16' (16 bit WAV) or 'float' (32 bit float WAV).
+
+    Returns:
+        list[str]: Paths of the written files.
+    """
+    if stem_format == "flac":
+        extension, subtype = "flac", "PCM_16"
+    elif stem_format == "pcm16":
+        extension, subtype = "wav", "PCM_16"
+    elif stem_format == "float":
+        extension, subtype = "wav", "FLOAT"
+    else:
+        raise ValueError(f"Unknown stem format: {stem_format}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_files = []
+    for stem, audio in prediction.items():
+        output_file = os.path.join(output_dir, f"{stem}.{extension}")
+        sf.write(output_file, audio, sr, subtype=subtype)
+        print(f"Saved {stem} stem to {output_file}")
+        output_files.append(output_file)
+    return output_files
+
+
 def split_and_write(
         input_file: str, 
         output_dir: str = "output/",
@@ -87,17 +169,16 @@ def split_and_write(
         prop_decrease: float = PROP_DECREASE_DEFAULT,
         rms: float = RMS_DEFAULT,
         remove_drums: bool = False,
+        separator=None,
+        stem_format: str = STEM_FORMAT_DEFAULT,
+        lock=None,
     ):
-    prediction = split_audio(input_file, nb_stems, prop_decrease, rms)
+    prediction = split_audio(input_file, nb_stems, prop_decrease, rms, separator, lock=lock)
 
     if remove_drums and 'drums' in prediction:
         del prediction['drums']
 
-    os.makedirs(output_dir, exist_ok=True)
-    for stem, audio in prediction.items():
-        output_file = os.path.join(output_dir, f"{stem}.wav")
-        sf.write(output_file, audio, 44100)
-        print(f"Saved {stem} stem to {output_file}")
+    write_stems(prediction, output_dir, 44100, stem_format)
     print("================Audio splitting completed=====================")
 
 
@@ -109,4 +190,5 @@ if __name__ == "__main__":
         args.prop_decrease, 
         args.rms, 
         args.remove_drums,
+        stem_format=args.stem_format,
     )
\ No newline at end of file
@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+from io import BytesIO
+from collections import OrderedDict, deque
+from typing import Optional
+
+# Page layout in Verovio units (tenths of a millimetre at scale 100), A4 portrait
+VEROVIO_OPTIONS = {
+    "pageWidth": 2100,
+    "pageHeight": 2970,
+    "pageMarginTop": 100,
+    "pageMarginBottom": 100,
+    "pageMarginLeft": 100,
+    "pageMarginRight": 100,
+    "scale": 40,
+    "adjustPageHeight": False,
+    "footer": "none",
+}
+
+# Number of loaded scores kept for lazy page rendering
+VEROVIO_MAX_DOCUMENTS = int(os.environ.get("VEROVIO_MAX_DOCUMENTS", 4))
+
+
+class VerovioRenderer:
+    """
+    In-process MusicXML renderer based on Verovio, no X server or external binary needed.
+
+    A loaded score is kept per MusicXML file, so single pages can be rendered on
+    demand (e.g. page 1 for a preview) and the PDF is assembled from the same
+    layout. Verovio, CairoSVG and pypdf are optional dependencies imported on
+    first use.
+    """
+
+    def __init__(self, options: dict = VEROVIO_OPTIONS, max_documents: int = VEROVIO_MAX_DOCUMENTS):
+        self.options = options
+        self.max_documents = max_documents
+        # (path, mtime) -> (toolkit, lock), a Verovio toolkit is not safe to use concurrently
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'load_seconds': deque(maxlen=100),
+            'page_seconds': deque(maxlen=1000),
+            'pdf_seconds': deque(maxlen=100),
+        }
+
+    def is_available(self) -> bool:
+        """Check whether Verovio can be imported"""
+        try:
+            import verovio  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _document(self, musicxml_path: str):
+        key = (os.path.abspath(musicxml_path), os.path.getmtime(musicxml_path))
+        with self._lock:
+            if key in self._documents:
+                self._documents.move_to_end(key)
+                return self._documents[key]
+
+        import verovio
+
+        start = time.perf_counter()
+        toolkit = verovio.toolkit()
+        toolkit.setOptions(self.options)
+        if not toolkit.loadFile(key[0]):
+            raise RuntimeError(f"Verovio could not load {musicxml_path}")
+        self.stats['load_seconds'].append(time.perf_counter() - start)
+
+        with self._lock:
+            self._documents[key] = (toolkit, threading.Lock())
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+            return self._documents[key]
+
+    def page_count(self, musicxml_path: str) -> int:
+        """Number of pages of the laid out score"""
+        toolkit, lock = self._document(musicxml_path)
+        with lock:
+            return toolkit.getPageCount()
+
+    def render_page(self, musicxml_path: str, page: int) -> str:
+        """
+        Render a single page to SVG.
+
+        Args:
+            musicxml_path (str): Path of the MusicXML score.
+            page (int): Page number, starting at 1.
+
+        Returns:
+            str: The SVG document.
+        """
+        toolkit, lock = self._document(musicxml_path)
+        with lock:
+            if not 1 <= page <= toolkit.getPageCount():
+                raise ValueError(f"Page {page} out of range (1-{toolkit.getPageCount()})")
+            start = time.perf_counter()
+            svg = toolkit.renderToSVG(page)
+        self.stats['page_seconds'].append(time.perf_counter() - start)
+        return svg
+
+    def render(self, musicxml_path: str, pdf_path: str):
+        """
+        Render every page and assemble them into one PDF.
+        """
+        import cairosvg
+        from pypdf import PdfReader, PdfWriter
+
+        start = time.perf_counter()
+        writer = PdfWriter()
+        for page in range(1, self.page_count(musicxml_path) + 1):
+            page_pdf = cairosvg.svg2pdf(bytestring=self.render_page(musicxml_path, page).encode("utf-8"))
+            writer.add_page(PdfReader(BytesIO(page_pdf)).pages[0])
+        with open(pdf_path, "wb") as f:
+            writer.write(f)
+        self.stats['pdf_seconds'].append(time.perf_counter() - start)
+
+    def timing_stats(self) -> dict:
+        """Mean cold-start, page and PDF times in seconds"""
+        def mean(values) -> Optional[float]:
+            return sum(values) / len(values) if values else None
+
+        return {
+            'documents_loaded': len(self.stats['load_seconds']),
+            'mean_load_seconds': mean(self.stats['load_seconds']),
+            'pages_rendered': len(self.stats['page_seconds']),
+            'mean_page_seconds': mean(self.stats['page_seconds']),
+            'mean_pdf_seconds': mean(self.stats['pdf_seconds']),
+        }
+
+
+# Global instance
+verovio_renderer = VerovioRenderer()
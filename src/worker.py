@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import socket
+import threading
+import multiprocessing
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.job_queue import get_job_queue, JOB_HEARTBEAT_SECONDS
+from src.progress_tracker import progress_tracker
+
+POLL_SECONDS = 1.0
+
+
+def _heartbeat(job_queue, session_id: str, stop: threading.Event):
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        job_queue.heartbeat(session_id)
+
+
+def run_worker(worker_id: str, warmup: bool = True):
+    """
+    Pull jobs from the persistent queue and run `process_audio` until interrupted.
+
+    Progress is written to the shared SQLite store, where the web tier reads it.
+    """
+    from src.run_model import process_audio, warmup_separation
+    from src.model import midi_generator as midi_gen
+
+    job_queue = get_job_queue()
+    progress_tracker.attach_store(job_queue)
+    if warmup:
+        midi_gen.warmup_model()
+        warmup_separation()
+    print(f"Worker {worker_id} ready, waiting for jobs in {job_queue.db_path}")
+
+    while True:
+        job = job_queue.claim(worker_id)
+        if job is None:
+            time.sleep(POLL_SECONDS)
+            continue
+
+        session_id, payload = job
+        print(f"Worker {worker_id} processing {session_id}")
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat, args=(job_queue, session_id, stop), daemon=True)
+        heartbeat.start()
+        try:
+            process_audio(
+                payload['input_path'],
+                payload['output_dir'],
+                payload['format'],
+                session_id,
+                payload.get('original_filename'),
+            )
+            job_queue.complete(session_id)
+        except Exception as e:
+            progress_tracker.error_session(session_id, str(e))
+            job_queue.fail(session_id, str(e))
+        finally:
+            stop.set()
+            heartbeat.join()
+            # The web tier reads the session from the store from now on
+            progress_tracker.release_session(session_id)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run transcription workers for the persistent job queue.")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes to start")
+    parser.add_argument("--no_warmup", action="store_true", help="Do not load the models before the first job")
+    args = parser.parse_args()
+
+    base_id = f"{socket.gethostname()}-{os.getpid()}"
+    if args.processes == 1:
+        run_worker(base_id, not args.no_warmup)
+    else:
+        # TensorFlow is not fork-safe, so workers are spawned
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(target=run_worker, args=(f"{base_id}-{i}", not args.no_warmup))
+            for i in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
@@ -86,6 +86,13 @@ convertBtn.addEventListener('click', async () => {
             body: formData
         });
 
+        if (response.status === 429) {
+            const retryAfter = response.headers.get('Retry-After');
+            alert(`The server is busy, please try again in ${retryAfter} seconds.`);
+            resetUI();
+            return;
+        }
+
         if (!response.ok) {
             throw new Error('Conversion failed to start');
         }
@@ -115,14 +122,17 @@ youtubeUrlInput.addEventListener('input', () => {
 });
 function listenForProgress(sessionId, format) {
     const eventSource = new EventSource(`/progress/${sessionId}`);
+    // The server only sends changed fields, keep the full state here
+    const data = {};
     
     eventSource.onmessage = function(event) {
         try {
-            const data = JSON.parse(event.data);
+            const update = JSON.parse(event.data);
             
-            if (data.error) {
-                throw new Error(data.error);
+            if (update.error) {
+                throw new Error(update.error);
             }
+            Object.assign(data, update);
             
             // Update progress bar
             const percentage = Math.round((data.progress / data.total) * 100);
@@ -0,0 +1,4 @@
+# Adds the project root to the path
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
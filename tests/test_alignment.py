@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from src.utils.alignment import find_offset, align_notes, cross_correlation
+from src.utils.note_array import NoteArray
+from src.utils.note_matching import note_columns
+
+
+def shifted_notes(seed, offset, n=300):
+    # Ground truth and predictions moved by -offset, with jitter and 10% of the notes dropped
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.uniform(0, n / 8, n))
+    gt = [
+        {'pitch': int(p), 'start': float(s), 'end': float(s + d), 'velocity': 80}
+        for p, s, d in zip(rng.integers(40, 80, n), starts, rng.uniform(0.1, 1.0, n))
+    ]
+    pred = [
+        {**note, 'start': note['start'] - offset + rng.normal(0, 0.01),
+         'end': note['end'] - offset + rng.normal(0, 0.02)}
+        for note in gt if rng.random() > 0.1
+    ]
+    return pred, gt
+
+
+@pytest.mark.parametrize("seed, offset", [(0, 0.73), (1, -1.2), (2, 0.0), (3, 0.05), (4, 1.99)])
+def test_find_offset_recovers_a_known_shift(seed, offset):
+    pred, gt = shifted_notes(seed, offset)
+    found, result = find_offset(pred, gt, max_offset=2.0, step=0.01)
+
+    assert found == pytest.approx(offset, abs=0.02)
+    assert result['f1_score'] > 0.85
+
+
+def test_correlation_peaks_at_the_shift():
+    pred, gt = shifted_notes(0, 0.5)
+    offsets, correlation = cross_correlation(note_columns(pred), note_columns(gt), 2.0, 0.01, 0.05)
+
+    assert offsets[0] == pytest.approx(-2.0) and offsets[-1] == pytest.approx(2.0)
+    assert offsets[int(np.argmax(correlation))] == pytest.approx(0.5, abs=0.03)
+
+
+def test_align_notes_keeps_the_note_type():
+    pred, gt = shifted_notes(0, 0.73)
+    offset, shifted = align_notes(NoteArray.from_dicts(pred), NoteArray.from_dicts(gt))
+
+    assert isinstance(shifted, NoteArray)
+    assert shifted.start == pytest.approx(NoteArray.from_dicts(pred).start + offset)
+    assert isinstance(align_notes(pred, gt)[1], list)
+
+
+def test_find_offset_rejects_a_non_positive_step():
+    pred, gt = shifted_notes(0, 0.0, n=10)
+    with pytest.raises(ValueError):
+        find_offset(pred, gt, step=0)
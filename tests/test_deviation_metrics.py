@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from src.utils import evaluation
+from src.utils.deviation_metrics import deviation_metrics, nearest_onsets
+from src.utils.note_array import NoteArray
+
+
+def random_notes(rng, n, length=20.0):
+    # Onsets on a 50 ms grid, so equally distant ground truth onsets and tie-breaking are covered
+    starts = np.round(rng.uniform(0, length, n) / 0.05) * 0.05
+    return [
+        {'pitch': int(p), 'start': float(s), 'end': float(s + d)}
+        for p, s, d in zip(rng.integers(50, 70, n), starts, rng.uniform(0.1, 1.0, n))
+    ]
+
+
+def loop_metrics(pred, gt):
+    return {
+        "pitch_deviation": evaluation.pitch_deviation(pred, gt),
+        "onset_deviation": evaluation.onset_deviation(pred, gt),
+        "duration_deviation": evaluation.duration_deviation(pred, gt),
+        "density_deviation": evaluation.density_deviation(pred, gt),
+    }
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_same_values_as_the_per_metric_loops(seed):
+    rng = np.random.default_rng(seed)
+    pred = random_notes(rng, int(rng.integers(1, 200)))
+    gt = random_notes(rng, int(rng.integers(1, 200)))
+
+    expected = loop_metrics(pred, gt)
+    assert deviation_metrics(pred, gt) == pytest.approx(expected, nan_ok=True)
+    assert deviation_metrics(NoteArray.from_dicts(pred), NoteArray.from_dicts(gt)) == pytest.approx(expected, nan_ok=True)
+
+
+@pytest.mark.parametrize("pred, gt", [([], [{'pitch': 60, 'start': 0.0, 'end': 1.0}]),
+                                      ([{'pitch': 60, 'start': 0.0, 'end': 1.0}], [])])
+def test_empty_notes_give_nan(pred, gt):
+    assert deviation_metrics(pred, gt) == pytest.approx(loop_metrics(pred, gt), nan_ok=True)
+
+
+def test_nearest_onset_ties_go_to_the_first_note():
+    gt_start = np.array([1.0, 0.0, 1.0, 2.0])
+    pred_start = np.array([0.5, 1.0, 1.5, 3.0])
+    expected = [int(np.argmin(np.abs(gt_start - start))) for start in pred_start]
+    assert nearest_onsets(pred_start, gt_start).tolist() == expected
@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from src.job_queue import PersistentJobQueue, JOB_MAX_ATTEMPTS
+from src.job_scheduler import QueueFullError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return PersistentJobQueue(db_path=str(tmp_path / "jobs.sqlite3"), max_queue=2)
+
+
+def test_claim_takes_oldest_job_once(queue):
+    assert queue.enqueue("a", {"n": 1}) == 1
+    assert queue.enqueue("b", {"n": 2}) == 2
+
+    assert queue.claim("w1") == ("a", {"n": 1})
+    assert queue.claim("w2") == ("b", {"n": 2})
+    assert queue.claim("w3") is None
+    assert queue.stats()["running"] == 2
+
+
+def test_enqueue_rejects_when_full(queue):
+    queue.enqueue("a", {})
+    queue.enqueue("b", {})
+    with pytest.raises(QueueFullError):
+        queue.enqueue("c", {})
+    assert queue.read_progress("c") is None
+
+
+def test_stale_job_is_requeued_then_given_up(queue):
+    queue.enqueue("a", {})
+    for attempt in range(1, JOB_MAX_ATTEMPTS + 1):
+        assert queue.claim("w") is not None
+        # A negative stale time makes every running job stale
+        requeued = queue.requeue_stale(stale_seconds=-1)
+        assert requeued == (1 if attempt < JOB_MAX_ATTEMPTS else 0)
+    assert queue.stats()["error"] == 1
+    assert queue.claim("w") is None
+
+
+def test_given_up_job_fails_its_progress(queue):
+    queue.enqueue("a", {})
+    queue.claim("w")
+    queue.write_progress("a", {'progress': 40, 'total': 100, 'status': 'processing', 'version': 3})
+    for _ in range(JOB_MAX_ATTEMPTS - 1):
+        queue.requeue_stale(stale_seconds=-1)
+        queue.claim("w")
+    assert queue.read_progress("a")['status'] == 'processing'
+
+    queue.requeue_stale(stale_seconds=-1)
+    progress = queue.read_progress("a")
+    assert progress['status'] == 'error'
+    assert progress['current_step'] == 'Error: Worker lost too often'
+    assert progress['progress'] == 40 and progress['version'] == 4
+
+
+def test_queue_position_is_computed_on_read(queue):
+    queue.enqueue("a", {})
+    queue.enqueue("b", {})
+    assert queue.read_progress("b")["queue_position"] == 2
+    queue.claim("w")
+    assert queue.read_progress("b")["queue_position"] == 1
+
+
+def test_expiry_removes_finished_jobs_with_their_progress(queue):
+    queue.enqueue("a", {"output_dir": "out/a"})
+    queue.claim("w")
+    queue.complete("a")
+    queue.write_progress("a", {"status": "completed", "output_dir": "out/a"})
+
+    later = time.time() + 10
+    expired = queue.pop_expired_progress(finished_before=later, unfinished_before=later)
+    assert [data["output_dir"] for data in expired] == ["out/a"]
+    assert queue.read_progress("a") is None
+    assert queue.stats()["done"] == 0
+
+
+def test_expiry_keeps_queued_and_running_jobs(queue):
+    queue.enqueue("running", {})
+    queue.enqueue("queued", {})
+    queue.claim("w")
+
+    later = time.time() + 10
+    assert queue.pop_expired_progress(finished_before=later, unfinished_before=later) == []
+    assert queue.read_progress("queued")["status"] == "queued"
+    assert queue.claim("w2") == ("queued", {})
+
+
+def test_timing_stats_are_read_from_progress(queue):
+    queue.write_progress("done", {'status': 'completed', 'first_result_seconds': 2.0, 'total_seconds': 10.0})
+    queue.write_progress("other", {'status': 'completed', 'first_result_seconds': 4.0, 'total_seconds': 20.0})
+    queue.write_progress("running", {'status': 'processing', 'first_result_seconds': 1.0})
+    assert queue.timing_stats() == {'jobs': 2, 'mean_first_result_seconds': 3.0, 'mean_total_seconds': 15.0}
@@ -0,0 +1,63 @@
+import io
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from src.data.musicxml_writer import write_musicxml, split_duration, MEASURE_TICKS
+
+
+def write(notes, bpm=120.0):
+    f = io.StringIO()
+    write_musicxml(f, [np.asarray(notes, dtype=np.float64).reshape(-1, 4)], ["Piano"], "Test", bpm)
+    # Skip the XML declaration and the DOCTYPE
+    return ET.fromstring(f.getvalue().split("\n", 2)[2])
+
+
+def voice_durations(measure):
+    durations = {}
+    for note in measure.iter("note"):
+        if note.find("chord") is None:
+            voice = note.findtext("voice")
+            durations[voice] = durations.get(voice, 0) + int(note.findtext("duration"))
+    return durations
+
+
+def test_every_voice_fills_its_measures():
+    rng = np.random.default_rng(0)
+    starts = np.sort(rng.uniform(0, 200, 2000))
+    notes = np.column_stack([starts, starts + rng.uniform(0.05, 1.5, 2000),
+                             rng.integers(36, 90, 2000), rng.integers(40, 110, 2000)])
+    measures = list(write(notes).iter("measure"))
+
+    assert len(measures) > 1
+    for measure in measures:
+        assert set(voice_durations(measure).values()) == {MEASURE_TICKS}, measure.get("number")
+
+
+def test_triplets_get_time_modification_and_one_bracket_per_beat():
+    # Three eighth triplets on the first beat at 60 bpm
+    root = write([[0, 1 / 3, 60, 80], [1 / 3, 2 / 3, 62, 80], [2 / 3, 1, 64, 80]], bpm=60)
+    notes = [note for note in root.iter("note") if note.find("pitch") is not None]
+
+    assert [note.findtext("type") for note in notes] == ["eighth"] * 3
+    assert all(note.find("time-modification/actual-notes").text == "3" for note in notes)
+    assert [[t.get("type") for t in note.iter("tuplet")] for note in notes] == [["start"], [], ["stop"]]
+
+
+def test_triplet_durations_do_not_cross_beats():
+    # From the second eighth triplet of a beat to the end of the next beat
+    assert split_duration(20, position=4) == [8, 12]
+    assert split_duration(15) == [12, 3]
+
+
+def test_notes_with_the_same_quantized_start_and_end_form_one_chord():
+    # All three start on the same tick after quantization. C and E also end together and form
+    # a chord although G lies between them in raw start order, G ends later and gets its own voice
+    root = write([[0.0, 0.5, 60, 80], [0.01, 1.0, 67, 80], [0.02, 0.5, 64, 80]])
+    notes = list(root.iter("note"))
+    pitched = [note for note in notes if note.find("pitch") is not None]
+    chords = [note.find("chord") is not None for note in pitched]
+
+    assert [note.findtext("pitch/step") for note in pitched] == ["C", "E", "G"]
+    assert chords == [False, True, False]
+    assert [note.findtext("voice") for note in pitched] == ["1", "1", "2"]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from src.utils.note_array import NoteArray
+from src.utils.note_matching import candidate_pairs, match_notes, match_f1, note_columns
+
+
+def random_notes(rng, n, pitches=3, length=4.0):
+    starts = rng.uniform(0, length, n)
+    return [
+        {'pitch': int(p), 'start': float(s), 'end': float(s + d)}
+        for p, s, d in zip(rng.integers(60, 60 + pitches, n), starts, rng.uniform(0.05, 1.0, n))
+    ]
+
+
+def brute_force_pairs(pred, gt, min_overlap):
+    pairs = set()
+    for i, p in enumerate(pred):
+        for j, g in enumerate(gt):
+            overlap = min(p['end'], g['end']) - max(p['start'], g['start'])
+            shorter = min(p['end'] - p['start'], g['end'] - g['start'])
+            if p['pitch'] == g['pitch'] and overlap >= shorter * min_overlap:
+                pairs.add((i, j))
+    return pairs
+
+
+def brute_force_matching(n_pred, pairs, i=0, used=frozenset()):
+    # Largest one-to-one matching by trying every choice for every predicted note
+    if i == n_pred:
+        return 0
+    best = brute_force_matching(n_pred, pairs, i + 1, used)
+    for j in {j for k, j in pairs if k == i} - used:
+        best = max(best, 1 + brute_force_matching(n_pred, pairs, i + 1, used | {j}))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_match_f1_agrees_with_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    pred = random_notes(rng, int(rng.integers(0, 8)))
+    gt = random_notes(rng, int(rng.integers(0, 8)))
+    pairs = brute_force_pairs(pred, gt, 0.25)
+
+    pred_indices, gt_indices = candidate_pairs(note_columns(pred), note_columns(gt), 0.25)
+    assert set(zip(pred_indices.tolist(), gt_indices.tolist())) == pairs
+
+    matched, matches = match_notes(pred, gt, 0.25)
+    assert len(set(matches.tolist())) == len(matches)
+    assert all((i, j) in pairs for i, j in zip(matched.tolist(), matches.tolist()))
+
+    result = match_f1(pred, gt, 0.25)
+    assert result['true_positives'] == brute_force_matching(len(pred), pairs)
+    assert result['false_positives'] == len(pred) - result['true_positives']
+    assert result['false_negatives'] == len(gt) - result['true_positives']
+
+
+def test_note_array_and_dicts_give_the_same_result():
+    rng = np.random.default_rng(0)
+    pred, gt = random_notes(rng, 200, pitches=5, length=20), random_notes(rng, 200, pitches=5, length=20)
+    assert match_f1(NoteArray.from_dicts(pred), NoteArray.from_dicts(gt)) == match_f1(pred, gt)
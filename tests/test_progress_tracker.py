@@ -0,0 +1,93 @@
+import time
+import threading
+
+import pytest
+
+from src.job_queue import PersistentJobQueue
+from src.progress_tracker import ProgressTracker, SESSION_TTL_SECONDS, SESSION_STALE_SECONDS
+
+
+@pytest.fixture
+def tracker():
+    return ProgressTracker()
+
+
+def make_session(tracker, session_id, output_dir, status):
+    tracker.create_session(session_id)
+    tracker.set_session_info(session_id, output_dir=str(output_dir))
+    output_dir.mkdir()
+    if status == 'completed':
+        tracker.complete_session(session_id)
+    elif status == 'processing':
+        tracker.update_progress(session_id, 50, 'Transcribing')
+
+
+def test_finished_session_expires_after_ttl(tracker, tmp_path):
+    make_session(tracker, "done", tmp_path / "done", 'completed')
+    now = time.time()
+
+    assert tracker.reap_expired(now=now + SESSION_TTL_SECONDS - 1) == 0
+    assert (tmp_path / "done").exists()
+
+    assert tracker.reap_expired(now=now + SESSION_TTL_SECONDS + 1) == 1
+    assert tracker.get_progress("done") is None
+    assert not (tmp_path / "done").exists()
+
+
+def test_unfinished_session_expires_only_when_stale(tracker, tmp_path):
+    make_session(tracker, "busy", tmp_path / "busy", 'processing')
+    now = time.time()
+
+    # Older than the TTL of finished sessions, but not stale yet
+    assert tracker.reap_expired(now=now + SESSION_TTL_SECONDS + 1) == 0
+    assert tracker.reap_expired(now=now + SESSION_STALE_SECONDS + 1) == 1
+    assert not (tmp_path / "busy").exists()
+
+
+def test_pinned_session_never_expires(tracker, tmp_path):
+    make_session(tracker, "queued", tmp_path / "queued", 'processing')
+    tracker.pin_session("queued")
+    later = time.time() + SESSION_STALE_SECONDS + 1
+
+    assert tracker.reap_expired(now=later) == 0
+    assert (tmp_path / "queued").exists()
+
+    tracker.unpin_session("queued")
+    assert tracker.reap_expired(now=later) == 1
+
+
+def test_store_keeps_sessions_of_waiting_jobs(tracker, tmp_path):
+    store = PersistentJobQueue(db_path=str(tmp_path / "jobs.sqlite3"))
+    tracker.attach_store(store)
+    (tmp_path / "waiting").mkdir()
+    store.enqueue("waiting", {"output_dir": str(tmp_path / "waiting")})
+
+    assert tracker.reap_expired(now=time.time() + SESSION_STALE_SECONDS + 1) == 0
+    assert (tmp_path / "waiting").exists()
+    assert store.claim("w") is not None
+
+
+def test_wait_for_change_wakes_up_on_update(tracker):
+    tracker.create_session("s")
+    version = tracker.get_progress("s")['version']
+    threading.Timer(0.05, tracker.update_progress, args=("s", 10, "Step")).start()
+
+    snapshot = tracker.wait_for_change("s", version, timeout=5)
+    assert snapshot['progress'] == 10
+    assert tracker.wait_for_change("s", snapshot['version'], timeout=0.05)['version'] == snapshot['version']
+
+
+def test_timing_stats_of_jobs_in_other_processes(tmp_path):
+    # The worker publishes an artifact and completes, the web tier only shares the store
+    store = PersistentJobQueue(db_path=str(tmp_path / "jobs.sqlite3"))
+    worker, web = ProgressTracker(), ProgressTracker()
+    worker.attach_store(store)
+    web.attach_store(store)
+    (tmp_path / "combined.mid").write_bytes(b"MThd")
+    worker.create_session("s")
+    worker.add_artifact("s", "combined.mid", str(tmp_path / "combined.mid"))
+    worker.complete_session("s")
+
+    stats = web.timing_stats()
+    assert stats['jobs'] == 1
+    assert stats['mean_first_result_seconds'] is not None
@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import numpy as np
+
+from src.utils.result_cache import ResultCache
+
+
+def make_job(output_path):
+    os.makedirs(os.path.join(output_path, "midi"))
+    for name in ["combined.mid", "piano.mid"]:
+        with open(os.path.join(output_path, "midi", name), "wb") as f:
+            f.write(name.encode("utf-8"))
+
+
+def test_restore_links_stored_artifacts(tmp_path):
+    cache = ResultCache(root=str(tmp_path / "cache"))
+    make_job(str(tmp_path / "job"))
+    cache.store("key", str(tmp_path / "job"))
+
+    assert cache.restore("key", "midi", str(tmp_path / "out"))
+    assert sorted(os.listdir(tmp_path / "out" / "midi")) == ["combined.mid", "piano.mid"]
+    assert not cache.restore("key", "pdf", str(tmp_path / "out2"))
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_restore_of_vanishing_entry_is_a_miss(tmp_path, monkeypatch):
+    cache = ResultCache(root=str(tmp_path / "cache"))
+    make_job(str(tmp_path / "job"))
+    cache.store("key", str(tmp_path / "job"))
+
+    # Another process removes the entry after the first file was linked
+    import src.utils.result_cache as rc
+    link = rc._link_or_copy
+
+    def link_then_remove(src, dst):
+        link(src, dst)
+        shutil.rmtree(tmp_path / "cache" / "key")
+    monkeypatch.setattr(rc, "_link_or_copy", link_then_remove)
+
+    assert not cache.restore("key", "midi", str(tmp_path / "out"))
+    assert os.listdir(tmp_path / "out" / "midi") == []
+    assert cache.stats()['hits'] == 0 and cache.stats()['misses'] == 1
+
+
+def test_file_and_audio_keys_differ(tmp_path):
+    path = tmp_path / "song.wav"
+    path.write_bytes(b"RIFF....")
+    file_key = ResultCache.make_key(str(path), nb_stems=5)
+    assert file_key == ResultCache.make_key(str(path), nb_stems=5)
+    assert file_key != ResultCache.make_key(str(path), nb_stems=4)
+    assert file_key != ResultCache.make_key(np.zeros(4), nb_stems=5)
+
+
+def test_pdf_results_restore_the_musicxml_for_the_page_routes(tmp_path):
+    cache = ResultCache(root=str(tmp_path / "cache"))
+    make_job(str(tmp_path / "job"))
+    os.makedirs(tmp_path / "job" / "score")
+    for name in ["score.pdf", "score.musicxml", "score.png"]:
+        (tmp_path / "job" / "score" / name).write_bytes(b"score")
+    cache.store("key", str(tmp_path / "job"))
+
+    assert cache.restore("key", "both", str(tmp_path / "out"))
+    assert sorted(os.listdir(tmp_path / "out" / "score")) == ["score.musicxml", "score.pdf"]
+
+
+def test_the_title_is_part_of_the_key(tmp_path):
+    audio = np.zeros(4)
+    assert ResultCache.make_key(audio, nb_stems=5, title="a") != ResultCache.make_key(audio, nb_stems=5, title="b")
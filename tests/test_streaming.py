@@ -0,0 +1,56 @@
+from src.streaming import merge_chunk_notes
+
+# Chunks of 30 s with 2 s of context on each side
+CHUNK, OVERLAP = 30.0, 2.0
+
+
+def window(k):
+    """(chunk start, chunk end, window end) of chunk k"""
+    return k * CHUNK, (k + 1) * CHUNK, (k + 1) * CHUNK + OVERLAP
+
+
+def run(windows_events):
+    """Feed the events of consecutive windows through the merge, flushing open notes at the end"""
+    emitted, open_notes = [], []
+    for k, events in enumerate(windows_events):
+        finished, open_notes = merge_chunk_notes(open_notes, events, *window(k))
+        emitted += finished
+    return sorted(emitted + open_notes)
+
+
+def test_note_crossing_the_boundary_is_joined():
+    # Sustained from 25 s to 40 s: cut off at the end of the first window,
+    # seen again from the start of the second window
+    notes = run([
+        [(25.0, 32.0, 60, 0.8, None)],
+        [(28.0, 40.0, 60, 0.7, None)],
+    ])
+    assert notes == [(25.0, 40.0, 60, 0.8, None)]
+
+
+def test_note_sustained_over_a_whole_chunk_is_joined():
+    notes = run([
+        [(20.0, 32.0, 48, 0.5, None)],
+        [(28.0, 62.0, 48, 0.5, None)],
+        [(58.0, 70.0, 48, 0.5, None)],
+    ])
+    assert notes == [(20.0, 70.0, 48, 0.5, None)]
+
+
+def test_notes_in_the_overlap_are_emitted_once():
+    notes = run([
+        # 31 s starts in the next chunk, it is only emitted from there
+        [(10.0, 11.0, 60, 0.5, None), (31.0, 31.5, 62, 0.5, None)],
+        [(29.0, 29.5, 64, 0.5, None), (31.0, 31.5, 62, 0.5, None)],
+    ])
+    assert notes == [(10.0, 11.0, 60, 0.5, None), (31.0, 31.5, 62, 0.5, None)]
+
+
+def test_new_onset_after_the_boundary_is_a_new_note():
+    notes = run([
+        [(25.0, 32.0, 60, 0.8, None)],
+        # The cut-off note ended at 30.5, the same pitch is struck again at 31 s
+        [(28.0, 30.5, 60, 0.8, None), (31.0, 33.0, 60, 0.6, None)],
+    ])
+    # Trimmed to the end seen in the second window, so the two notes do not overlap
+    assert notes == [(25.0, 30.5, 60, 0.8, None), (31.0, 33.0, 60, 0.6, None)]